@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from services.telemetry import MetricsMiddleware, metrics_response
+from services.usage_ledger import BudgetExceeded
 # APIルーターのインポート
-from routers import qanda, summary, tasks, framework, directory, environment, projects, taskDetail, taskChat, graphTask, durationTask, deploy
+from routers import qanda, summary, tasks, framework, directory, environment, projects, projectTasks, taskDetail, taskChat, graphTask, durationTask, deploy, llm, usage, jobs, setup
 
 app = FastAPI(
     title="LangChain Server",
@@ -16,14 +19,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # /projects のページングのカーソルをブラウザから読めるようにする
+    expose_headers=["X-Next-Cursor"],
 )
 
+# エンドポイントごとのレイテンシの計測とトレース（/metrics で公開）
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@app.exception_handler(BudgetExceeded)
+async def budget_exceeded(request: Request, exc: BudgetExceeded):
+    """
+    LLM 使用量の上限を超えたプロジェクトのリクエストには 429 を返す。
+    """
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=429, content={"detail": str(exc), "reason": exc.reason}, headers=headers)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus 形式のメトリクス。
+    """
+    return metrics_response()
+
 # APIルーターの登録
 app.include_router(projects.router)
+app.include_router(projectTasks.router, tags=["ProjectTasks"])
 app.include_router(qanda.router, prefix="/api/question", tags=["Q&A"])
 app.include_router(summary.router, prefix="/api/summary", tags=["Summary"])
 app.include_router(tasks.router, prefix="/api/get_object_and_tasks", tags=["Tasks"])
@@ -35,6 +59,10 @@ app.include_router(taskChat.router, prefix="/api/taskChat", tags=["TaskChat"])
 app.include_router(graphTask.router, prefix="/api/graphTask", tags=["GraphTask"])
 app.include_router(durationTask.router, prefix="/api/durationTask", tags=["DurationTask"])
 app.include_router(deploy.router, prefix="/api/deploy", tags=["Deploy"])
+app.include_router(llm.router, prefix="/api/llm", tags=["LLM"])
+app.include_router(usage.router, prefix="/api/usage", tags=["Usage"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
+app.include_router(setup.router, prefix="/api/setup", tags=["Setup"])
 
 # 適宜追加
 
@@ -0,0 +1,304 @@
+"""
+全 API ルートを同時実行で呼び出し、バックエンド自体のオーバーヘッドを測るベンチマーク。
+LLM はネットワークを使わない FakeChatModel（services/fake_llm.py）に差し替え、応答は
+bench/fake_responses.json のルールで決まる。応答時間の分布は --latency で指定する。
+--cassette を指定した場合は、実際のプロバイダで記録したカセット（services/llm_cassette.py）を
+記録時の速度で再生する（LLM_CASSETTE_MODE=record で本番相当の呼び出しを一度記録しておく）。
+アプリはプロセス内で ASGI として呼び出すため、サーバーの起動やネットワークは不要。
+
+ルートごとにスループット、p50/p99 レイテンシ、LLM 呼び出し数、スレッドプールの使用率（最大・平均）、
+メモリ（RSS）の増分を表示する。--json で結果を保存し、--compare で以前の結果と比べて
+p50/p99 が --tolerance を超えて悪化したルートがあれば終了コード 1 を返す。
+
+    $ cd back
+    $ python -m bench.api_bench --concurrency 32 --requests 100 --latency lognormal:0.05,0.5
+    $ python -m bench.api_bench --json before.json
+    $ python -m bench.api_bench --compare before.json --tolerance 0.2
+    $ LLM_CASSETTE_MODE=record LLM_CASSETTE_PATH=bench.jsonl GOOGLE_API_KEY=... python -m bench.api_bench --requests 1 --cassette-record
+    $ python -m bench.api_bench --cassette bench.jsonl
+
+DATABASE_URL が未設定の場合は一時ディレクトリの SQLite を使う（非同期ドライバに aiosqlite が必要）。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from statistics import mean
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TASKS = [
+    {"task_id": 0, "task_name": "ログイン画面の作成", "priority": "Must", "content": "メールアドレスでログインできる画面を作る"},
+    {"task_id": 1, "task_name": "タスク一覧APIの実装", "priority": "Must", "content": "タスクの一覧を返すAPIを作る"},
+    {"task_id": 2, "task_name": "進捗共有機能", "priority": "Should", "content": "チームの進捗を共有する画面を作る"},
+]
+SPECIFICATION = "# 仕様書\n\n## 概要\nハッカソン参加者向けのタスク管理アプリ。\n\n## 機能\n- ログイン\n- タスクの作成・編集\n- 進捗の共有\n"
+DIRECTORY = "project/\n├── frontend/\n└── backend/"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="同時に送るリクエスト数")
+    parser.add_argument("--requests", type=int, default=50, help="ルートごとのリクエスト数")
+    parser.add_argument("--latency", default="fixed:0", help="FakeChatModel の応答時間の分布（FAKE_LLM_LATENCY の形式）")
+    parser.add_argument("--seed", type=int, default=0, help="応答時間の乱数のシード")
+    parser.add_argument("--only", default="", help="実行するルート名（カンマ区切り）。未指定なら全ルート")
+    parser.add_argument("--mixed", action="store_true", help="全ルートを混ぜて同時に送るシナリオも実行する")
+    parser.add_argument("--cassette", help="FakeChatModel の代わりに再生する LLM カセット（JSON Lines）")
+    parser.add_argument("--cassette-record", action="store_true", help="FakeChatModel を使わず、実際のプロバイダを呼んでカセットに記録する")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="カセット再生の速度（1.0 で記録時と同じ応答時間）")
+    parser.add_argument("--keep-cache", action="store_true", help="LLM 応答キャッシュを有効のままにする（既定では無効化する）")
+    parser.add_argument("--json", dest="json_path", help="結果を JSON で保存するパス")
+    parser.add_argument("--compare", help="比較する以前の結果（--json で保存したもの）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="--compare で許容する悪化の割合")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """
+    アプリを import する前に、偽の LLM とベンチマーク用の設定を環境変数で指定する。
+    """
+    if args.cassette:
+        # プロバイダは呼ばないが、チェーンの組み立てにクライアントの生成が必要なためダミーのキーを入れる
+        os.environ["LLM_CASSETTE_MODE"] = "replay"
+        os.environ["LLM_CASSETTE_PATH"] = args.cassette
+        os.environ["LLM_CASSETTE_REPLAY_SPEED"] = str(args.replay_speed)
+        os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    elif not args.cassette_record:
+        os.environ["LLM_DEFAULT_PROVIDER"] = "fake"
+        os.environ.setdefault("FAKE_LLM_RESPONSES", os.path.join(BENCH_DIR, "fake_responses.json"))
+        os.environ["FAKE_LLM_LATENCY"] = args.latency
+        os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    # レート制限で待たされるとバックエンドのオーバーヘッドが測れないため、スケジューラの上限を広げる
+    os.environ.setdefault("LLM_RATE_PER_MIN", "1000000")
+    os.environ.setdefault("LLM_RATE_BURST", "1000000")
+    os.environ.setdefault("LLM_INITIAL_CONCURRENCY", str(max(args.concurrency, 4)))
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(max(args.concurrency * 4, 16)))
+    if not args.keep_cache:
+        os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(prefix="api_bench_"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+
+def scenarios(project_id: str) -> List[Dict]:
+    """
+    app.py に登録された全ルーターのエンドポイントと、そのリクエストボディ。
+    """
+    task_info = [json.dumps(task, ensure_ascii=False) for task in TASKS]
+    return [
+        {"name": "question", "method": "POST", "path": "/api/question/", "json": {"Prompt": "ハッカソンで使うタスク管理アプリ、2日、3人"}},
+        {"name": "summary", "method": "POST", "path": "/api/summary/", "json": {"Answer": [{"Question": "対象は？", "Answer": "学生"}]}},
+        {"name": "summary_stream", "method": "POST", "path": "/api/summary/stream", "json": {"Answer": [{"Question": "対象は？", "Answer": "学生"}]}},
+        {"name": "tasks", "method": "POST", "path": "/api/get_object_and_tasks/", "json": {"specification": SPECIFICATION, "directory": DIRECTORY, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "framework", "method": "POST", "path": "/api/framework/", "json": {"specification": SPECIFICATION}},
+        {"name": "directory", "method": "POST", "path": "/api/directory/", "json": {"specification": SPECIFICATION, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "directory_stream", "method": "POST", "path": "/api/directory/stream", "json": {"specification": SPECIFICATION, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "environment", "method": "POST", "path": "/api/environment/", "json": {"specification": SPECIFICATION, "directory": DIRECTORY, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "taskDetail", "method": "POST", "path": "/api/taskDetail/", "json": {"tasks": [{k: t[k] for k in ("task_name", "priority", "content")} for t in TASKS], "specification": SPECIFICATION, "project_id": project_id}},
+        {"name": "taskDetail_stream", "method": "POST", "path": "/api/taskDetail/stream", "json": {"tasks": [{k: t[k] for k in ("task_name", "priority", "content")} for t in TASKS], "specification": SPECIFICATION, "project_id": project_id}},
+        {"name": "taskChat", "method": "POST", "path": "/api/taskChat/", "json": {"specification": SPECIFICATION, "directory_structure": DIRECTORY, "user_question": "どこから始めればいい？", "framework": "Next/FastAPI", "taskDetail": TASKS[0]["content"], "project_id": project_id}},
+        {"name": "taskChat_session", "method": "POST", "path": "/api/taskChat/", "json": {"specification": SPECIFICATION, "directory_structure": DIRECTORY, "user_question": "どこから始めればいい？", "framework": "Next/FastAPI", "taskDetail": TASKS[0]["content"], "project_id": project_id, "session_key": "bench"}},
+        {"name": "taskChat_stream", "method": "POST", "path": "/api/taskChat/stream", "json": {"specification": SPECIFICATION, "directory_structure": DIRECTORY, "user_question": "どこから始めればいい？", "framework": "Next/FastAPI", "taskDetail": TASKS[0]["content"], "project_id": project_id}},
+        {"name": "graphTask", "method": "POST", "path": "/api/graphTask/", "json": {"task_info": task_info}},
+        {"name": "graphTask_update", "method": "POST", "path": "/api/graphTask/update", "json": {"task_info": task_info, "edges": [{"parent": 0, "child": 1}], "changed_task_ids": [2]}},
+        {"name": "durationTask", "method": "POST", "path": "/api/durationTask/", "json": {"duration": "5", "task_info": task_info, "edges": [{"parent": 0, "child": 1}], "num_people": 2, "estimate_with_llm": True}},
+        {"name": "deploy", "method": "POST", "path": "/api/deploy/", "json": {"specification": SPECIFICATION, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "deploy_stream", "method": "POST", "path": "/api/deploy/stream", "json": {"specification": SPECIFICATION, "framework": "Next/FastAPI", "project_id": project_id}},
+        {"name": "projects_list", "method": "GET", "path": "/projects?limit=50"},
+        {"name": "project_get", "method": "GET", "path": f"/projects/{project_id}"},
+        {"name": "project_get_fields", "method": "GET", "path": f"/projects/{project_id}?fields=idea,duration"},
+        {"name": "project_update", "method": "PUT", "path": f"/projects/{project_id}", "json": {"idea": "タスク管理アプリ（更新）"}},
+        {"name": "project_tasks", "method": "GET", "path": f"/projects/{project_id}/tasks"},
+        {"name": "project_task_patch", "method": "PATCH", "path": f"/projects/{project_id}/tasks/0", "json": {"assignment": "alice"}},
+        {"name": "project_edges", "method": "GET", "path": f"/projects/{project_id}/edges"},
+        {"name": "project_edges_put", "method": "PUT", "path": f"/projects/{project_id}/edges", "json": {"edges": [{"parent": 0, "child": 1}]}},
+        {"name": "project_schedule", "method": "GET", "path": f"/projects/{project_id}/schedule"},
+        {"name": "project_schedule_put", "method": "PUT", "path": f"/projects/{project_id}/schedule", "json": {"durations": [{"task_id": 0, "start": 1, "end": 2}]}},
+        {"name": "chat_session_get", "method": "GET", "path": f"/api/taskChat/sessions/{project_id}/bench"},
+        {"name": "llm_stats", "method": "GET", "path": "/api/llm/stats"},
+    ]
+
+
+def project_body() -> Dict:
+    return {
+        "idea": "タスク管理アプリ",
+        "duration": "5",
+        "num_people": 3,
+        "specification": SPECIFICATION,
+        "selected_framework": "Next/FastAPI",
+        "directory_info": DIRECTORY,
+        "menber_info": ["alice", "bob"],
+        "task_info": [json.dumps(task, ensure_ascii=False) for task in TASKS],
+        "envHanson": "## 環境構築\n`npm install`",
+    }
+
+
+def rss_mb() -> float:
+    """
+    現在の RSS（MB）。/proc が無い環境では最大 RSS で代用する。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        scale = 2**20 if sys.platform == "darwin" else 2**10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def llm_calls() -> int:
+    """
+    FakeChatModel の呼び出し数とカセットの再生数の合計。
+    """
+    from services.llm_registry import llm_registry
+    from services.llm_cassette import llm_cassette
+    return sum(getattr(client, "calls", 0) for client in list(llm_registry._clients.values())) + llm_cassette.hits
+
+
+class ThreadPoolSampler:
+    """
+    anyio のデフォルトスレッドプール（同期エンドポイントや run_in_threadpool が使う）の使用数を定期的に記録する。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: List[int] = []
+        self.total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        import anyio.to_thread
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        self.total = int(limiter.total_tokens)
+        while True:
+            self.samples.append(limiter.borrowed_tokens)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def run_scenario(client, name: str, requests: List[Dict], concurrency: int) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(request: Dict):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(request["method"], request["path"], json=request.get("json"))
+                await response.aread()
+                if response.status_code >= 400:
+                    errors.append(f"{request['name']}: {response.status_code} {response.text[:200]}")
+            except Exception as e:
+                errors.append(f"{request['name']}: {type(e).__name__}: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    calls_before = llm_calls()
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolSampler() as sampler:
+        await asyncio.gather(*(one(request) for request in requests))
+    elapsed = time.perf_counter() - started
+    return {
+        "name": name,
+        "requests": len(requests),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": round(len(requests) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "llm_calls": llm_calls() - calls_before,
+        "threads_max": max(sampler.samples, default=0),
+        "threads_mean": round(mean(sampler.samples), 2) if sampler.samples else 0.0,
+        "threads_total": sampler.total,
+        "rss_delta_mb": round(rss_mb() - rss_before, 2),
+    }
+
+
+def print_table(results: List[Dict]):
+    columns = ["name", "requests", "errors", "throughput_rps", "p50_ms", "p99_ms", "llm_calls", "threads_max", "threads_mean", "rss_delta_mb"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for result in results:
+        print("  ".join(str(result[c]).ljust(widths[c]) for c in columns))
+    for result in results:
+        if result["first_error"]:
+            print(f"[error] {result['first_error']}")
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    以前の結果と比べ、p50/p99 が tolerance を超えて悪化したルートを返す。
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{result['name']} {metric}: {before[metric]} -> {result[metric]}")
+    return regressions
+
+
+async def main(args) -> int:
+    import httpx
+    from app import app
+    from create_tables import init_db
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        created = await client.post("/projects", json=project_body())
+        created.raise_for_status()
+        project_id = created.json()["project_id"]
+
+        selected = [s for s in scenarios(project_id) if not args.only or s["name"] in args.only.split(",")]
+        results = []
+        for scenario in selected:
+            # 1回目はチェーンの組み立てやクライアント生成を含むため、計測から外す
+            await client.request(scenario["method"], scenario["path"], json=scenario.get("json"))
+            results.append(await run_scenario(client, scenario["name"], [scenario] * args.requests, args.concurrency))
+        if args.mixed:
+            mixed = [selected[i % len(selected)] for i in range(args.requests * len(selected))]
+            results.append(await run_scenario(client, "mixed", mixed, args.concurrency))
+
+    source = f"cassette={args.cassette}" if args.cassette else f"latency={args.latency}"
+    print(f"concurrency={args.concurrency} requests={args.requests} {source} database={os.environ['DATABASE_URL']}")
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    status = 1 if any(r["errors"] for r in results) else 0
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"[regression] {line}")
+        status = status or (1 if regressions else 0)
+    return status
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_environment(arguments)
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,72 @@
+"""
+プロンプト・パーサ・チェーンの組み立てコストを測るマイクロベンチマーク。
+各サービスについて、毎回組み立てる場合（@compiled を外した元の処理）と
+prompt_registry から再利用する場合の1回あたりの時間を比較する。LLM は呼び出さない。
+
+    $ cd back
+    $ python -m bench.prompt_registry_bench --iterations 200
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# クライアント生成に API キーが必要なため、未設定ならダミーを入れる（通信は行わない）
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+from services.deploy_service import DeployService
+from services.directory_service import DirectoryService
+from services.durationTask_service import DurationTaskService
+from services.environment_service import EnvironmentService
+from services.framework_service import FrameworkService
+from services.graphTask_service import GraphTaskService
+from services.question_service import QuestionService
+from services.summary_service import SummaryService
+from services.taskChat_service import taskChatService
+from services.taskDetail_service import TaskDetailService
+from services.tasks_service import TasksService
+
+TARGETS = [
+    (DeployService, "_deploy_chain"),
+    (DirectoryService, "_directory_chain"),
+    (DurationTaskService, "_efforts_chain"),
+    (EnvironmentService, "_hands_on_chain"),
+    (FrameworkService, "_framework_chain"),
+    (GraphTaskService, "_graph_chain"),
+    (QuestionService, "_question_chain"),
+    (SummaryService, "_summary_chain"),
+    (taskChatService, "_chat_chain"),
+    (TaskDetailService, "_detail_chain"),
+    (TasksService, "_tasks_chain"),
+]
+
+
+def _per_call_us(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'service':<36}{'rebuild (us)':>14}{'registry (us)':>15}{'speedup':>10}")
+    total_rebuild = total_cached = 0.0
+    for service_class, name in TARGETS:
+        # リクエストごとにサービスを生成する実際の使い方に合わせる
+        build = getattr(service_class, name).__wrapped__
+        rebuild = _per_call_us(lambda: build(service_class()), args.iterations)
+        getattr(service_class(), name)()  # 初回の組み立ては計測に含めない
+        cached = _per_call_us(lambda: getattr(service_class(), name)(), args.iterations)
+        total_rebuild += rebuild
+        total_cached += cached
+        print(f"{service_class.__name__ + '.' + name:<36}{rebuild:>14.1f}{cached:>15.2f}{rebuild / cached:>9.0f}x")
+    print(f"{'total':<36}{total_rebuild:>14.1f}{total_cached:>15.2f}{total_rebuild / total_cached:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 from database import engine, Base
 from models.project import Project
+from models.task import Task, TaskEdge, TaskSchedule
+from models.llm_cache import LLMCacheEntry
+from models.chat import ChatSession, ChatTurn
+from models.chunk import ProjectChunk
+from models.usage import LLMUsage
+from models.job import Job
 
 def reset_db():
     # 既存のテーブルをすべて削除
@@ -1,5 +1,9 @@
 import os
+import ssl
+from typing import Tuple
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -9,11 +13,97 @@ load_dotenv("/workspaces/hackson_support_agent/back/.env.local")
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# コネクションプールの設定
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
+# 切断済みの接続を使わないよう、貸し出し前に疎通確認する
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# DB 側のアイドルタイムアウトより短い間隔で接続を作り直す
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+
+
+def _pool_options(url: str) -> dict:
+    """
+    エンジンに渡すプール設定。SQLite はプールの種類が異なるため pre_ping のみ指定する。
+    """
+    if url.startswith("sqlite"):
+        return {"pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SEC,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE_SEC,
+    }
+
+
+def _async_url(url: str) -> str:
+    """
+    同期用の DATABASE_URL から非同期ドライバの URL を作る（postgresql → asyncpg, sqlite → aiosqlite）。
+    """
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+def _async_connect_args(url: str) -> Tuple[str, dict]:
+    """
+    asyncpg は libpq の sslmode / sslrootcert を URL のパラメータとして受け付けないため、
+    URL から取り除いて connect_args の ssl に変換する（psycopg2 用の DATABASE_URL をそのまま使えるようにする）。
+    """
+    parsed = make_url(url)
+    if parsed.drivername != "postgresql+asyncpg":
+        return url, {}
+    query = dict(parsed.query)
+    sslmode = query.pop("sslmode", None)
+    sslrootcert = query.pop("sslrootcert", None)
+    if sslmode is None and sslrootcert is None:
+        return url, {}
+    url = parsed.set(query=query).render_as_string(hide_password=False)
+    if sslmode in ("verify-ca", "verify-full") and sslrootcert:
+        context = ssl.create_default_context(cafile=sslrootcert)
+        context.check_hostname = sslmode == "verify-full"
+        return url, {"ssl": context}
+    if sslmode == "disable":
+        return url, {"ssl": False}
+    # allow / prefer / require / verify-ca / verify-full は asyncpg が同じ名前で受け付ける
+    return url, ({"ssl": sslmode} if sslmode else {})
+
+
+# 非同期ドライバの URL（ASYNC_DATABASE_URL で明示的に指定することもできる）
+ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS = _async_connect_args(os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL))
+
 # エンジンの作成
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(DATABASE_URL, echo=False, **_pool_options(DATABASE_URL))
+
+# 非同期エンジンの作成（スレッドプールを使わずに CRUD を処理する）
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, echo=False, connect_args=ASYNC_CONNECT_ARGS, **_pool_options(ASYNC_DATABASE_URL)
+)
 
 # セッション作成用のファクトリ
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期セッション作成用のファクトリ（commit 後も属性を参照できるよう expire しない）
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # SQLAlchemy のベースクラス（モデル定義で継承する）
 Base = declarative_base()
+
+# DBセッション取得用 dependency
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# 非同期DBセッション取得用 dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,50 @@
+import time
+from sqlalchemy import Column, String, Integer, Text, Float, ForeignKey, Index
+from database import Base
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+
+    # セッションID（自動採番）
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # 所属プロジェクト
+    project_id = Column(String, ForeignKey("projects.project_id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # プロジェクト内のチャットの識別子（"task-3", "envHanson", "directory" など）
+    session_key = Column(String, nullable=False)
+
+    # 要約済みの古い会話の要約
+    summary = Column(Text, nullable=False, default="")
+
+    # 要約に含めた最後の発言ID（これより後の発言はそのまま保持している）
+    summarized_until = Column(Integer, nullable=False, default=0)
+
+    # 最終更新（UNIX時刻）
+    updated_at = Column(Float, nullable=False, default=time.time)
+
+    __table_args__ = (
+        Index("ix_chat_sessions_project_key", "project_id", "session_key", unique=True),
+    )
+
+
+class ChatTurn(Base):
+    __tablename__ = "chat_turns"
+
+    # 発言ID（自動採番。セッション内の順序にも使う）
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # 所属セッション
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # 発言者（"user" または "assistant"）
+    role = Column(String, nullable=False)
+
+    # 発言内容
+    content = Column(Text, nullable=False)
+
+    # 作成日時（UNIX時刻）
+    created_at = Column(Float, nullable=False, default=time.time)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "role": self.role, "content": self.content}
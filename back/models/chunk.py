@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, Integer, Text, Float, ForeignKey
+from database import Base
+
+class ProjectChunk(Base):
+    __tablename__ = "project_chunks"
+
+    # 行ID（自動採番）
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # 所属プロジェクト
+    project_id = Column(String, ForeignKey("projects.project_id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # 出典（"specification", "directory", "task:3" など）
+    source = Column(String, nullable=False)
+
+    # 出典内での順番
+    position = Column(Integer, nullable=False)
+
+    # 見出し（タスク名など）
+    title = Column(String, nullable=True)
+
+    # チャンク本文
+    text = Column(Text, nullable=False)
+
+    # チャンクを作成した時刻（UNIX時刻）。プロジェクト内の最大値がインデックスの版になる（1タスクだけ作り直した場合はそのチャンクだけが新しい値を持つ）
+    built_at = Column(Float, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {"source": self.source, "position": self.position, "title": self.title, "text": self.text}
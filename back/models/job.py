@@ -0,0 +1,50 @@
+import time
+from sqlalchemy import Column, String, Text, Float, JSON
+from database import Base
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    # ジョブID（UUID）
+    job_id = Column(String, primary_key=True)
+
+    # ジョブの種類（"taskDetail", "summary", "tasks"）
+    kind = Column(String, nullable=False)
+
+    # 結果を保存するプロジェクト（省略可）
+    project_id = Column(String, nullable=True, index=True)
+
+    # 状態（"queued", "running", "succeeded", "failed"）
+    status = Column(String, nullable=False, default="queued", index=True)
+
+    # リクエストの内容
+    payload = Column(JSON, nullable=False)
+
+    # 進捗（{"completed": 3, "total": 10} など）
+    progress = Column(JSON, nullable=True)
+
+    # 生成結果（成功時）
+    result = Column(JSON, nullable=True)
+
+    # エラー内容（失敗時）
+    error = Column(Text, nullable=True)
+
+    # 作成・開始・終了・最終更新の時刻（UNIX時刻）
+    created_at = Column(Float, nullable=False, default=time.time)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True, index=True)
+    updated_at = Column(Float, nullable=False, default=time.time)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "project_id": self.project_id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
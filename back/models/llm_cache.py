@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, Text, Float
+from database import Base
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    # キャッシュキー（モデル名・プロンプト・パラメータのハッシュ）
+    key = Column(String(64), primary_key=True)
+
+    # LLM の応答本文
+    value = Column(Text, nullable=False)
+
+    # 有効期限（UNIX時刻、None なら無期限）
+    expires_at = Column(Float, nullable=True, index=True)
+
+    # 保存時刻（UNIX時刻）。行数の上限を超えたときに古いものから削除する
+    created_at = Column(Float, nullable=True, index=True)
@@ -1,7 +1,10 @@
 import uuid
 from sqlalchemy import Column, String, Integer, Text, JSON
+from sqlalchemy.orm import deferred
 from database import Base
 
+# 大きなテキスト・JSON 列は deferred にし、実際に参照したときだけ読み込む
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -18,19 +21,19 @@ class Project(Base):
     num_people = Column(Integer, nullable=False)
     
     # 仕様書（長い文字列）
-    specification = Column(Text, nullable=False)
+    specification = deferred(Column(Text, nullable=False))
     
     # 選択フレームワーク（文字列）
     selected_framework = Column(String, nullable=False)
     
     # ディレクトリ情報（長い文字列）
-    directory_info = Column(Text, nullable=False)
+    directory_info = deferred(Column(Text, nullable=False))
     
     # メンバー情報（JSON型：メンバーのリストを保存）
-    menber_info = Column(JSON, nullable=True)
+    menber_info = deferred(Column(JSON, nullable=True))
     
     # タスク情報（JSON型：タスクのリストを保存）
-    task_info = Column(JSON, nullable=True)
+    task_info = deferred(Column(JSON, nullable=True))
     
     # 環境構築ハンズオン
-    envHanson = Column(Text, nullable=True)
+    envHanson = deferred(Column(Text, nullable=True))
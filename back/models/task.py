@@ -0,0 +1,70 @@
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, Index
+from database import Base
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    # 行ID（自動採番）
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # 所属プロジェクト
+    project_id = Column(String, ForeignKey("projects.project_id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # プロジェクト内のタスクID（task_info の task_id と同じ値）
+    task_id = Column(Integer, nullable=False)
+
+    # タスク名
+    task_name = Column(String, nullable=False)
+
+    # 優先度（Must, Should, Could）
+    priority = Column(String, nullable=True)
+
+    # タスクの簡単な内容
+    content = Column(Text, nullable=True)
+
+    # タスク詳細（Markdown）
+    detail = Column(Text, nullable=True)
+
+    # 担当者（"", "done" または参加者名）
+    assignment = Column(String, nullable=True, default="")
+
+    __table_args__ = (
+        Index("ix_tasks_project_task", "project_id", "task_id", unique=True),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "task_name": self.task_name,
+            "priority": self.priority,
+            "content": self.content,
+            "detail": self.detail,
+            "assignment": self.assignment or "",
+        }
+
+
+class TaskEdge(Base):
+    __tablename__ = "task_edges"
+
+    # 所属プロジェクト
+    project_id = Column(String, ForeignKey("projects.project_id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    # 依存元タスク
+    parent = Column(Integer, primary_key=True)
+
+    # 依存先タスク
+    child = Column(Integer, primary_key=True)
+
+
+class TaskSchedule(Base):
+    __tablename__ = "task_schedule"
+
+    # 所属プロジェクト
+    project_id = Column(String, ForeignKey("projects.project_id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    # タスクID
+    task_id = Column(Integer, primary_key=True)
+
+    # 開始日・終了日（1始まりの日数）
+    start = Column(Integer, nullable=False)
+    end = Column(Integer, nullable=False)
@@ -0,0 +1,38 @@
+from sqlalchemy import Column, String, Integer, Float, Index
+from database import Base
+
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    # 行ID（自動採番）
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # 呼び出し元のプロジェクト（プロジェクトに紐づかない呼び出しは空文字）
+    project_id = Column(String, nullable=False, default="", index=True)
+
+    # 呼び出し元のエンドポイント（"POST /api/get_object_and_tasks/" など。リクエスト外の呼び出しは空文字）
+    endpoint = Column(String, nullable=False, default="")
+
+    # 呼び出したサービスのクラス名
+    service = Column(String, nullable=False)
+
+    # 呼び出したモデル
+    model = Column(String, nullable=False)
+
+    # 集計日（UTC、"YYYY-MM-DD"）
+    day = Column(String(10), nullable=False)
+
+    # 呼び出し回数
+    calls = Column(Integer, nullable=False, default=0)
+
+    # 入力・出力トークン数
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+
+    # 推定コスト（USD）
+    cost_usd = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        Index("ix_llm_usage_bucket", "project_id", "endpoint", "service", "model", "day", unique=True),
+    )
+
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, responses
+from typing import Optional
 from pydantic import BaseModel
 from services.deploy_service import DeployService
+from services.streaming import sse_response
+from services.request_context import project_scope, scoped_stream
+from services.usage_ledger import usage_ledger
 
 router = APIRouter()
 
@@ -8,13 +12,27 @@ router = APIRouter()
 class DeployRequest(BaseModel):
     framework: str      # 使用するフレームワーク情報
     specification: str  # 編集後の仕様書のテキスト
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキーに使う。省略可）
     
 @router.post("/")
-def create_directory_structure(request: DeployRequest):
+async def create_directory_structure(request: DeployRequest):
     """
     仕様書とフレームワーク情報を受け取り、プロジェクトに適応したディレクトリ構成を
     テキスト（コードブロック形式）で返すAPI
     """
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
     service = DeployService()
-    deploy_structure = service.generate_deploy_service(request.specification, request.framework)
-    return responses.JSONResponse(content=deploy_structure, media_type="application/json")
\ No newline at end of file
+    with project_scope(request.project_id):
+        deploy_structure = await service.agenerate_deploy_service(request.specification, request.framework)
+    return responses.JSONResponse(content=deploy_structure, media_type="application/json")
+
+
+@router.post("/stream")
+async def stream_deploy_service(request: DeployRequest):
+    """
+    create_directory_structure のストリーミング版。デプロイ提案の Markdown をトークンごとに Server-Sent Events で返す。
+    """
+    await usage_ledger.precheck(request.project_id)
+    service = DeployService()
+    return sse_response(scoped_stream(request.project_id, service.astream_deploy_service(request.specification, request.framework)))
@@ -1,6 +1,11 @@
 from fastapi import APIRouter, responses
+from typing import Optional
 from pydantic import BaseModel
 from services.directory_service import DirectoryService
+from services.streaming import sse_response
+from services.request_context import project_scope, scoped_stream
+from services.usage_ledger import usage_ledger
+from services.single_flight import single_flight
 
 router = APIRouter()
 
@@ -8,13 +13,33 @@ router = APIRouter()
 class DirectoryRequest(BaseModel):
     framework: str      # 使用するフレームワーク情報
     specification: str  # 編集後の仕様書のテキスト
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキーに使う。省略可）
     
 @router.post("/")
-def create_directory_structure(request: DirectoryRequest):
+async def create_directory_structure(request: DirectoryRequest):
     """
     仕様書とフレームワーク情報を受け取り、プロジェクトに適応したディレクトリ構成を
     テキスト（コードブロック形式）で返すAPI
+    同じ内容のリクエストが処理中の場合は、その結果を共有する。
     """
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
     service = DirectoryService()
-    directory_structure = service.generate_directory_structure(request.specification, request.framework)
+    with project_scope(request.project_id):
+        directory_structure = await single_flight.run(
+            "directory", request.model_dump(),
+            lambda: service.agenerate_directory_structure(framework=request.framework, specification=request.specification),
+        )
     return responses.JSONResponse(content={"directory_structure": directory_structure}, media_type="application/json")
+
+@router.post("/stream")
+async def stream_directory_structure(request: DirectoryRequest):
+    """
+    create_directory_structure のストリーミング版。ディレクトリ構成をトークンごとに Server-Sent Events で返す。
+    """
+    await usage_ledger.precheck(request.project_id)
+    service = DirectoryService()
+    return sse_response(scoped_stream(
+        request.project_id,
+        service.astream_directory_structure(framework=request.framework, specification=request.specification),
+    ))
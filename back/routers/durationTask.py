@@ -1,6 +1,8 @@
 from fastapi import APIRouter, responses, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Dict, Optional, Union
+from database import AsyncSessionLocal
+from routers.projectTasks import load_project_edges
 from services.durationTask_service import DurationTaskService
 import json
 
@@ -8,13 +10,19 @@ router = APIRouter()
 
 class DurationTaskRequest(BaseModel):
     duration: str
-    task_info: List[str]
+    task_info: List[Union[str, Dict]]
+    edges: Optional[List[Dict]] = None   # タスク間の依存関係（/api/graphTask の出力）
+    num_people: int = 1                  # 並行して作業できる人数
+    estimate_with_llm: bool = False      # 作業量の見積もりに LLM を使うか
+    project_id: Optional[str] = None     # edges を省略した場合は、このプロジェクトに保存済みの依存関係を使う
 
 @router.post("/")
-def generate_task_durations(request: DurationTaskRequest):
+async def generate_task_durations(request: DurationTaskRequest):
     """
     DBに保存されている形式のタスク情報 (task_info) と全体のプロジェクト期間 (duration) を入力として受け取り、
     各タスクの作業期間（開始日、終了日）を算出して返すAPI。
+    edges と num_people を渡すと、依存関係と人数を考慮したスケジュールをローカルで算出する。
+    edges を省略して project_id を渡した場合は、プロジェクトに保存済みの依存関係 (PUT /projects/{id}/edges) を使う。
 
     DB保存形式の例:
     {
@@ -38,21 +46,37 @@ def generate_task_durations(request: DurationTaskRequest):
     """
     parsed_tasks = []
     for task_str in request.task_info:
-        try:
-            task_obj = json.loads(task_str)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail=f"無効なJSON文字列: {task_str}")
+        # tasks テーブルから取得した dict はそのまま使い、JSON 文字列のみデコードする
+        if isinstance(task_str, dict):
+            task_obj = task_str
+        else:
+            try:
+                task_obj = json.loads(task_str)
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail=f"無効なJSON文字列: {task_str}")
 
         # 必要なフィールドのみ抽出
         try:
             parsed_task = {
                 "task_id": task_obj["task_id"],
                 "task_name": task_obj["task_name"],
-                "content": task_obj["content"]
+                "content": task_obj["content"],
+                "priority": task_obj.get("priority")
             }
         except KeyError as e:
             raise HTTPException(status_code=400, detail=f"必要なキーが存在しません: {str(e)}")
         parsed_tasks.append(parsed_task)
 
-    durations = DurationTaskService().generate_task_durations(request.duration, parsed_tasks)
+    edges = request.edges
+    if edges is None and request.project_id:
+        async with AsyncSessionLocal() as db:
+            edges = await db.run_sync(load_project_edges, request.project_id) or None
+
+    durations = await DurationTaskService().agenerate_task_durations(
+        request.duration,
+        parsed_tasks,
+        edges=edges,
+        num_people=request.num_people,
+        estimate_with_llm=request.estimate_with_llm,
+    )
     return responses.JSONResponse(content={"durations": durations}, media_type="application/json")
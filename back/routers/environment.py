@@ -1,6 +1,10 @@
 from fastapi import APIRouter, responses
+from typing import Optional
 from pydantic import BaseModel
 from services.environment_service import EnvironmentService
+from services.request_context import project_scope
+from services.usage_ledger import usage_ledger
+from services.single_flight import single_flight
 
 router = APIRouter()
 
@@ -8,9 +12,10 @@ class EnvironmentRequest(BaseModel):
     specification: str
     directory: str
     framework: str
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキーに使う。省略可）
 
 @router.post("/")
-def generate_environment_hands_on(request: EnvironmentRequest):
+async def generate_environment_hands_on(request: EnvironmentRequest):
     """
     仕様書、ディレクトリ構成、フレームワーク情報を受け取り、環境構築ハンズオンの説明を生成するAPI。
     出力は以下の4つのMarkdown文字列を含むJSON:
@@ -18,7 +23,14 @@ def generate_environment_hands_on(request: EnvironmentRequest):
       - devcontainer: .devcontainer の使い方と具体的な設定内容
       - frontend: フロントエンドの初期環境構築手順
       - backend: バックエンドの初期環境構築手順
+    同じ内容のリクエストが処理中の場合は、その結果を共有する。
     """
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
     service = EnvironmentService()
-    result = service.generate_hands_on(request.specification, request.directory, request.framework)
+    with project_scope(request.project_id):
+        result = await single_flight.run(
+            "environment", request.model_dump(),
+            lambda: service.agenerate_hands_on(request.specification, request.directory, request.framework),
+        )
     return responses.JSONResponse(content=result, media_type="application/json")
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, responses
 from pydantic import BaseModel
 from services.framework_service import FrameworkService
+from services.single_flight import single_flight
 
 router = APIRouter()
 
@@ -13,10 +14,14 @@ class Document(BaseModel):
 framework_service = FrameworkService()
 
 @router.post("/")
-def generate_framework_priority(document: Document):
+async def generate_framework_priority(document: Document):
     """
     仕様書のテキストを受け取り、固定のフロントエンドおよびバックエンド候補の
     優先順位と理由を JSON 形式で返すAPI。
+    同じ仕様書のリクエストが処理中の場合は、その結果を共有する。
     """
-    result = framework_service.generate_framework_priority(document.specification)
+    result = await single_flight.run(
+        "framework", document.model_dump(),
+        lambda: framework_service.agenerate_framework_priority(document.specification),
+    )
     return responses.JSONResponse(content=result, media_type="application/json")
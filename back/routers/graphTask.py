@@ -1,16 +1,22 @@
 from fastapi import APIRouter, responses, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Dict, Union
 from services.graphTask_service import GraphTaskService
 import json
 
 router = APIRouter()
 
 class GraphTaskRequest(BaseModel):
-    task_info: List[str]
+    task_info: List[Union[str, Dict]]
+
+class GraphTaskUpdateRequest(BaseModel):
+    task_info: List[Union[str, Dict]] # 更新後の全タスク（DB保存形式または dict）
+    edges: List[Dict]                 # 現在の依存関係
+    changed_task_ids: List[int] = []  # 追加・内容変更されたタスク
+    removed_task_ids: List[int] = []  # 削除されたタスク
 
 @router.post("/")
-def generate_task_graph(request: GraphTaskRequest):
+async def generate_task_graph(request: GraphTaskRequest):
     """
     DBに保存されている形式のタスク情報 (task_info) を入力として受け取り、
     各文字列から task_id, task_name, content を抽出し、タスク間の依存関係を返すAPI。
@@ -35,12 +41,39 @@ def generate_task_graph(request: GraphTaskRequest):
       ]
     }
     """
+    parsed_tasks = _parse_task_info(request.task_info)
+    edges = await GraphTaskService().agenerate_task_graph(parsed_tasks)
+    return responses.JSONResponse(content={"edges": edges}, media_type="application/json")
+
+@router.post("/update")
+async def update_task_graph(request: GraphTaskUpdateRequest):
+    """
+    既存の依存関係 (edges) を元に、追加・変更・削除されたタスクの周辺だけを再推論して
+    更新後のエッジ一覧を返すAPI。全タスクを LLM に送り直す必要はない。
+    """
+    parsed_tasks = _parse_task_info(request.task_info)
+    edges = await GraphTaskService().aupdate_task_graph(
+        parsed_tasks,
+        request.edges,
+        changed_task_ids=request.changed_task_ids,
+        removed_task_ids=request.removed_task_ids,
+    )
+    return responses.JSONResponse(content={"edges": edges}, media_type="application/json")
+
+def _parse_task_info(task_info: List[Union[str, Dict]]) -> List[Dict]:
+    """
+    DB保存形式のタスク文字列から task_id, task_name, content を抽出する。
+    """
     parsed_tasks = []
-    for task_str in request.task_info:
-        try:
-            task_obj = json.loads(task_str)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=400, detail=f"無効なJSON文字列: {task_str}")
+    for task_str in task_info:
+        # tasks テーブルから取得した dict はそのまま使い、JSON 文字列のみデコードする
+        if isinstance(task_str, dict):
+            task_obj = task_str
+        else:
+            try:
+                task_obj = json.loads(task_str)
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail=f"無効なJSON文字列: {task_str}")
 
         # 必要なフィールドのみ抽出
         try:
@@ -52,6 +85,4 @@ def generate_task_graph(request: GraphTaskRequest):
         except KeyError as e:
             raise HTTPException(status_code=400, detail=f"必要なキーが見つかりません: {str(e)}")
         parsed_tasks.append(parsed_task)
-
-    edges = GraphTaskService().generate_task_graph(parsed_tasks)
-    return responses.JSONResponse(content={"edges": edges}, media_type="application/json")
+    return parsed_tasks
@@ -0,0 +1,57 @@
+# back/routers/jobs.py
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, responses
+from services.job_queue import job_queue, JobQueueFull, FINISHED
+from services.streaming import sse_response
+from services.usage_ledger import usage_ledger
+
+router = APIRouter()
+
+
+async def submit_job(kind: str, payload: Dict, project_id: Optional[str] = None) -> responses.JSONResponse:
+    """
+    ジョブを登録し、202 とジョブIDを返す（各機能のルーターの POST .../jobs から呼ぶ）。
+    結果は GET /api/jobs/{job_id} のポーリングか、GET /api/jobs/{job_id}/events の SSE で受け取る。
+    """
+    # 使用量の上限を大きく超えたプロジェクトは、ジョブを登録する前に 429 で断る
+    await usage_ledger.precheck(project_id)
+    try:
+        job_id = await job_queue.submit(kind, payload, project_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return responses.JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}",
+            "events_url": f"/api/jobs/{job_id}/events",
+        },
+    )
+
+
+@router.get("/{job_id}", summary="ジョブの状態取得")
+async def get_job(job_id: str):
+    """
+    ジョブの状態（queued / running / succeeded / failed）・進捗・結果を返す。
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
+
+@router.get("/{job_id}/events", summary="ジョブの進捗の購読")
+async def stream_job(job_id: str):
+    """
+    ジョブの状態が変わるたびに Server-Sent Events で通知する。
+    実行中は {"type": "progress", ...}、終了時は結果を含む {"type": "done", ...} を送って閉じる。
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+
+    async def events():
+        async for job in job_queue.watch(job_id):
+            yield {"type": "done" if job["status"] in FINISHED else "progress", **job}
+
+    return sse_response(events())
@@ -0,0 +1,29 @@
+# back/routers/llm.py
+from fastapi import APIRouter
+from services.llm_router import llm_router
+from services.llm_scheduler import llm_scheduler
+from services.llm_cache import llm_cache
+from services.context_cache import context_cache
+from services.llm_cassette import llm_cassette
+from services.usage_ledger import usage_ledger
+from services.single_flight import single_flight
+from services.job_queue import job_queue
+
+router = APIRouter()
+
+@router.get("/stats", summary="LLM 呼び出しの統計")
+async def get_llm_stats():
+    """
+    モデルごとのレイテンシ（p50/p95）・エラー率・ヘッジ回数、スケジューラの同時実行数、
+    応答キャッシュ・コンテキストキャッシュ・LLM カセット・使用量の台帳・リクエストの合流・ジョブキューの状況を返す。
+    """
+    return {
+        "routes": llm_router.stats(),
+        "scheduler": llm_scheduler.stats(),
+        "cache": llm_cache.stats(),
+        "context_cache": context_cache.stats(),
+        "cassette": llm_cassette.stats(),
+        "usage": usage_ledger.stats(),
+        "single_flight": single_flight.stats(),
+        "jobs": job_queue.stats(),
+    }
@@ -0,0 +1,305 @@
+import json
+import time
+import logging
+from typing import List, Dict, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only
+from database import get_db
+from models.project import Project
+from models.task import Task, TaskEdge, TaskSchedule
+from models.chat import ChatSession, ChatTurn
+from models.chunk import ProjectChunk
+from models.usage import LLMUsage
+from models.job import Job
+from services.retrieval import BM25Index, build_chunks, build_task_chunks, project_indexes
+from services.usage_ledger import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Pydanticモデル（単一タスクの部分更新用）
+# null を指定できるのは、tasks テーブルで NULL を許す列だけ（task_name は不可）
+class TaskPatch(BaseModel):
+    task_name: Optional[str] = None
+    priority: Optional[str] = None
+    content: Optional[str] = None
+    detail: Optional[str] = None
+    assignment: Optional[str] = None
+
+class Edge(BaseModel):
+    parent: int
+    child: int
+
+class EdgesUpdate(BaseModel):
+    edges: List[Edge]
+
+class Duration(BaseModel):
+    task_id: int
+    start: int
+    end: int
+
+class ScheduleUpdate(BaseModel):
+    durations: List[Duration]
+
+
+def parse_task_info(task_info: List[Union[str, Dict]]) -> List[Dict]:
+    """
+    task_info（JSON文字列または dict のリスト）を dict のリストにする。
+    task_id は整数にそろえ、無い要素には位置を割り当てる。
+    JSON として読めない要素・整数でない task_id・重複した task_id があれば 422 を返す。
+    """
+    parsed = []
+    seen = set()
+    for index, item in enumerate(task_info or []):
+        try:
+            task = json.loads(item) if isinstance(item, str) else dict(item)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail=f"task_info[{index}] を解釈できません")
+        task_id = task.get("task_id")
+        if task_id is None or task_id == "":
+            task_id = index
+        try:
+            task_id = int(task_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail=f"task_info[{index}] の task_id が整数ではありません: {task_id}")
+        if task_id in seen:
+            raise HTTPException(status_code=422, detail=f"task_info[{index}] の task_id が重複しています: {task_id}")
+        seen.add(task_id)
+        task["task_id"] = task_id
+        parsed.append(task)
+    return parsed
+
+
+def replace_project_tasks(db: Session, project_id: str, task_info: List[Union[str, Dict]]):
+    """
+    プロジェクトのタスク行を task_info の内容で置き換える（commit は呼び出し側で行う）。
+    """
+    db.query(Task).filter(Task.project_id == project_id).delete(synchronize_session=False)
+    for task in parse_task_info(task_info):
+        db.add(Task(
+            project_id=project_id,
+            task_id=task["task_id"],
+            task_name=task.get("task_name", ""),
+            priority=task.get("priority"),
+            content=task.get("content"),
+            detail=task.get("detail"),
+            assignment=task.get("assignment", ""),
+        ))
+
+
+def backfill_project_tasks(db: Session, project_id: str):
+    """
+    tasks テーブルに行が無いプロジェクト（tasks テーブル導入前に保存したもの）について、
+    Project.task_info から行を作って commit する。行がある場合は何もしない。
+    同時に作られて一意制約に違反した場合は、先に作られた行をそのまま使う。
+    """
+    if db.query(Task.id).filter(Task.project_id == project_id).first():
+        return
+    project = db.query(Project).options(load_only(Project.task_info)).filter(Project.project_id == project_id).first()
+    if not project or not project.task_info:
+        return
+    replace_project_tasks(db, project_id, project.task_info)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+
+def load_project_tasks(db: Session, project_id: str) -> List[Dict]:
+    rows = db.query(Task).filter(Task.project_id == project_id).order_by(Task.task_id).all()
+    return [row.to_dict() for row in rows]
+
+
+def sync_project_task_info(db: Session, project_id: str):
+    """
+    tasks テーブルの行を変更したあと、Project.task_info も同じ内容（JSON 文字列のリスト）に書き換える（commit は呼び出し側で行う）。
+    task_info を直接読む古いクライアントや backfill が古い内容を見ないようにするため。
+    """
+    db.flush()
+    project = db.query(Project).options(load_only(Project.task_info)).filter(Project.project_id == project_id).first()
+    if project:
+        project.task_info = [json.dumps(task, ensure_ascii=False) for task in load_project_tasks(db, project_id)]
+
+
+def load_project_edges(db: Session, project_id: str) -> List[Dict]:
+    """
+    保存済みのタスク間の依存関係を /api/graphTask の出力と同じ形式で返す。
+    """
+    rows = db.query(TaskEdge).filter(TaskEdge.project_id == project_id).all()
+    return [{"parent": r.parent, "child": r.child} for r in rows]
+
+
+def save_task_details(db: Session, project_id: str, tasks: List[Optional[Dict]]) -> int:
+    """
+    taskDetail で生成した detail をプロジェクトのタスク行に保存し、保存した件数を返す（commit は呼び出し側で行う）。
+    task_id があればその行に、無ければタスク名と内容が一致する行に保存する。
+    対応する行が無いタスクは保存しない（ジョブの入力が古い・一部だけの場合に別のタスクを上書きしないため）。
+    """
+    backfill_project_tasks(db, project_id)
+    rows = db.query(Task).filter(Task.project_id == project_id).all()
+    by_id = {row.task_id: row for row in rows}
+    by_identity = {(row.task_name, row.content): row for row in rows}
+    saved = 0
+    for task in tasks:
+        if not task or not task.get("detail"):
+            continue
+        if task.get("task_id") is not None:
+            row = by_id.get(task["task_id"])
+        else:
+            row = by_identity.get((task.get("task_name"), task.get("content")))
+        if row is None:
+            logger.warning("保存先のタスクが見つからないため detail を保存しません (project=%s task=%s)", project_id, task.get("task_name"))
+            continue
+        row.detail = task["detail"]
+        saved += 1
+    if saved:
+        sync_project_task_info(db, project_id)
+        rebuild_project_index(db, project_id)
+    return saved
+
+
+def delete_project_rows(db: Session, project_id: str):
+    """
+    プロジェクトに紐づくタスク・依存関係・スケジュール・チャット履歴・検索用チャンク・LLM 使用量・ジョブの行を削除する（commit は呼び出し側で行う）。
+    """
+    for model in (Task, TaskEdge, TaskSchedule):
+        db.query(model).filter(model.project_id == project_id).delete(synchronize_session=False)
+    session_ids = db.query(ChatSession.id).filter(ChatSession.project_id == project_id)
+    db.query(ChatTurn).filter(ChatTurn.session_id.in_(session_ids.scalar_subquery())).delete(synchronize_session=False)
+    db.query(ChatSession).filter(ChatSession.project_id == project_id).delete(synchronize_session=False)
+    db.query(ProjectChunk).filter(ProjectChunk.project_id == project_id).delete(synchronize_session=False)
+    project_indexes.discard(project_id)
+    db.query(LLMUsage).filter(LLMUsage.project_id == project_id).delete(synchronize_session=False)
+    db.query(Job).filter(Job.project_id == project_id).delete(synchronize_session=False)
+    usage_ledger.discard(project_id)
+
+
+def rebuild_project_index(db: Session, project_id: str):
+    """
+    仕様書・ディレクトリ構成・タスクから検索用チャンクを作り直す（commit は呼び出し側で行う）。
+    仕様書やタスクを保存したときに呼ぶ。
+    """
+    # 同じセッションで追加・変更したタスク行も読めるように先に flush する
+    db.flush()
+    project = (
+        db.query(Project)
+        .options(load_only(Project.specification, Project.directory_info))
+        .filter(Project.project_id == project_id)
+        .first()
+    )
+    if not project:
+        return
+    db.query(ProjectChunk).filter(ProjectChunk.project_id == project_id).delete(synchronize_session=False)
+    built_at = time.time()
+    for chunk in build_chunks(project.specification, project.directory_info, load_project_tasks(db, project_id)):
+        db.add(ProjectChunk(project_id=project_id, built_at=built_at, **chunk))
+
+
+def update_task_chunks(db: Session, project_id: str, task: Task):
+    """
+    1タスクの検索用チャンク（出典 "task:<task_id>"）だけを作り直す（commit は呼び出し側で行う）。
+    インデックスがまだ無いプロジェクトは全体を作る。
+    """
+    if not db.query(ProjectChunk.id).filter(ProjectChunk.project_id == project_id).first():
+        rebuild_project_index(db, project_id)
+        return
+    source = f"task:{task.task_id}"
+    db.query(ProjectChunk).filter(ProjectChunk.project_id == project_id, ProjectChunk.source == source).delete(synchronize_session=False)
+    # built_at の最大値が変わるため、メモリ上のインデックスは次回の参照時に作り直される
+    built_at = time.time()
+    for chunk in build_task_chunks(task.to_dict()):
+        db.add(ProjectChunk(project_id=project_id, built_at=built_at, **chunk))
+
+
+def load_project_index(db: Session, project_id: str) -> Optional[BM25Index]:
+    """
+    プロジェクトの検索インデックスを返す。チャンクが無ければ None。
+    チャンクが作り直されるまではメモリ上のインデックスを使い回す。
+    """
+    built_at = db.query(func.max(ProjectChunk.built_at)).filter(ProjectChunk.project_id == project_id).scalar()
+    if built_at is None:
+        return None
+    index = project_indexes.get(project_id, built_at)
+    if index is None:
+        rows = db.query(ProjectChunk).filter(ProjectChunk.project_id == project_id).order_by(ProjectChunk.id).all()
+        index = BM25Index([row.to_dict() for row in rows])
+        project_indexes.put(project_id, built_at, index)
+    return index
+
+
+def _ensure_project(db: Session, project_id: str):
+    exists = db.query(Project.project_id).filter(Project.project_id == project_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
+
+
+@router.get("/projects/{project_id}/tasks", summary="タスク一覧取得")
+def list_tasks(project_id: str, db: Session = Depends(get_db)):
+    _ensure_project(db, project_id)
+    backfill_project_tasks(db, project_id)
+    return {"tasks": load_project_tasks(db, project_id)}
+
+@router.get("/projects/{project_id}/tasks/{task_id}", summary="タスク取得")
+def get_task(project_id: str, task_id: int, db: Session = Depends(get_db)):
+    backfill_project_tasks(db, project_id)
+    task = db.query(Task).filter(Task.project_id == project_id, Task.task_id == task_id).first()
+    if not task:
+        raise HTTPException(status_code=404, detail="タスクが見つかりません")
+    return task.to_dict()
+
+@router.patch("/projects/{project_id}/tasks/{task_id}", summary="タスク部分更新")
+def patch_task(project_id: str, task_id: int, patch: TaskPatch, db: Session = Depends(get_db)):
+    """
+    1タスクだけを更新する（担当者の変更など）。tasks テーブルは1行だけ更新し、Project.task_info も同じ内容にそろえる。
+    tasks テーブルに行の無い古いプロジェクトは、最初のアクセス時に task_info から行を作る。
+    task_name など NULL にできない項目に null を指定した場合は 422 を返す。
+    """
+    backfill_project_tasks(db, project_id)
+    task = db.query(Task).filter(Task.project_id == project_id, Task.task_id == task_id).first()
+    if not task:
+        raise HTTPException(status_code=404, detail="タスクが見つかりません")
+    changes = patch.model_dump(exclude_unset=True)
+    not_nullable = [key for key, value in changes.items() if value is None and not Task.__table__.c[key].nullable]
+    if not_nullable:
+        raise HTTPException(status_code=422, detail=f"null にできない項目です: {', '.join(not_nullable)}")
+    for key, value in changes.items():
+        setattr(task, key, value)
+    # task_info も同じトランザクションで更新する
+    sync_project_task_info(db, project_id)
+    if changes.keys() & {"task_name", "content", "detail"}:
+        update_task_chunks(db, project_id, task)
+    db.commit()
+    return {"message": "タスクが更新されました", "task": task.to_dict()}
+
+@router.get("/projects/{project_id}/edges", summary="タスク依存関係取得")
+def get_edges(project_id: str, db: Session = Depends(get_db)):
+    _ensure_project(db, project_id)
+    return {"edges": load_project_edges(db, project_id)}
+
+@router.put("/projects/{project_id}/edges", summary="タスク依存関係保存")
+def put_edges(project_id: str, body: EdgesUpdate, db: Session = Depends(get_db)):
+    _ensure_project(db, project_id)
+    db.query(TaskEdge).filter(TaskEdge.project_id == project_id).delete(synchronize_session=False)
+    for edge in {(e.parent, e.child) for e in body.edges}:
+        db.add(TaskEdge(project_id=project_id, parent=edge[0], child=edge[1]))
+    db.commit()
+    return {"message": "依存関係が保存されました"}
+
+@router.get("/projects/{project_id}/schedule", summary="タスク期間取得")
+def get_schedule(project_id: str, db: Session = Depends(get_db)):
+    _ensure_project(db, project_id)
+    rows = db.query(TaskSchedule).filter(TaskSchedule.project_id == project_id).order_by(TaskSchedule.task_id).all()
+    return {"durations": [{"task_id": r.task_id, "start": r.start, "end": r.end} for r in rows]}
+
+@router.put("/projects/{project_id}/schedule", summary="タスク期間保存")
+def put_schedule(project_id: str, body: ScheduleUpdate, db: Session = Depends(get_db)):
+    _ensure_project(db, project_id)
+    db.query(TaskSchedule).filter(TaskSchedule.project_id == project_id).delete(synchronize_session=False)
+    for d in body.durations:
+        db.add(TaskSchedule(project_id=project_id, task_id=d.task_id, start=d.start, end=d.end))
+    db.commit()
+    return {"message": "スケジュールが保存されました"}
@@ -1,12 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
 import uuid
+import json
 from pydantic import BaseModel
-from database import SessionLocal
+from database import get_async_db
 from models.project import Project
+from routers.projectTasks import replace_project_tasks, load_project_tasks, delete_project_rows, rebuild_project_index
 
 router = APIRouter()
 
+# GET /projects/{project_id} で fields= に指定できる列
+PROJECT_FIELDS = [
+    "project_id", "idea", "duration", "num_people", "specification", "selected_framework",
+    "directory_info", "menber_info", "task_info", "envHanson",
+]
+
 # Pydanticモデル（入力用）
 class ProjectCreate(BaseModel):
     idea: str
@@ -31,16 +42,8 @@ class ProjectUpdate(BaseModel):
     task_info: list = None
     envHanson: str = None
 
-# DBセッション取得用 dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/projects", summary="プロジェクト作成")
-def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
+async def create_project(project: ProjectCreate, db: AsyncSession = Depends(get_async_db)):
     project_id = str(uuid.uuid4())
     db_project = Project(
         project_id=project_id,
@@ -55,51 +58,100 @@ def create_project(project: ProjectCreate, db: Session = Depends(get_db)):
         envHanson=project.envHanson,
     )
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.flush()
+    # タスクは1行ずつ tasks テーブルにも保存する
+    await db.run_sync(replace_project_tasks, project_id, project.task_info)
+    # taskChat の検索用に仕様書・タスクのチャンクを作る
+    await db.run_sync(rebuild_project_index, project_id)
+    await db.commit()
     return {"project_id": project_id, "message": "プロジェクトが作成されました"}
 
 @router.get("/projects/{project_id}", summary="プロジェクト取得")
-def get_project(project_id: str, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
+async def get_project(
+    project_id: str,
+    fields: Optional[str] = Query(None, description="カンマ区切りで返す列を指定（例: idea,duration）。省略時は全列"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selected = _parse_fields(fields)
+    # 指定された列だけを SELECT する（task_info は tasks テーブルから組み立てる）
+    columns = [getattr(Project, f) for f in selected if f not in ("project_id", "task_info")]
+    query = select(Project).where(Project.project_id == project_id)
+    if columns:
+        query = query.options(load_only(*columns))
+    project = (await db.execute(query)).scalars().first()
     if not project:
         raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
-    return {
-        "project_id": project.project_id,
-        "idea": project.idea,
-        "duration": project.duration,
-        "num_people": project.num_people,
-        "specification": project.specification,
-        "selected_framework": project.selected_framework,
-        "directory_info": project.directory_info,
-        "menber_info": project.menber_info,
-        "task_info": project.task_info,
-        "envHanson": project.envHanson,
-    }
+    result = {}
+    for field in selected:
+        if field == "task_info":
+            result[field] = await db.run_sync(_task_info, project)
+        else:
+            result[field] = getattr(project, field)
+    return result
+
+def _parse_fields(fields: Optional[str]) -> list:
+    if not fields:
+        return PROJECT_FIELDS
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in PROJECT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不明なフィールドです: {', '.join(unknown)}")
+    return ["project_id"] + [f for f in selected if f != "project_id"]
+
+def _task_info(db: Session, project: Project) -> list:
+    """
+    tasks テーブルに行があればそれを正とし、従来どおり JSON 文字列のリストで返す。
+    同期セッションの処理なので AsyncSession.run_sync から呼ぶ。
+    """
+    tasks = load_project_tasks(db, project.project_id)
+    if not tasks:
+        return project.task_info
+    return [json.dumps(task, ensure_ascii=False) for task in tasks]
 
 @router.get("/projects", summary="全プロジェクト一覧取得")
-def list_projects(db: Session = Depends(get_db)):
-    projects = db.query(Project).all()
-    return [{"project_id": p.project_id, "idea": p.idea} for p in projects]
+async def list_projects(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="1ページの件数。省略時は全件を返す"),
+    after: Optional[str] = Query(None, description="前のページの X-Next-Cursor の値"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    project_id と idea のみを SELECT し、project_id 順で返す。
+    limit を指定した場合はキーセットページングになり、次のページがある場合は X-Next-Cursor ヘッダにカーソルを入れる。
+    """
+    query = select(Project.project_id, Project.idea).order_by(Project.project_id)
+    if after:
+        query = query.where(Project.project_id > after)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = rows[-1].project_id
+    return [{"project_id": p.project_id, "idea": p.idea} for p in rows]
 
 @router.put("/projects/{project_id}", summary="プロジェクト更新")
-def update_project(project_id: str, project: ProjectUpdate, db: Session = Depends(get_db)):
-    db_project = db.query(Project).filter(Project.project_id == project_id).first()
+async def update_project(project_id: str, project: ProjectUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_project = await db.get(Project, project_id)
     if not db_project:
         raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
     
-    update_data = project.dict(exclude_unset=True)
+    update_data = project.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_project, key, value)
-    db.commit()
-    db.refresh(db_project)
+    if "task_info" in update_data:
+        await db.run_sync(replace_project_tasks, project_id, update_data["task_info"])
+    if update_data.keys() & {"specification", "directory_info", "task_info"}:
+        await db.run_sync(rebuild_project_index, project_id)
+    await db.commit()
     return {"message": "プロジェクトが更新されました"}
 
 @router.delete("/projects/{project_id}", summary="プロジェクト削除")
-def delete_project(project_id: str, db: Session = Depends(get_db)):
-    db_project = db.query(Project).filter(Project.project_id == project_id).first()
+async def delete_project(project_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_project = await db.get(Project, project_id)
     if not db_project:
         raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
-    db.delete(db_project)
-    db.commit()
+    await db.run_sync(delete_project_rows, project_id)
+    await db.delete(db_project)
+    await db.commit()
     return {"message": "プロジェクトが削除されました"}
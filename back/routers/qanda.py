@@ -13,10 +13,10 @@ qanda_service = QuestionService()
 
 
 @router.post("/")
-def generate_question(idea_prompt: IdeaPrompt):
+async def generate_question(idea_prompt: IdeaPrompt):
     """
     idea_prompt.Prompt を受け取り、Q&Aを返す。
     """
-    question = qanda_service.generate_question(idea_prompt.Prompt)
+    question = await qanda_service.agenerate_question(idea_prompt.Prompt)
     # JSON形式
     return responses.JSONResponse(content=question, media_type="application/json")
@@ -0,0 +1,120 @@
+# back/routers/setup.py
+import os
+import json
+import time
+import uuid
+from typing import Dict, List, Optional
+from fastapi import APIRouter
+from pydantic import BaseModel
+from database import AsyncSessionLocal
+from models.project import Project
+from services.setup_pipeline import SetupPipeline
+from services.streaming import sse_response
+from services.request_context import scoped_stream
+from services.job_queue import job_queue, JobContext
+from routers.jobs import submit_job
+from routers.projectTasks import replace_project_tasks, rebuild_project_index
+
+router = APIRouter()
+
+# タスク詳細の生成で1回の LLM 呼び出しにまとめるタスク数
+BATCH_SIZE = int(os.getenv("TASK_DETAIL_BATCH_SIZE", "3"))
+# タスク詳細の生成の締め切り（秒）
+DEADLINE_SEC = float(os.getenv("SETUP_TASK_DETAIL_DEADLINE_SEC", "300"))
+
+class SetupRequest(BaseModel):
+    idea: str
+    duration: str
+    num_people: int
+    specification: str
+    framework: str
+    menber_info: Optional[list] = None  # 省略時は人数分の仮のメンバー名を作る
+
+
+def _project_task_info(tasks: List[Dict], detailed: List[Optional[Dict]]) -> List[str]:
+    """
+    タスクと生成した詳細を、プロジェクトの task_info（JSON 文字列のリスト）の形にする。
+    """
+    task_info = []
+    for index, task in enumerate(tasks):
+        detail = detailed[index] if index < len(detailed) else None
+        entry = {k: v for k, v in (detail or task).items() if k != "task_index"}
+        entry.setdefault("detail", "")
+        entry.update(assignment=entry.get("assignment") or "", task_id=index)
+        task_info.append(json.dumps(entry, ensure_ascii=False))
+    return task_info
+
+
+async def save_setup_project(project_id: str, request: SetupRequest, results: Dict):
+    """
+    パイプラインの結果をまとめて1つのトランザクションでプロジェクトとして保存する。
+    """
+    task_info = _project_task_info(results["tasks"], results["task_details"])
+    async with AsyncSessionLocal() as db:
+        db.add(Project(
+            project_id=project_id,
+            idea=request.idea,
+            duration=request.duration,
+            num_people=request.num_people,
+            specification=request.specification,
+            selected_framework=request.framework,
+            directory_info=results["directory"],
+            menber_info=request.menber_info or [f"member{i + 1}" for i in range(request.num_people)],
+            task_info=task_info,
+            envHanson=json.dumps(results["environment"], ensure_ascii=False),
+        ))
+        await db.flush()
+        await db.run_sync(replace_project_tasks, project_id, task_info)
+        await db.run_sync(rebuild_project_index, project_id)
+        await db.commit()
+
+
+@router.post("/stream")
+async def stream_project_setup(request: SetupRequest):
+    """
+    仕様書とフレームワークから、ディレクトリ構成・タスク分割・環境構築ハンズオン・タスク詳細を
+    依存関係に沿って並行に生成し、プロジェクトとして保存する。段階が完了するたびに Server-Sent Events で通知する。
+      {"type": "start", "project_id": "..."}
+      {"type": "stage", "stage": "directory" | "tasks" | "environment" | "task_details", "result": ..., "elapsed_sec": 1.2}
+      {"type": "progress", "stage": "task_details", "completed": 3, "total": 10}
+      {"type": "done", "project_id": "...", "elapsed_sec": 12.3}
+    いずれかの段階が失敗した場合は error イベントを送り、プロジェクトは保存しない。
+    """
+    project_id = str(uuid.uuid4())
+    pipeline = SetupPipeline(request.specification, request.framework, batch_size=BATCH_SIZE, deadline_sec=DEADLINE_SEC)
+
+    async def events():
+        started = time.monotonic()
+        yield {"type": "start", "project_id": project_id}
+        async for event in pipeline.astream():
+            yield event
+        await save_setup_project(project_id, request, pipeline.results)
+        yield {"type": "done", "project_id": project_id, "elapsed_sec": round(time.monotonic() - started, 3)}
+
+    return sse_response(scoped_stream(project_id, events()))
+
+
+@router.post("/jobs", status_code=202)
+async def submit_project_setup_job(request: SetupRequest):
+    """
+    stream_project_setup をバックグラウンドのジョブとして実行し、すぐにジョブIDを返す。
+    ジョブの project_id が保存されるプロジェクトのIDになる（ジョブが成功するまではプロジェクトは存在しない）。
+    """
+    return await submit_job("setup", request.model_dump(), str(uuid.uuid4()))
+
+
+async def run_project_setup_job(job: JobContext, payload: Dict) -> Dict:
+    request = SetupRequest(**payload)
+    pipeline = SetupPipeline(request.specification, request.framework, batch_size=BATCH_SIZE, deadline_sec=DEADLINE_SEC)
+    stages: List[str] = []
+    async for event in pipeline.astream():
+        if event["type"] == "stage":
+            stages.append(event["stage"])
+            await job.progress(stages=list(stages))
+        else:
+            await job.progress(stages=list(stages), completed=event["completed"], total=event["total"])
+    await save_setup_project(job.project_id, request, pipeline.results)
+    return {"project_id": job.project_id, **pipeline.results}
+
+
+job_queue.register("setup", run_project_setup_job)
@@ -1,6 +1,13 @@
+from typing import Dict, Optional
 from fastapi import APIRouter
 from pydantic import BaseModel
+from database import AsyncSessionLocal
+from models.project import Project
 from services.summary_service import SummaryService
+from services.streaming import sse_response
+from services.job_queue import job_queue, JobContext
+from routers.jobs import submit_job
+from routers.projectTasks import rebuild_project_index
 
 router = APIRouter()
 summary_service = SummaryService()
@@ -11,16 +18,50 @@ class YumeQA(BaseModel):
 
 class YumeAnswer(BaseModel):
     Answer: list[YumeQA]
+    project_id: Optional[str] = None  # ジョブの結果（仕様書）を保存するプロジェクト（省略可）
 
 
 @router.post("/")
-def generate_summary_document(yume_answer: YumeAnswer):
+async def generate_summary_document(yume_answer: YumeAnswer):
     """
     yume_answer.Answer = [{"Question":"...","Answer":"..."}, ...]
     """
     # Q&Aリストを取得
     answer_list = yume_answer.Answer  
     # サマリー生成
-    summary_text = summary_service.generate_summary_docment(answer_list)
+    summary_text = await summary_service.agenerate_summary_docment(answer_list)
     # レスポンスを返す
     return {"summary": summary_text}
+
+
+@router.post("/stream")
+async def stream_summary_document(yume_answer: YumeAnswer):
+    """
+    generate_summary_document のストリーミング版。仕様書をトークンごとに Server-Sent Events で返す。
+    """
+    return sse_response(summary_service.astream_summary_docment(yume_answer.Answer))
+
+
+@router.post("/jobs", status_code=202)
+async def submit_summary_job(yume_answer: YumeAnswer):
+    """
+    generate_summary_document をバックグラウンドのジョブとして実行し、すぐにジョブIDを返す。
+    project_id を指定した場合は、生成した仕様書をプロジェクトの specification にも保存する。
+    """
+    return await submit_job("summary", yume_answer.model_dump(), yume_answer.project_id)
+
+
+async def run_summary_job(job: JobContext, payload: Dict) -> Dict:
+    answer_list = [YumeQA(**item) for item in payload["Answer"]]
+    summary_text = await summary_service.agenerate_summary_docment(answer_list)
+    if job.project_id:
+        async with AsyncSessionLocal() as db:
+            project = await db.get(Project, job.project_id)
+            if project is not None:
+                project.specification = summary_text
+                await db.run_sync(rebuild_project_index, job.project_id)
+                await db.commit()
+    return {"summary": summary_text}
+
+
+job_queue.register("summary", run_summary_job)
@@ -1,31 +1,239 @@
-from fastapi import APIRouter, responses
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, responses
 from pydantic import BaseModel
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+from database import get_async_db, AsyncSessionLocal
+from models.project import Project
+from models.chat import ChatSession, ChatTurn
+from routers.projectTasks import load_project_index
 from services.taskChat_service import taskChatService
+from services.chat_session_service import ChatSessionService
+from services.streaming import sse_response
+from services.request_context import project_scope, scoped_stream
+from services.usage_ledger import usage_ledger
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 仕様書とディレクトリ構成の合計がこの文字数を超える場合は、全文ではなく検索で絞った抜粋をプロンプトに載せる
+RETRIEVAL_MIN_CHARS = int(os.getenv("CHAT_RETRIEVAL_MIN_CHARS", "6000"))
+# 抜粋に使うチャンク数
+RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "6"))
+
 # リクエストボディのモデル
 class ChatBotRequest(BaseModel):
     specification: str         # 仕様書
     directory_structure: str     # ディレクトリ構造
-    chat_history: str            # チャット履歴
+    chat_history: str = ""       # チャット履歴（session_key を指定した場合はサーバー側の履歴を使うので不要）
     user_question: str           # 新たなユーザーからのチャットでの質問内容
     framework: str               # 使用しているフレームワーク
     taskDetail: str              # タスク詳細
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキーに使う。省略可）
+    session_key: Optional[str] = None  # プロジェクト内のチャットの識別子（"task-3" など）。project_id と併せて指定する
 
 @router.post("/")
-def get_chatbot_response(request: ChatBotRequest):
+async def get_chatbot_response(request: ChatBotRequest, background_tasks: BackgroundTasks):
     """
     仕様書、ディレクトリ構造、チャット履歴、新たなユーザーからの質問内容、
     使用しているフレームワーク情報を受け取り、回答をテキスト形式で返すAPI
+    project_id と session_key を指定した場合は、サーバー側に保存した履歴（要約 + 直近の発言）を使い、
+    今回の質問と回答も保存する。
+    LLM の応答を待つ間は DB の接続を保持しないよう、読み込みと保存はそれぞれ短いセッションで行う。
     """
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
     service = taskChatService()
-    answer = service.generate_response(
-        specification=request.specification,
-        directory_structure=request.directory_structure,
-        chat_history=request.chat_history,
-        user_question=request.user_question,
-        framework=request.framework,
-        taskDetail=request.taskDetail
-    )
+    async with AsyncSessionLocal() as db:
+        session = await _session_for(db, request)
+        excerpts = await _grounded_excerpts(db, request)
+    # 履歴の要約で LLM を待つ場合があるので、セッションを閉じてから組み立てる
+    chat_history = await _history_for(session.id) if session else request.chat_history
+    with project_scope(request.project_id):
+        answer = await service.agenerate_response(
+            specification=request.specification,
+            directory_structure=request.directory_structure,
+            chat_history=chat_history,
+            user_question=request.user_question,
+            framework=request.framework,
+            taskDetail=request.taskDetail,
+            excerpts=excerpts,
+        )
+    if session:
+        async with AsyncSessionLocal() as db:
+            await _append_turns(db, await db.get(ChatSession, session.id), request.user_question, answer)
+        background_tasks.add_task(compact_session, session.id)
     return responses.JSONResponse(content={"response": answer}, media_type="application/json")
+
+@router.post("/stream")
+async def stream_chatbot_response(request: ChatBotRequest):
+    """
+    get_chatbot_response のストリーミング版。回答をトークンごとに Server-Sent Events で返す。
+    最後の done イベントに全文とトークン使用量が含まれる。
+    """
+    await usage_ledger.precheck(request.project_id)
+    service = taskChatService()
+    async with AsyncSessionLocal() as db:
+        session = await _session_for(db, request)
+        excerpts = await _grounded_excerpts(db, request)
+    # 履歴の要約で LLM を待つ場合があるので、セッションを閉じてから組み立てる
+    chat_history = await _history_for(session.id) if session else request.chat_history
+    session_id = session.id if session else None
+
+    async def events():
+        async for event in service.astream_response(
+            specification=request.specification,
+            directory_structure=request.directory_structure,
+            chat_history=chat_history,
+            user_question=request.user_question,
+            framework=request.framework,
+            taskDetail=request.taskDetail,
+            excerpts=excerpts,
+        ):
+            if event["type"] == "done" and session_id is not None:
+                async with AsyncSessionLocal() as db:
+                    await _append_turns(db, await db.get(ChatSession, session_id), request.user_question, event["content"])
+            yield event
+
+    response = sse_response(scoped_stream(request.project_id, events()))
+    if session_id is not None:
+        # 要約の更新は回答を返し終えてから行う
+        response.background = BackgroundTask(compact_session, session_id)
+    return response
+
+@router.get("/sessions/{project_id}/{session_key}", summary="チャット履歴取得")
+async def get_chat_session(project_id: str, session_key: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    保存済みの全発言と、古い発言の要約を返す（画面の履歴復元用）。
+    """
+    session = await _find_session(db, project_id, session_key)
+    if not session:
+        return {"summary": "", "turns": []}
+    rows = await db.execute(select(ChatTurn).where(ChatTurn.session_id == session.id).order_by(ChatTurn.id))
+    return {"summary": session.summary, "turns": [turn.to_dict() for turn in rows.scalars()]}
+
+@router.delete("/sessions/{project_id}/{session_key}", summary="チャット履歴削除")
+async def delete_chat_session(project_id: str, session_key: str, db: AsyncSession = Depends(get_async_db)):
+    session = await _find_session(db, project_id, session_key)
+    if session:
+        await db.run_sync(lambda s: s.query(ChatTurn).filter(ChatTurn.session_id == session.id).delete(synchronize_session=False))
+        await db.delete(session)
+        await db.commit()
+    return {"message": "チャット履歴が削除されました"}
+
+
+async def _grounded_excerpts(db: AsyncSession, request: ChatBotRequest) -> str:
+    """
+    長い仕様書のプロジェクトについて、保存時に作ったチャンクのインデックスから質問に関連する上位 k 件の抜粋を返す。
+    仕様書・ディレクトリ構成の全文はプロジェクトごとにキャッシュする system メッセージに載せたまま、
+    質問ごとに変わる抜粋は human メッセージに載せる（抜粋で先頭が変わるとコンテキストキャッシュが効かなくなるため）。
+    短い場合やインデックスが無い場合は空文字列。
+    """
+    if not request.project_id or len(request.specification) + len(request.directory_structure) < RETRIEVAL_MIN_CHARS:
+        return ""
+    index = await db.run_sync(load_project_index, request.project_id)
+    if index is None:
+        return ""
+    hits = index.search(f"{request.user_question}\n{request.taskDetail[:200]}", k=RETRIEVAL_TOP_K)
+    # ディレクトリ構成は全文が system メッセージにあるので、仕様書とタスクの抜粋だけを使う
+    return "\n\n".join(f"[{hit['title']}]\n{hit['text']}" for hit in hits if hit["source"] != "directory")
+
+
+async def _find_session(db: AsyncSession, project_id: str, session_key: str) -> Optional[ChatSession]:
+    rows = await db.execute(
+        select(ChatSession).where(ChatSession.project_id == project_id, ChatSession.session_key == session_key)
+    )
+    return rows.scalars().first()
+
+
+async def _session_for(db: AsyncSession, request: ChatBotRequest) -> Optional[ChatSession]:
+    """
+    project_id と session_key が指定されていればセッションを取得（無ければ作成）する。
+    """
+    if not (request.project_id and request.session_key):
+        return None
+    session = await _find_session(db, request.project_id, request.session_key)
+    if session:
+        return session
+    if not await db.get(Project, request.project_id):
+        raise HTTPException(status_code=404, detail="プロジェクトが見つかりません")
+    session = ChatSession(project_id=request.project_id, session_key=request.session_key, summary="", summarized_until=0)
+    db.add(session)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 同じセッションを同時に作成した場合は先に作られた方を使う
+        await db.rollback()
+        session = await _find_session(db, request.project_id, request.session_key)
+    return session
+
+
+async def _pending_turns(db: AsyncSession, session_id: int, summarized_until: int) -> List[Dict]:
+    """
+    まだ要約に含めていない発言を古い順に返す。
+    """
+    rows = await db.execute(
+        select(ChatTurn)
+        .where(ChatTurn.session_id == session_id, ChatTurn.id > summarized_until)
+        .order_by(ChatTurn.id)
+    )
+    return [turn.to_dict() for turn in rows.scalars()]
+
+
+async def _fold_old_turns(session_id: int, service: ChatSessionService) -> Tuple[str, List[Dict]]:
+    """
+    トークン予算からあふれた発言を要約に畳み込み、要約とそのまま使う直近の発言を返す。
+    要約の生成（LLM 呼び出し）の間は DB の接続を保持しないよう、読み込みと書き込みは別々の短いセッションで行う。
+    その間に別のリクエストが要約を更新していた場合は、先に書かれた方を残す。
+    """
+    async with AsyncSessionLocal() as db:
+        session = await db.get(ChatSession, session_id)
+        if not session:
+            return "", []
+        summary, summarized_until = session.summary, session.summarized_until
+        pending = await _pending_turns(db, session_id, summarized_until)
+    older, window = service.split_window(pending)
+    if older:
+        summary = await service.asummarize(summary, older)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id, ChatSession.summarized_until == summarized_until)
+                .values(summary=summary, summarized_until=older[-1]["id"], updated_at=time.time())
+            )
+            await db.commit()
+    return summary, window
+
+
+async def _history_for(session_id: int) -> str:
+    """
+    プロンプトに載せる履歴（要約 + 直近の発言）を返す。
+    通常は前回の回答後に compact_session が要約を更新済みなので、ここで LLM を呼ぶことはない。
+    """
+    service = ChatSessionService()
+    summary, window = await _fold_old_turns(session_id, service)
+    return service.format_history(summary, window)
+
+
+async def _append_turns(db: AsyncSession, session: ChatSession, question: str, answer: str):
+    db.add(ChatTurn(session_id=session.id, role="user", content=question))
+    db.add(ChatTurn(session_id=session.id, role="assistant", content=answer))
+    session.updated_at = time.time()
+    await db.commit()
+
+
+async def compact_session(session_id: int):
+    """
+    回答後にバックグラウンドで古い発言を要約に畳み込み、次回のリクエストで要約を待たずに済むようにする。
+    """
+    try:
+        await _fold_old_turns(session_id, ChatSessionService())
+    except Exception as e:
+        # 失敗しても次回のリクエスト時に要約し直すので、ここではログだけ残す
+        logger.error("チャット履歴の要約に失敗しました (session=%s): %s", session_id, e, exc_info=True)
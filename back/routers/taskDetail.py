@@ -1,30 +1,110 @@
+import os
+import json
 from fastapi import APIRouter, responses, HTTPException
-from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
-from services.taskDetail_service import TaskDetailService, TaskItem
+from typing import Dict, List, Optional
+from database import AsyncSessionLocal
+from services.taskDetail_service import TaskDetailService, TaskItem, FAILED_DETAIL_PREFIX
+from services.request_context import project_scope, scoped_stream
+from services.usage_ledger import usage_ledger
+from services.job_queue import job_queue, JobContext
+from routers.jobs import submit_job
+from routers.projectTasks import save_task_details
 
 router = APIRouter()
 
+# 1回の LLM 呼び出しでまとめるタスク数
+BATCH_SIZE = int(os.getenv("TASK_DETAIL_BATCH_SIZE", "3"))
+# リクエスト全体の締め切り（秒）。プロキシのタイムアウトより短くしておく
+DEADLINE_SEC = float(os.getenv("TASK_DETAIL_DEADLINE_SEC", "120"))
+# ジョブとして実行する場合の締め切り（秒）。HTTP 接続を保持しないため長めにできる
+JOB_DEADLINE_SEC = float(os.getenv("TASK_DETAIL_JOB_DEADLINE_SEC", "600"))
+
 # リクエスト用モデル
 class TaskDetailRequest(BaseModel):
     tasks: List[TaskItem]
     specification: str
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキーに使う。省略可）
 
 @router.post("/")
 async def generate_task_details(request: TaskDetailRequest):
     """
     各タスクを並列に LLM 呼び出しして detail を生成。
     """
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
     service = TaskDetailService()
     # Pydantic モデルを dict 変換
-    task_dicts = [t.model_dump() for t in request.tasks]
+    task_dicts = [t.model_dump(exclude_none=True) for t in request.tasks]
     specification = request.specification
 
     try:
-        # スレッド数はマシン性能とレート制限に合わせて調整
-        detailed = await run_in_threadpool(service.generate_task_details_parallel, task_dicts, specification, 3, 5)
+        # 同時実行数とレート制限は共有スケジューラが調整する
+        with project_scope(request.project_id):
+            detailed = await service.agenerate_task_details_parallel(
+                task_dicts, specification, batch_size=BATCH_SIZE, deadline_sec=DEADLINE_SEC
+            )
         return responses.JSONResponse(content={"tasks": detailed})
     except Exception as e:
         # router レベルでも念のためキャッチ
         raise HTTPException(status_code=500, detail=f"タスク詳細生成中にエラーが発生しました: {e}")
+
+@router.post("/stream")
+async def stream_task_details(request: TaskDetailRequest):
+    """
+    generate_task_details のストリーミング版。バッチが完了するたびに1行の JSON (NDJSON) を返す。
+    各タスクには入力上の位置 task_index が付くので、受け取り側で入力順に並べ直せる。
+      {"type": "batch", "tasks": [{"task_index": 3, "task_name": ..., "detail": ...}, ...]}
+      {"type": "done", "count": 10}
+    """
+    await usage_ledger.precheck(request.project_id)
+    service = TaskDetailService()
+    task_dicts = [t.model_dump(exclude_none=True) for t in request.tasks]
+
+    async def ndjson():
+        try:
+            async for event in scoped_stream(request.project_id, service.astream_task_details(
+                task_dicts, request.specification, batch_size=BATCH_SIZE, deadline_sec=DEADLINE_SEC
+            )):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+
+    return responses.StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs", status_code=202)
+async def submit_task_details_job(request: TaskDetailRequest):
+    """
+    generate_task_details をバックグラウンドのジョブとして実行し、すぐにジョブIDを返す。
+    進捗はバッチが完了するたびに {"completed": n, "total": m} で更新される。
+    project_id を指定した場合は、生成した detail をプロジェクトのタスクにも保存する。
+    保存先のタスクは各タスクの task_id（省略時はタスク名と内容の一致）で決め、対応するタスクが無いものは保存しない。
+    """
+    return await submit_job("taskDetail", request.model_dump(exclude_none=True), request.project_id)
+
+
+async def run_task_details_job(job: JobContext, payload: Dict) -> Dict:
+    service = TaskDetailService()
+    tasks = payload["tasks"]
+    results: List[Optional[Dict]] = [None] * len(tasks)
+    completed = 0
+    await job.progress(completed=0, total=len(tasks))
+    async for event in service.astream_task_details(
+        tasks, payload["specification"], batch_size=BATCH_SIZE, deadline_sec=JOB_DEADLINE_SEC
+    ):
+        if event["type"] != "batch":
+            continue
+        for task in event["tasks"]:
+            results[task["task_index"]] = task
+        completed += len(event["tasks"])
+        await job.progress(completed=completed, total=len(tasks))
+    if job.project_id:
+        succeeded = [t if t and not t["detail"].startswith(FAILED_DETAIL_PREFIX) else None for t in results]
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(save_task_details, job.project_id, succeeded)
+            await db.commit()
+    return {"tasks": results}
+
+
+job_queue.register("taskDetail", run_task_details_job)
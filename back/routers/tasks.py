@@ -1,6 +1,15 @@
+import json
 from fastapi import APIRouter, responses
+from typing import Dict, Optional
 from pydantic import BaseModel
-from services.tasks_service import TasksService
+from database import AsyncSessionLocal
+from models.project import Project
+from services.tasks_service import TasksService, FALLBACK_TASK_NAME
+from services.request_context import project_scope
+from services.usage_ledger import usage_ledger
+from services.job_queue import job_queue, JobContext
+from routers.jobs import submit_job
+from routers.projectTasks import parse_task_info, replace_project_tasks, rebuild_project_index
 
 router = APIRouter()
 
@@ -8,13 +17,44 @@ class TasksRequest(BaseModel):
     specification: str
     directory: str
     framework: str
+    project_id: Optional[str] = None  # プロジェクトID（コンテキストキャッシュのキー・ジョブの結果の保存先に使う。省略可）
 
 @router.post("/")
-def generate_tasks(request: TasksRequest):
+async def generate_tasks(request: TasksRequest):
     """
     仕様書、ディレクトリ構成、フレームワーク情報（全てstring）を受け取り、
     アプリ制作に必要な全タスクを、タスク名、優先度（Must, Should, Could）、
     具体的な内容を含むリストとして返すAPI。
     """
-    tasks = TasksService().generate_tasks(request.specification, request.directory, request.framework)
+    # 使用量の上限を大きく超えたプロジェクトは、LLM を呼ぶ前に 429 で断る
+    await usage_ledger.precheck(request.project_id)
+    with project_scope(request.project_id):
+        tasks = await TasksService().agenerate_tasks(request.specification, request.directory, request.framework)
     return responses.JSONResponse(content={"tasks": tasks}, media_type="application/json")
+
+
+@router.post("/jobs", status_code=202)
+async def submit_tasks_job(request: TasksRequest):
+    """
+    generate_tasks をバックグラウンドのジョブとして実行し、すぐにジョブIDを返す。
+    project_id を指定した場合は、生成したタスクでプロジェクトのタスクを置き換える（生成に失敗した場合は置き換えない）。
+    """
+    return await submit_job("tasks", request.model_dump(), request.project_id)
+
+
+async def run_tasks_job(job: JobContext, payload: Dict) -> Dict:
+    tasks = await TasksService().agenerate_tasks(payload["specification"], payload["directory"], payload["framework"])
+    failed = any(task.get("task_name") == FALLBACK_TASK_NAME for task in tasks)
+    if job.project_id and not failed:
+        task_info = [json.dumps(task, ensure_ascii=False) for task in parse_task_info(tasks)]
+        async with AsyncSessionLocal() as db:
+            project = await db.get(Project, job.project_id)
+            if project is not None:
+                project.task_info = task_info
+                await db.run_sync(replace_project_tasks, job.project_id, task_info)
+                await db.run_sync(rebuild_project_index, job.project_id)
+                await db.commit()
+    return {"tasks": tasks}
+
+
+job_queue.register("tasks", run_tasks_job)
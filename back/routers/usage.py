@@ -0,0 +1,76 @@
+# back/routers/usage.py
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from models.usage import LLMUsage
+from services.usage_ledger import usage_ledger
+
+router = APIRouter()
+
+_TOTALS = (
+    func.sum(LLMUsage.calls).label("calls"),
+    func.sum(LLMUsage.input_tokens).label("input_tokens"),
+    func.sum(LLMUsage.output_tokens).label("output_tokens"),
+    func.sum(LLMUsage.cost_usd).label("cost_usd"),
+)
+
+
+def _totals(row) -> dict:
+    return {
+        "calls": row.calls or 0,
+        "input_tokens": row.input_tokens or 0,
+        "output_tokens": row.output_tokens or 0,
+        "cost_usd": round(row.cost_usd or 0.0, 6),
+    }
+
+
+async def _breakdown(db: AsyncSession, column, project_id: Optional[str] = None, limit: Optional[int] = None, by_key: bool = False) -> list:
+    """
+    column ごとの合計を、コストの大きい順（by_key なら column の順）に返す。project_id を渡した場合はそのプロジェクトに絞る。
+    """
+    query = select(column.label("key"), *_TOTALS).group_by(column)
+    query = query.order_by(column) if by_key else query.order_by(desc("cost_usd"), column)
+    if project_id is not None:
+        query = query.where(LLMUsage.project_id == project_id)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = (await db.execute(query)).all()
+    return [{column.key: row.key or None, **_totals(row)} for row in rows]
+
+
+@router.get("/", summary="LLM 使用量の概要")
+async def get_usage(limit: int = Query(20, ge=1, le=200), db: AsyncSession = Depends(get_async_db)):
+    """
+    全体の合計と、使用量の多いプロジェクト（上位 limit 件）・エンドポイント・モデルごとの合計を返す。
+    project_id が null の行はプロジェクトに紐づかない呼び出し。
+    """
+    await run_in_threadpool(usage_ledger.flush)
+    total = (await db.execute(select(*_TOTALS))).one()
+    return {
+        "total": _totals(total),
+        "projects": await _breakdown(db, LLMUsage.project_id, limit=limit),
+        "endpoints": await _breakdown(db, LLMUsage.endpoint),
+        "models": await _breakdown(db, LLMUsage.model),
+        "ledger": usage_ledger.stats(),
+    }
+
+
+@router.get("/projects/{project_id}", summary="プロジェクトの LLM 使用量")
+async def get_project_usage(project_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    プロジェクトの合計と、エンドポイント・サービス・モデル・日ごとの内訳、予算の状況を返す。
+    """
+    await run_in_threadpool(usage_ledger.flush)
+    total = (await db.execute(select(*_TOTALS).where(LLMUsage.project_id == project_id))).one()
+    return {
+        "project_id": project_id,
+        "total": _totals(total),
+        "endpoints": await _breakdown(db, LLMUsage.endpoint, project_id),
+        "services": await _breakdown(db, LLMUsage.service, project_id),
+        "models": await _breakdown(db, LLMUsage.model, project_id),
+        "days": await _breakdown(db, LLMUsage.day, project_id, by_key=True),
+        "budget": await run_in_threadpool(usage_ledger.status, project_id),
+    }
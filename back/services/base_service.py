@@ -1,14 +1,25 @@
 import os
+import json
 import time
 import logging
 import tomllib
 from dotenv import load_dotenv
 
-# LangChain & Model
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_anthropic import ChatAnthropic
-from typing import List, Dict
+# LLM クライアント（プロセス共有レジストリ）
+from typing import List, Dict, Optional, AsyncIterator
+from .llm_registry import get_llm
+from .llm_cache import llm_cache, make_cache_key
+from .llm_scheduler import llm_scheduler, is_rate_limited, DeadlineExceeded
+from .llm_router import llm_router
+from .llm_cassette import llm_cassette, cassette_key
+from .prompt_registry import prompt_registry
+from .context_cache import context_cache
+from .request_context import current_project_id
+from .usage_ledger import usage_ledger, DOWNGRADE
+from . import telemetry
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
 
 from json_repair import repair_json
 
@@ -16,68 +27,413 @@ load_dotenv("/workspaces/hackson_support_agent/back/.env.local")
 
 logger = logging.getLogger(__name__)
 
+# 用途ごとのモデル名
+MODEL_NAMES = {
+    "pro": "gemini-2.5-pro-preview-05-06",
+    "flash": "gemini-2.0-flash",
+    "flash_thinking": "gemini-2.0-flash-thinking-exp",
+    "lite": "gemini-2.0-flash-lite",
+}
+
+# サービスが使うデフォルトのプロバイダ（"fake" にするとネットワークを使わずに動作する）
+DEFAULT_PROVIDER = os.getenv("LLM_DEFAULT_PROVIDER", "google")
+
+# モデル名から用途への逆引き（ルーティング設定の参照に使う）
+_TIERS_BY_MODEL = {model: tier for tier, model in MODEL_NAMES.items()}
+
+# with_structured_output（ツール呼び出し / JSON スキーマモード）を使うかどうか
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# 構造化出力に対応していないことが分かったモデル（以降はテキスト生成のみを使う）
+_structured_unsupported = set()
+
 class BaseService:
-    def __init__(self,defult_model_provider: str = "google"):
+    # 応答キャッシュの有効期限（秒）。None の場合はキャッシュしない。サブクラスで上書きする
+    cache_ttl_sec: Optional[int] = None
+
+    def __init__(self,defult_model_provider: str = DEFAULT_PROVIDER):
         """
         model_provider: モデルのプロバイダを指定する。デフォルトはGoogle。
         - google: Google Gemini
         - openai: OpenAI
         - anthropic: Anthropic
+        - fake: ネットワークを使わないテスト用モデル
         
         などのデフォルトプロパイダーを指定することが出来る
         もし必要ならば、プロバイダーを増加させることも継承クラスで行うことが可能になる。
         """
         
+        self.model_provider = defult_model_provider
+
         # プロンプトの読み込み
         # with open("./prompts.toml", "rb") as f:
         #     self.prompts = tomllib.load(f)
-        
-        # AIモデルの初期化
-        
-        # proモデル
-        self.llm_pro = self._load_llm(defult_model_provider,"gemini-2.5-pro-preview-05-06")
-        # flashモデル
-        self.llm_flash = self._load_llm(defult_model_provider,"gemini-2.0-flash")
-        # flash-thinkingモデル 仕様運転版
-        self.llm_flash_thinking = self._load_llm(defult_model_provider,"gemini-2.0-flash-thinking-exp")
-        # flash-liteモデル
-        self.llm_lite = self._load_llm(defult_model_provider,"ggemini-2.0-flash-lite")
-    
-    def _load_llm(self,model_provider ,model_type: str,temperature=0.5):
-        
-        match model_provider:
-            case "google":
-                api_key = os.getenv("GOOGLE_API_KEY")
-                return ChatGoogleGenerativeAI(
-                    model=model_type,
-                    temperature=temperature,
-                    api_key=api_key
-                )
-            case "openai":
-                api_key = os.getenv("OPENAI_API_KEY")
-                return ChatOpenAI(
-                    model=model_type,
-                    temperature=temperature,
-                    openai_api_key=api_key
-                )
-            case "anthropic":
-                api_key = os.getenv("ANTHROPIC_API_KEY")
-                return ChatAnthropic(
-                    model=model_type,
-                    temperature=temperature,
-                    anthropic_api_key=api_key
-                )
-    
+
+        # AIモデルはプロセス共有のレジストリから遅延取得する（下記プロパティ参照）
+
+    # proモデル
+    @property
+    def llm_pro(self):
+        return self._load_llm(self.model_provider, MODEL_NAMES["pro"])
+
+    # flashモデル
+    @property
+    def llm_flash(self):
+        return self._load_llm(self.model_provider, MODEL_NAMES["flash"])
+
+    # flash-thinkingモデル 仕様運転版
+    @property
+    def llm_flash_thinking(self):
+        return self._load_llm(self.model_provider, MODEL_NAMES["flash_thinking"])
+
+    # flash-liteモデル
+    @property
+    def llm_lite(self):
+        return self._load_llm(self.model_provider, MODEL_NAMES["lite"])
+
+    def _load_llm(self, model_provider, model_type: str, temperature=0.5):
+        """
+        共有レジストリから LLM クライアントを取得する。
+        同じ (provider, model, temperature) であれば、プロセス内で同一インスタンスが返る。
+        """
+        return get_llm(model_provider, model_type, temperature)
+
+    def _managed(self, llm, validate=None, schema=None):
+        """
+        LLM を共通の呼び出し制御付きの Runnable で包む。チェーン内の LLM は必ずこれを通す。
+        - 非同期呼び出しは共有スケジューラ（レート制限・同時実行数の調整・429 時の再試行）を経由する
+        - cache_ttl_sec が設定されたサービスでは、展開済みプロンプトとモデル設定が同じ呼び出しに
+          保存済みの応答を返す。validate を渡した場合、応答本文に対して例外を送出しなかったものだけを保存する
+        - schema（Pydantic モデル）を渡した場合は with_structured_output で生成し、結果を JSON 文字列の
+          AIMessage として返す。モデルが対応していない・スキーマに合わない場合はテキスト生成にフォールバックする
+        - 先頭の system メッセージ（context_prompt で作った安定したコンテキスト）はプロバイダ側でキャッシュする
+        - LLM_ROUTES で用途にモデル候補を設定した場合は、候補の間でフォールバック・ヘッジを行う（llm_router 参照）
+        - LLM_CASSETTE_MODE を設定した場合は、応答をカセットに記録・再生する（llm_cassette 参照）
+        - 使用量が上限を超えたプロジェクトの呼び出しは llm_lite に切り替えるか拒否する（usage_ledger 参照）。
+          切り替えた応答は本来のモデルの応答ではないため、キャッシュ・カセットには保存しない
+        """
+
+        def invoke(prompt_value):
+            key = self._cache_key(llm, prompt_value, schema) if self.cache_ttl_sec else None
+            cached = self._cached(key)
+            if cached is not None:
+                return AIMessage(content=cached)
+            tape_key = self._cassette_key(llm, prompt_value, schema)
+            entry = self._replay_entry(tape_key)
+            downgraded = False
+            if entry is not None:
+                message = AIMessage(content=llm_cassette.replay(entry))
+            else:
+                budgeted = self._budgeted(llm)
+                downgraded = budgeted is not llm
+                started = time.monotonic()
+                message = llm_router.run(self._candidates(budgeted), lambda chosen: self._generate(chosen, prompt_value, schema))
+                if tape_key and not downgraded:
+                    self._record_cassette(tape_key, llm, message, time.monotonic() - started)
+            if key and not downgraded:
+                self._store_cache(key, message.content, validate)
+            return message
+
+        async def ainvoke(prompt_value):
+            key = self._cache_key(llm, prompt_value, schema) if self.cache_ttl_sec else None
+            cached = await self._acached(key)
+            if cached is not None:
+                return AIMessage(content=cached)
+            tape_key = self._cassette_key(llm, prompt_value, schema)
+            entry = self._replay_entry(tape_key)
+            downgraded = False
+            if entry is not None:
+                message = AIMessage(content=await llm_cassette.areplay(entry))
+            else:
+                await usage_ledger.preload(current_project_id())
+                budgeted = self._budgeted(llm)
+                downgraded = budgeted is not llm
+                started = time.monotonic()
+                message = await llm_router.arun(self._candidates(budgeted), lambda chosen: self._agenerate(chosen, prompt_value, schema))
+                if tape_key and not downgraded:
+                    self._record_cassette(tape_key, llm, message, time.monotonic() - started)
+            if key and not downgraded:
+                await self._astore_cache(key, message.content, validate)
+            return message
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"managed_{self._model_name(llm)}")
+
+    def _generate(self, llm, prompt_value, schema=None):
+        """
+        1つのモデルで応答を生成する。schema があれば構造化出力を試し、駄目ならテキスト生成を使う。
+        """
+        structured = self._structured_llm(llm, schema)
+        if structured is not None:
+            try:
+                messages = context_cache.annotate(llm, prompt_value)
+                message = self._structured_message(structured.invoke(messages, config=self._call_config(llm)))
+                if message is not None:
+                    return message
+            except Exception as e:
+                self._structured_failed(llm, e)
+        return self._invoke_text(llm, prompt_value)
+
+    async def _agenerate(self, llm, prompt_value, schema=None):
+        """
+        _generate の非同期版。呼び出しは共有スケジューラを経由する。
+        """
+        structured = self._structured_llm(llm, schema)
+        if structured is not None:
+            try:
+                messages = context_cache.annotate(llm, prompt_value)
+                result = await llm_scheduler.run(self._lane_key(llm), lambda: structured.ainvoke(messages, config=self._call_config(llm)))
+                message = self._structured_message(result)
+                if message is not None:
+                    return message
+            except Exception as e:
+                self._structured_failed(llm, e)
+        return await self._ainvoke_text(llm, prompt_value)
+
+    def _budgeted(self, llm):
+        """
+        処理中のプロジェクトの使用量が上限を超えていれば llm_lite を返す（大きく超えていれば BudgetExceeded）。
+        """
+        if usage_ledger.check(current_project_id()) != DOWNGRADE:
+            return llm
+        temperature = getattr(llm, "temperature", None)
+        lite = self._load_llm(self.model_provider, MODEL_NAMES["lite"], 0.5 if temperature is None else temperature)
+        if self._model_name(lite) == self._model_name(llm):
+            return llm
+        logger.info("プロジェクト %s の使用量が上限を超えたため %s に切り替えます", current_project_id(), self._model_name(lite))
+        return lite
+
+    def _candidates(self, llm) -> List:
+        """
+        llm の用途に設定されたモデル候補を (lane_key, llm) のリストで返す。設定が無ければ llm だけ。
+        """
+        routes = llm_router.routes(_TIERS_BY_MODEL.get(self._model_name(llm)))
+        if not routes:
+            return [(self._lane_key(llm), llm)]
+        temperature = getattr(llm, "temperature", None)
+        temperature = 0.5 if temperature is None else temperature
+        candidates = [self._load_llm(provider, model, temperature) for provider, model in routes]
+        return [(self._lane_key(candidate), candidate) for candidate in candidates]
+
+    async def _astream_text(self, prompt, llm, inputs: Dict, use_cache: bool = False) -> AsyncIterator[Dict]:
+        """
+        prompt | llm をトークン単位でストリーミングし、イベントの dict を順に返す。
+        - {"type": "token", "content": "..."}: テキストの差分
+        - {"type": "done", "content": "<全文>", "usage": {...}, "cached": bool}: 最終イベント
+        use_cache が True かつ cache_ttl_sec が設定されている場合は、キャッシュの参照と保存も行う。
+        """
+        prompt_value = await prompt.ainvoke(inputs)
+        key = None
+        if use_cache and self.cache_ttl_sec:
+            key = self._cache_key(llm, prompt_value)
+            cached = await self._acached(key)
+            if cached is not None:
+                yield {"type": "token", "content": cached}
+                yield {"type": "done", "content": cached, "usage": None, "cached": True}
+                return
+
+        tape_key = self._cassette_key(llm, prompt_value)
+        entry = self._replay_entry(tape_key)
+        if entry is not None:
+            async for piece in llm_cassette.astream(entry):
+                yield {"type": "token", "content": piece}
+            yield {"type": "done", "content": entry["content"], "usage": entry.get("usage"), "cached": False}
+            return
+
+        # ストリーミングは途中から再試行できないため、同時実行枠の確保だけをスケジューラに任せる。
+        # 最初のトークンを返す前に失敗した場合に限り、次の候補のモデルにフォールバックする
+        await usage_ledger.preload(current_project_id())
+        budgeted = self._budgeted(llm)
+        downgraded = budgeted is not llm
+        error = None
+        stream_started = time.monotonic()
+        first_token_sec = None
+        for lane_key, chosen in llm_router.order(self._candidates(budgeted)):
+            started = time.monotonic()
+            emitted = False
+            full = None
+            try:
+                messages, call_kwargs = await context_cache.aprepare(chosen, prompt_value)
+                lane = llm_scheduler.lane(lane_key)
+                await lane.acquire()
+                try:
+                    async for chunk in chosen.astream(messages, config=self._call_config(chosen), **call_kwargs):
+                        full = chunk if full is None else full + chunk
+                        if chunk.content:
+                            if first_token_sec is None:
+                                first_token_sec = time.monotonic() - stream_started
+                            emitted = True
+                            yield {"type": "token", "content": chunk.content}
+                finally:
+                    await lane.release()
+            except Exception as e:
+                llm_router.record(lane_key, time.monotonic() - started, ok=False)
+                if emitted or isinstance(e, DeadlineExceeded):
+                    raise
+                logger.warning("ストリーミングに失敗したため次の候補を試します %s: %s", lane_key, e)
+                error = e
+                continue
+            llm_router.record(lane_key, time.monotonic() - started, ok=True)
+            break
+        else:
+            raise error
+
+        content = full.content if full is not None else ""
+        usage = getattr(full, "usage_metadata", None) if full is not None else None
+        if key is not None and not downgraded:
+            await self._astore_cache(key, content)
+        if tape_key and not downgraded:
+            llm_cassette.record(
+                tape_key, self._model_name(llm), content, time.monotonic() - stream_started,
+                first_token_sec=first_token_sec, usage=dict(usage) if usage else None,
+            )
+        yield {"type": "done", "content": content, "usage": dict(usage) if usage else None, "cached": False}
+
+    def _invoke_text(self, llm, prompt_value):
+        messages, call_kwargs = context_cache.prepare(llm, prompt_value)
+        try:
+            return llm.invoke(messages, config=self._call_config(llm), **call_kwargs)
+        except Exception:
+            if not call_kwargs:
+                raise
+            # キャッシュの期限切れなどで失敗した場合は、キャッシュを捨ててコンテキストごと送り直す
+            context_cache.invalidate(llm, prompt_value)
+            return llm.invoke(prompt_value, config=self._call_config(llm))
+
+    async def _ainvoke_text(self, llm, prompt_value):
+        lane_key = self._lane_key(llm)
+        messages, call_kwargs = await context_cache.aprepare(llm, prompt_value)
+        try:
+            return await llm_scheduler.run(lane_key, lambda: llm.ainvoke(messages, config=self._call_config(llm), **call_kwargs))
+        except Exception as e:
+            if not call_kwargs or isinstance(e, DeadlineExceeded) or is_rate_limited(e):
+                raise
+            context_cache.invalidate(llm, prompt_value)
+            return await llm_scheduler.run(lane_key, lambda: llm.ainvoke(prompt_value, config=self._call_config(llm)))
+
+    def _structured_llm(self, llm, schema):
+        """
+        llm.with_structured_output(schema) を返す。使わない・使えない場合は None。
+        生成した Runnable はプロンプトレジストリに保存して使い回す。
+        """
+        if schema is None or not STRUCTURED_OUTPUT or self._lane_key(llm) in _structured_unsupported:
+            return None
+        try:
+            return prompt_registry.get(("structured", id(llm), schema), lambda: llm.with_structured_output(schema))
+        except NotImplementedError:
+            logger.info("構造化出力に未対応のモデルです。テキスト生成を使います: %s", self._model_name(llm))
+            _structured_unsupported.add(self._lane_key(llm))
+            return None
+
+    def _structured_message(self, result) -> Optional[AIMessage]:
+        if result is None:
+            return None
+        data = result.model_dump() if hasattr(result, "model_dump") else result
+        return AIMessage(content=json.dumps(data, ensure_ascii=False))
+
+    def _structured_failed(self, llm, error: Exception):
+        # 締め切り超過とレート制限はテキスト生成で再度呼んでも解消しないため、そのまま送出する
+        if isinstance(error, DeadlineExceeded) or is_rate_limited(error):
+            raise error
+        if isinstance(error, NotImplementedError):
+            _structured_unsupported.add(self._lane_key(llm))
+        else:
+            telemetry.record_parse_failure(type(self).__name__, "structured")
+        logger.warning("構造化出力に失敗したためテキスト生成にフォールバックします: %s", error)
+
+    def _store_cache(self, key: str, content: str, validate=None):
+        if self._cacheable(content, validate):
+            llm_cache.set(key, content, self.cache_ttl_sec)
+
+    async def _astore_cache(self, key: str, content: str, validate=None):
+        if self._cacheable(content, validate):
+            await llm_cache.aset(key, content, self.cache_ttl_sec)
+
+    def _cacheable(self, content: str, validate=None) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+        except Exception as e:
+            telemetry.record_parse_failure(type(self).__name__, "validate")
+            logger.debug("検証に失敗した応答はキャッシュしません: %s", e)
+            return False
+        return True
+
+    def _cached(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        return self._record_lookup(key, llm_cache.get(key))
+
+    async def _acached(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        return self._record_lookup(key, await llm_cache.aget(key))
+
+    def _record_lookup(self, key: str, cached: Optional[str]) -> Optional[str]:
+        telemetry.record_cache_lookup(type(self).__name__, "response", cached is not None)
+        if cached is not None:
+            logger.debug("LLMキャッシュにヒットしました: %s", key)
+        return cached
+
+    def _replay_entry(self, tape_key: Optional[str]) -> Optional[Dict]:
+        if not tape_key:
+            return None
+        entry = llm_cassette.lookup(tape_key)
+        if llm_cassette.replaying:
+            telemetry.record_cache_lookup(type(self).__name__, "cassette", entry is not None)
+        return entry
+
+    def _call_config(self, llm) -> Dict:
+        """
+        LLM 呼び出しに渡す設定。呼び出し時間・トークン数の計測とトレースのコールバックを付ける。
+        """
+        return {"callbacks": [telemetry.LLMCallHandler(type(self).__name__, self._model_name(llm))]}
+
+    def _cassette_key(self, llm, prompt_value, schema=None) -> Optional[str]:
+        if not llm_cassette.enabled:
+            return None
+        return cassette_key(self._model_name(llm), self._prompt_text(prompt_value), schema)
+
+    def _record_cassette(self, tape_key: str, llm, message, latency_sec: float):
+        usage = getattr(message, "usage_metadata", None)
+        llm_cassette.record(tape_key, self._model_name(llm), message.content, latency_sec, usage=dict(usage) if usage else None)
+
+    def _prompt_text(self, prompt_value) -> str:
+        return prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+
+    def _cache_key(self, llm, prompt_value, schema=None) -> str:
+        prompt = self._prompt_text(prompt_value)
+        params = {"provider": type(llm).__name__, "temperature": getattr(llm, "temperature", None)}
+        if schema is not None:
+            params["schema"] = schema.__name__
+        return make_cache_key(self._model_name(llm), prompt, params)
+
+    def _lane_key(self, llm):
+        return (type(llm).__name__, self._model_name(llm))
+
+    def _model_name(self, llm) -> str:
+        name = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+        # Gemini のクライアントは "models/" を付けた名前を返すため、MODEL_NAMES と同じ表記に揃える
+        return name.removeprefix("models/")
+
     def _repair_json(self, raw: str) -> str:
         """
         生の LLM 応答を json_repair で修復し、修復後の文字列を返す。
+        構造化出力などで既に有効な JSON の場合は修復せずにそのまま返す。
         失敗時にはエラーをログに出して例外を再スロー。
         """
+        try:
+            json.loads(raw)
+            return raw
+        except (TypeError, ValueError):
+            pass
         try:
             repaired = repair_json(raw)
+            telemetry.record_json_repair(type(self).__name__)
             logger.debug("JSON repaired successfully: %s", repaired)
             return repaired
         except Exception as e:
+            telemetry.record_parse_failure(type(self).__name__, "repair")
             logger.error("json_repair に失敗しました: %s", e, exc_info=True)
             raise
 
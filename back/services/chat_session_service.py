@@ -0,0 +1,86 @@
+import os
+from typing import Dict, List, Tuple
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from .base_service import BaseService
+from .prompt_registry import compiled
+
+# プロンプトにそのまま載せる直近の会話のトークン数の上限（目安）
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# 古い会話の要約の最大文字数
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "800"))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の簡易見積もり。ASCII は約4文字で1トークン、日本語などはおおむね1文字1トークンとみなす。
+    プロバイダの API を呼ばずに履歴の長さを判定するために使う。
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+class ChatSessionService(BaseService):
+    """
+    サーバー側で保持する taskChat の会話履歴を、プロンプトに載せる形に整える。
+    直近の発言はトークン予算内でそのまま使い、予算からあふれた古い発言は llm_lite で要約に畳み込む。
+    発言の保存・読み込みは呼び出し側（routers/taskChat.py）が行う。
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    def split_window(self, turns: List[Dict], budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> Tuple[List[Dict], List[Dict]]:
+        """
+        発言のリスト（古い順）を (要約に回す古い発言, そのまま使う直近の発言) に分ける。
+        直近の発言は予算を超えても最低1件は残す。
+        """
+        used = 0
+        start = len(turns)
+        for i in range(len(turns) - 1, -1, -1):
+            used += estimate_tokens(turns[i]["content"])
+            if used > budget and start < len(turns):
+                break
+            start = i
+        return turns[:start], turns[start:]
+
+    def format_history(self, summary: str, window: List[Dict]) -> str:
+        recent = "\n".join(f"{turn['role']}:{turn['content']}" for turn in window)
+        if not summary:
+            return recent
+        return f"これまでの会話の要約:\n{summary}\n\n直近の会話:\n{recent}"
+
+    def summarize(self, summary: str, turns: List[Dict]) -> str:
+        """
+        これまでの要約に古い発言を畳み込んだ新しい要約を返す。
+        """
+        return self._summary_chain().invoke(self._summary_inputs(summary, turns))
+
+    async def asummarize(self, summary: str, turns: List[Dict]) -> str:
+        """
+        summarize の非同期版。
+        """
+        return await self._summary_chain().ainvoke(self._summary_inputs(summary, turns))
+
+    def _summary_inputs(self, summary: str, turns: List[Dict]) -> Dict:
+        return {
+            "summary": summary or "（なし）",
+            "turns": "\n".join(f"{turn['role']}:{turn['content']}" for turn in turns),
+            "max_chars": CHAT_SUMMARY_MAX_CHARS,
+        }
+
+    @compiled
+    def _summary_chain(self):
+        prompt_template = ChatPromptTemplate.from_template(
+            template="""
+            以下はエンジニアとサポートChatBotの会話の一部です。
+            これまでの要約と新しい発言を統合し、今後の回答に必要な情報（ユーザーの目的、決まったこと、
+            試したこと・発生したエラー、未解決の質問）が分かる要約を作成してください。
+            要約は{max_chars}文字以内の日本語の箇条書きで、要約以外の内容は出力しないでください。
+            これまでの要約:
+            {summary}
+            新しい発言:
+            {turns}
+            """
+        )
+        return prompt_template | self._managed(self.llm_lite) | StrOutputParser()
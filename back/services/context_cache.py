@@ -0,0 +1,313 @@
+import os
+import time
+import hashlib
+import logging
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain.prompts import PromptTemplate
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.runnables import RunnableLambda
+
+from .request_context import current_project_id
+
+logger = logging.getLogger(__name__)
+
+# ローカルに保持する展開済みコンテキスト（system メッセージ）の最大件数
+PREFIX_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_PREFIX_CACHE_MAX_ENTRIES", "256"))
+# プロバイダ側のコンテキストキャッシュを使うかどうか
+PROVIDER_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "true").lower() in ("1", "true", "yes")
+# Gemini の cached content の有効期限（秒）
+GEMINI_CONTEXT_CACHE_TTL_SEC = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SEC", "3600"))
+# Gemini はキャッシュできる最小トークン数があるため、短いコンテキストではキャッシュを作らない
+GEMINI_CONTEXT_CACHE_MIN_CHARS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_CHARS", "4096"))
+# キャッシュ作成に失敗したコンテキストを再試行するまでの時間（秒）
+CONTEXT_CACHE_RETRY_SEC = int(os.getenv("CONTEXT_CACHE_RETRY_SEC", "600"))
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PrefixCache:
+    """
+    展開済みのコンテキスト文字列を (テンプレート, 入力値) ごとに保持する LRU。
+    同じ仕様書に対する呼び出しでは、テンプレートの展開をやり直さずに同じ文字列を使う。
+    """
+
+    def __init__(self, max_entries: int = PREFIX_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template: PromptTemplate, inputs: Dict[str, str]) -> str:
+        key = _hash(template.template + "\0" + "\0".join(f"{k}={inputs[k]}" for k in sorted(inputs)))
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = template.format(**inputs)
+        with self._lock:
+            self._entries[key] = text
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return text
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+prefix_cache = PrefixCache()
+
+# 共通コンテキストに含める項目（変数名 → 見出し）。この順で並べるため、同じ項目を使うサービス間で先頭が一致する
+PROJECT_CONTEXT_FIELDS = {
+    "specification": "仕様書",
+    "framework": "フレームワーク",
+    "directory": "ディレクトリ構成",
+    "directory_structure": "ディレクトリ構成",
+}
+
+
+def project_context(*variables: str) -> str:
+    """
+    仕様書などプロジェクト単位で変わらない情報だけからなる system テンプレートを作る。
+    """
+    ordered = sorted(variables, key=list(PROJECT_CONTEXT_FIELDS).index)
+    sections = "\n".join(f"【{PROJECT_CONTEXT_FIELDS[v]}】\n{{{v}}}" for v in ordered)
+    return "以下は開発中のハッカソンプロジェクトの共通情報です。\n" + sections
+
+
+def context_prompt(system_template: str, human_template: str, partial_variables: Optional[Dict[str, str]] = None):
+    """
+    安定したコンテキスト（仕様書・ディレクトリ構成など）を先頭の system メッセージに、
+    呼び出しごとに変わる内容を後続の human メッセージに置くプロンプトを作る。
+    先頭が毎回同じになるため、プロバイダのコンテキストキャッシュ（ContextCacheManager）が効く。
+    ChatPromptTemplate と同じく dict を受け取り ChatPromptValue を返す Runnable。
+    """
+    partial_variables = partial_variables or {}
+    system = PromptTemplate.from_template(textwrap.dedent(system_template).strip())
+    human = PromptTemplate.from_template(textwrap.dedent(human_template).strip())
+
+    def _values(template: PromptTemplate, inputs: Dict) -> Dict[str, str]:
+        return {k: inputs[k] if k in inputs else partial_variables[k] for k in template.input_variables}
+
+    # プロバイダ側のキャッシュを system テンプレートごとに分けて持つための識別子
+    context_id = "context-" + _hash(system.template)[:16]
+
+    def render(inputs: Dict) -> ChatPromptValue:
+        return ChatPromptValue(messages=[
+            SystemMessage(content=prefix_cache.render(system, _values(system, inputs)), id=context_id),
+            HumanMessage(content=human.format(**_values(human, inputs))),
+        ])
+
+    async def arender(inputs: Dict) -> ChatPromptValue:
+        return render(inputs)
+
+    return RunnableLambda(render, afunc=arender, name="ContextPrompt")
+
+
+class _GeminiCache:
+    __slots__ = ("prefix_hash", "name", "expires_at")
+
+    def __init__(self, prefix_hash: str, name: str, expires_at: float):
+        self.prefix_hash = prefix_hash
+        self.name = name
+        self.expires_at = expires_at
+
+
+class ContextCacheManager:
+    """
+    先頭の system メッセージ（安定したコンテキスト）をプロバイダ側でキャッシュする。
+    - Anthropic: system メッセージに cache_control を付ける（プロンプトキャッシュ）
+    - Gemini: system メッセージから cached content を作成し、以降の呼び出しでは cached_content を指定して
+      system メッセージを送らない。キャッシュはプロジェクト（無ければコンテキストのハッシュ）・モデル・
+      system テンプレートごとに1つ保持し、仕様書などが変わったら作り直す
+    どちらにも当てはまらない場合や作成に失敗した場合はメッセージをそのまま返す。
+    google-genai が無い環境では Gemini のキャッシュは使わない。
+    """
+
+    def __init__(self):
+        self._gemini: Dict[Tuple[str, str, str], _GeminiCache] = {}
+        self._failed: Dict[str, float] = {}
+        self._creating = set()
+        self._client = None
+        self._lock = threading.Lock()
+        self.provider_hits = 0
+        self.provider_creates = 0
+        self.provider_failures = 0
+
+    # ---- 呼び出し前の変換 ----
+
+    def prepare(self, llm, prompt_value) -> Tuple[List[BaseMessage], Dict]:
+        messages, system, target = self._split(llm, prompt_value)
+        if target == "gemini":
+            if self._lookup_gemini(llm, system) is None and self._should_create(system):
+                self._create_gemini(llm, system)
+            return self._use_gemini(llm, messages, system)
+        return self._apply(messages, system, target), {}
+
+    async def aprepare(self, llm, prompt_value) -> Tuple[List[BaseMessage], Dict]:
+        messages, system, target = self._split(llm, prompt_value)
+        if target == "gemini":
+            if self._lookup_gemini(llm, system) is None and self._should_create(system):
+                await self._acreate_gemini(llm, system)
+            return self._use_gemini(llm, messages, system)
+        return self._apply(messages, system, target), {}
+
+    def annotate(self, llm, prompt_value) -> List[BaseMessage]:
+        """
+        呼び出し引数を変えずに済む変換（Anthropic の cache_control）だけを適用したメッセージを返す。
+        ツール呼び出しと cached content を併用できない構造化出力の呼び出しで使う。
+        """
+        messages, system, target = self._split(llm, prompt_value)
+        return self._apply(messages, system, target)
+
+    def invalidate(self, llm, prompt_value):
+        """
+        cached_content を付けた呼び出しが失敗したとき（期限切れ・削除済みなど）に、そのキャッシュを捨てる。
+        """
+        _, system, _ = self._split(llm, prompt_value)
+        if system is not None:
+            with self._lock:
+                self._gemini.pop(self._scope_key(llm, system), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **{f"prefix_{k}": v for k, v in prefix_cache.stats().items()},
+            "provider_hits": self.provider_hits,
+            "provider_creates": self.provider_creates,
+            "provider_failures": self.provider_failures,
+            "provider_entries": len(self._gemini),
+        }
+
+    # ---- 内部処理 ----
+
+    def _split(self, llm, prompt_value) -> Tuple[List[BaseMessage], Optional[SystemMessage], Optional[str]]:
+        messages = prompt_value.to_messages() if hasattr(prompt_value, "to_messages") else list(prompt_value)
+        system = messages[0] if messages and isinstance(messages[0], SystemMessage) else None
+        if not PROVIDER_CONTEXT_CACHE or system is None or not isinstance(system.content, str):
+            return messages, None, None
+        provider = type(llm).__name__
+        if provider == "ChatAnthropic":
+            return messages, system, "anthropic"
+        if provider == "ChatGoogleGenerativeAI":
+            return messages, system, "gemini"
+        return messages, system, None
+
+    def _apply(self, messages, system: Optional[SystemMessage], target: Optional[str]):
+        if target != "anthropic":
+            return messages
+        cached_system = SystemMessage(
+            content=[{"type": "text", "text": system.content, "cache_control": {"type": "ephemeral"}}],
+            id=system.id,
+        )
+        return [cached_system] + list(messages[1:])
+
+    def _scope_key(self, llm, system: SystemMessage) -> Tuple[str, str, str]:
+        return (current_project_id() or _hash(system.content), self._model(llm), system.id or "")
+
+    def _model(self, llm) -> str:
+        model = getattr(llm, "model", "")
+        return model if model.startswith("models/") else f"models/{model}"
+
+    def _lookup_gemini(self, llm, system: Optional[SystemMessage]) -> Optional[_GeminiCache]:
+        if system is None:
+            return None
+        entry = self._gemini.get(self._scope_key(llm, system))
+        if entry and entry.prefix_hash == _hash(system.content) and entry.expires_at > time.time() + 30:
+            return entry
+        return None
+
+    def _should_create(self, system: Optional[SystemMessage]) -> bool:
+        if system is None or len(system.content) < GEMINI_CONTEXT_CACHE_MIN_CHARS:
+            return False
+        prefix_hash = _hash(system.content)
+        if self._failed.get(prefix_hash, 0) > time.time() or prefix_hash in self._creating:
+            return False
+        return self._gemini_client() is not None
+
+    def _use_gemini(self, llm, messages, system):
+        entry = self._lookup_gemini(llm, system)
+        if entry is None:
+            return messages, {}
+        self.provider_hits += 1
+        # cached content に system instruction が含まれるため、先頭の system メッセージは送らない
+        return list(messages[1:]), {"cached_content": entry.name}
+
+    def _cache_config(self, system: SystemMessage):
+        from google.genai import types
+        return types.CreateCachedContentConfig(
+            system_instruction=system.content,
+            ttl=f"{GEMINI_CONTEXT_CACHE_TTL_SEC}s",
+            display_name=f"{system.id or 'context'}-{current_project_id() or _hash(system.content)[:16]}",
+        )
+
+    def _create_gemini(self, llm, system: SystemMessage):
+        prefix_hash = _hash(system.content)
+        self._creating.add(prefix_hash)
+        try:
+            cache = self._gemini_client().caches.create(model=self._model(llm), config=self._cache_config(system))
+            old = self._register(llm, system, cache.name)
+            if old is not None:
+                self._gemini_client().caches.delete(name=old)
+        except Exception as e:
+            self._create_failed(prefix_hash, e)
+        finally:
+            self._creating.discard(prefix_hash)
+
+    async def _acreate_gemini(self, llm, system: SystemMessage):
+        prefix_hash = _hash(system.content)
+        self._creating.add(prefix_hash)
+        try:
+            cache = await self._gemini_client().aio.caches.create(model=self._model(llm), config=self._cache_config(system))
+            old = self._register(llm, system, cache.name)
+            if old is not None:
+                await self._gemini_client().aio.caches.delete(name=old)
+        except Exception as e:
+            self._create_failed(prefix_hash, e)
+        finally:
+            self._creating.discard(prefix_hash)
+
+    def _register(self, llm, system: SystemMessage, name: str) -> Optional[str]:
+        """
+        作成したキャッシュを登録し、置き換えられた古いキャッシュの名前を返す（仕様書などが更新された場合）。
+        """
+        key = self._scope_key(llm, system)
+        with self._lock:
+            old = self._gemini.get(key)
+            self._gemini[key] = _GeminiCache(_hash(system.content), name, time.time() + GEMINI_CONTEXT_CACHE_TTL_SEC)
+        self.provider_creates += 1
+        logger.info("コンテキストキャッシュを作成しました: %s %s", name, key)
+        return old.name if old is not None and old.name != name else None
+
+    def _create_failed(self, prefix_hash: str, error: Exception):
+        self.provider_failures += 1
+        self._failed[prefix_hash] = time.time() + CONTEXT_CACHE_RETRY_SEC
+        logger.warning("コンテキストキャッシュを作成できませんでした（通常の呼び出しを続けます）: %s", error)
+
+    def _gemini_client(self):
+        if self._client is None:
+            try:
+                from google import genai
+            except ImportError:
+                logger.info("google-genai が無いため Gemini のコンテキストキャッシュは使いません")
+                self._client = False
+                return None
+            try:
+                self._client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+            except Exception as e:
+                logger.warning("Gemini クライアントを作成できないためコンテキストキャッシュは使いません: %s", e)
+                self._client = False
+        return self._client or None
+
+
+# プロセス全体で共有するマネージャ
+context_cache = ContextCacheManager()
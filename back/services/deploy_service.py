@@ -1,18 +1,69 @@
-from langchain.prompts import PromptTemplate, ChatPromptTemplate
+from langchain.prompts import PromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
 # json_repair
 from json_repair import repair_json
 from copy import deepcopy
+import logging
+
+logger = logging.getLogger(__name__)
 
 class DeployService(BaseService):
+    # 同じ仕様書・フレームワークに対する生成結果は1日キャッシュする
+    cache_ttl_sec = 60 * 60 * 24
+
     def __init__(self):
         super().__init__()
 
     def generate_deploy_service(self, specification:str ,framework :str):
         """
-        
+        仕様書とフレームワーク情報から、最適なデプロイサービスの提案を Markdown で生成する。
+        """
+        chain = self._deploy_chain()
+        result = chain.invoke({"specification": specification, "framework": framework})
+        return self._strip_code_fence(result)
+
+    async def agenerate_deploy_service(self, specification: str, framework: str):
+        """
+        generate_deploy_service の非同期版。
+        """
+        chain = self._deploy_chain()
+        result = await chain.ainvoke({"specification": specification, "framework": framework})
+        return self._strip_code_fence(result)
+
+    def astream_deploy_service(self, specification: str, framework: str):
+        """
+        generate_deploy_service のストリーミング版。
+        JSON ではストリーム途中の表示ができないため、Markdown を直接出力させるプロンプトを使う。
         """
+        return self._astream_text(
+            self._deploy_markdown_prompt(), self.llm_flash_thinking,
+            {"specification": specification, "framework": framework},
+            use_cache=True,
+        )
+
+    @compiled
+    def _deploy_markdown_prompt(self):
+        return context_prompt(
+            project_context("specification", "framework"),
+            """
+            あなたは、ハッカソンの支援をするためのAIエージェントです。
+            あなたは上記の仕様書とフレームワーク情報を元に最適なdeployサービスを提案してください。
+            選択したdeployサービスの情報を、Markdown形式である程度の量で出力してください。
+            ```markdown
+            ```
+            という風に囲む必要はありません。Markdown以外の内容は出力しないでください。
+            """
+        )
+
+    def _strip_code_fence(self, result: dict) -> dict:
+        result["deploy"] = result["deploy"].replace("```markdown",'').replace("```",'')
+        return result
+
+    @compiled
+    def _deploy_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="deploy",
@@ -22,29 +73,21 @@ class DeployService(BaseService):
         ]
         parser = StructuredOutputParser.from_response_schemas(response_schemas)
 
-        prompt_template = ChatPromptTemplate.from_template(
-            template="""
+        prompt_template = context_prompt(
+            project_context("specification", "framework"),
+            """
             あなたは、ハッカソンの支援をするためのAIエージェントです。
-            あなたは以下の情報を元に最適なdeployサービスを提案してください。
-            以下はフレームワーク情報です。 : {framework}
-            次が仕様書です。 : {specification}
+            あなたは上記の仕様書とフレームワーク情報を元に最適なdeployサービスを提案してください。
             その際、選択したdeployサービスの情報を以下の形式で出力してください。
             あなたはjson形式で出力することが求められています。それ以外のについては、システムに障害が発生するため、出力しないでください。
             {format_instructions}
-            
             """,
             partial_variables={"format_instructions": parser.get_format_instructions()},
         )
         
-        # 中間出力を保存する辞書
-        intermediate_results = {}
-        def capture_output(x):
-            intermediate_results["llm_output"] = x
-            # ここでJSONを修正する
-            # JSONの修正
-            # AIMessageからコンテンツを取得
-            print(intermediate_results)
-            
+        def repair_output(x):
+            # チェーンはプロセス全体で共有するため、呼び出しごとの状態は持たずに応答の JSON を修正して返す
+            logger.debug("deploy の LLM 出力: %s", x)
             if hasattr(x, 'content'):
                 content = x.content
             else:
@@ -61,8 +104,4 @@ class DeployService(BaseService):
                 # それ以外の場合は修復された文字列を返す
                 return repaired_json
 
-        chain = prompt_template | self.llm_flash_thinking | (lambda x: capture_output(x)) | parser
-        result = chain.invoke({"specification": specification, "framework": framework})
-        
-        result["deploy"] = result["deploy"].replace("```markdown",'').replace("```",'')
-        return result 
+        return prompt_template | self._managed(self.llm_flash_thinking, validate=lambda c: parser.parse(repair_json(c))) | repair_output | parser
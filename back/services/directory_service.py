@@ -1,8 +1,12 @@
-from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
 
 class DirectoryService(BaseService):
+    # 同じ仕様書・フレームワークに対する生成結果は1日キャッシュする
+    cache_ttl_sec = 60 * 60 * 24
+
     def __init__(self):
         super().__init__()
 
@@ -11,13 +15,37 @@ class DirectoryService(BaseService):
         仕様書とフレームワーク情報に基づいて、プロジェクトに適したディレクトリ構成を
         コードブロック形式のテキストとして生成する。
         """
-        prompt_template = ChatPromptTemplate.from_template(
-            template="""
-            あなたはプロジェクトのディレクトリ構成のエキスパートです。以下の仕様書と使用するフレームワークに基づいて、最適なディレクトリ構成を考案してください。
-            仕様書:
-            {specification}
-            使用するフレームワーク:
-            {framework}
+        chain = self._directory_chain()
+        return chain.invoke({"framework": framework, "specification": specification})
+
+    async def agenerate_directory_structure(self, framework: str, specification: str) -> str:
+        """
+        generate_directory_structure の非同期版。
+        """
+        chain = self._directory_chain()
+        return await chain.ainvoke({"framework": framework, "specification": specification})
+
+    def astream_directory_structure(self, framework: str, specification: str):
+        """
+        generate_directory_structure のストリーミング版。キャッシュ済みであれば全文を1イベントで返す。
+        """
+        return self._astream_text(
+            self._directory_prompt(), self.llm_pro,
+            {"framework": framework, "specification": specification},
+            use_cache=True,
+        )
+
+    @compiled
+    def _directory_chain(self):
+        return self._directory_prompt() | self._managed(self.llm_pro) | StrOutputParser()
+
+    @compiled
+    def _directory_prompt(self):
+        # 仕様書とフレームワークは他のサービスと共通のコンテキストとして先頭に置く
+        return context_prompt(
+            project_context("specification", "framework"),
+            """
+            あなたはプロジェクトのディレクトリ構成のエキスパートです。上記の仕様書と使用するフレームワークに基づいて、最適なディレクトリ構成を考案してください。
             回答は、以下のようなコードブロック形式で、ディレクトリ構造のみをテキストで出力してください。
             ディレクトリ構造以外の情報を含めたら不正解となります。
             
@@ -84,10 +112,5 @@ class DirectoryService(BaseService):
             ├── project.xcworkspace/
             └── xcuserdata/
             ```
-                
-        """,
-            
+            """,
         )
-        chain = prompt_template | self.llm_pro | StrOutputParser()
-        result = chain.invoke({"framework": framework, "specification": specification})
-        return result
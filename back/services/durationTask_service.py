@@ -1,7 +1,10 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
-from typing import List, Dict
+from .prompt_registry import compiled
+from .output_schemas import EffortsOutput
+from .scheduler import schedule_tasks, parse_duration_days
+from typing import List, Dict, Optional
 import json
 import logging
 
@@ -11,10 +14,19 @@ class DurationTaskService(BaseService):
     def __init__(self):
         super().__init__()
 
-    def generate_task_durations(self, duration: str, tasks: List[Dict]) -> List[Dict]:
+    def generate_task_durations(
+        self,
+        duration: str,
+        tasks: List[Dict],
+        edges: Optional[List[Dict]] = None,
+        num_people: int = 1,
+        estimate_with_llm: bool = False,
+    ) -> List[Dict]:
         """
-        入力のプロジェクト全期間 (duration: 日数) と各タスク（task_id, task_name, content を含む）
-        をもとに、各タスクの作業期間（開始日、終了日）を算出し、ガントチャート作成用の情報を返します。
+        入力のプロジェクト全期間 (duration: 日数) と各タスク（task_id, task_name, content を含む）、
+        タスク間の依存関係 (edges: GraphTaskService の出力)、人数をもとに、
+        各タスクの作業期間（開始日、終了日）をローカルのスケジューラで算出し、ガントチャート作成用の情報を返します。
+        estimate_with_llm が True の場合のみ、タスクごとの作業量を LLM に1回でまとめて見積もらせます。
         
         出力例（JSON形式）:
         {
@@ -26,14 +38,93 @@ class DurationTaskService(BaseService):
           ]
         }
         """
+        efforts = self.estimate_efforts(tasks) if estimate_with_llm else None
+        return self._schedule(duration, tasks, edges, num_people, efforts)
+
+    async def agenerate_task_durations(
+        self,
+        duration: str,
+        tasks: List[Dict],
+        edges: Optional[List[Dict]] = None,
+        num_people: int = 1,
+        estimate_with_llm: bool = False,
+    ) -> List[Dict]:
+        """
+        generate_task_durations の非同期版。
+        """
+        efforts = await self.aestimate_efforts(tasks) if estimate_with_llm else None
+        return self._schedule(duration, tasks, edges, num_people, efforts)
+
+    def estimate_efforts(self, tasks: List[Dict]) -> Optional[Dict[int, float]]:
+        """
+        各タスクの作業量（日）を LLM に1回の呼び出しでまとめて見積もらせる。
+        失敗時は None を返し、スケジューラ側の簡易見積もりを使う。
+        """
+        try:
+            chain, parser = self._efforts_chain()
+            ai_message = chain.invoke({"tasks_input": json.dumps(tasks, ensure_ascii=False, indent=2)})
+            return self._parse_efforts(ai_message, parser)
+        except Exception as e:
+            logger.error("タスク作業量の見積もり失敗: %s", e, exc_info=True)
+            return None
+
+    async def aestimate_efforts(self, tasks: List[Dict]) -> Optional[Dict[int, float]]:
+        """
+        estimate_efforts の非同期版。
+        """
+        try:
+            chain, parser = self._efforts_chain()
+            ai_message = await chain.ainvoke({"tasks_input": json.dumps(tasks, ensure_ascii=False, indent=2)})
+            return self._parse_efforts(ai_message, parser)
+        except Exception as e:
+            logger.error("タスク作業量の見積もり失敗: %s", e, exc_info=True)
+            return None
+
+    def _schedule(self, duration, tasks, edges, num_people, efforts) -> List[Dict]:
+        duration_days = parse_duration_days(duration)
+        try:
+            return schedule_tasks(
+                tasks,
+                edges=edges,
+                efforts=efforts,
+                duration_days=duration_days,
+                num_people=max(1, num_people or 1),
+                # LLM の見積もり（日数）が無い場合は、相対的な作業量を期間いっぱいに割り付ける
+                stretch=efforts is None,
+            )
+        except Exception as e:
+            logger.error("タスク期間算出失敗: %s", e, exc_info=True)
+            return self._fallback(tasks)
+
+    def _parse_efforts(self, ai_message, parser) -> Dict[int, float]:
+        raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
+        logger.debug("Raw LLM output: %s", raw)
+
+        # JSON修復→パース
+        repaired = self._repair_json(raw)
+        parsed = parser.parse(repaired)
+        logger.debug("Parsed result: %s", parsed)
+
+        return {
+            item["task_id"]: float(item["days"])
+            for item in parsed.get("efforts", [])
+            if "task_id" in item and "days" in item
+        }
+
+    def _fallback(self, tasks: List[Dict]) -> List[Dict]:
+        # 失敗時はタスクIDのみ持つ基本的なフォールバックを返す
+        return [{"task_id": task["task_id"], "start": 1, "end": 2} for task in tasks]
+
+    @compiled
+    def _efforts_chain(self):
         # 出力JSON形式内の波括弧は、テンプレートエンジンに変数として解釈されないようダブルブラケットでエスケープ
         response_schemas = [
             ResponseSchema(
-                name="durations",
+                name="efforts",
                 description=(
-                    "各タスクの期間は以下の形式のオブジェクトです。"
-                    "例: {{\"durations\": [{{\"task_id\": 0, \"start\": 1, \"end\": 5}}, "
-                    "{{\"task_id\": 1, \"start\": 2, \"end\": 4}}, ...]}}"
+                    "各タスクの作業量（日数、0.5刻み）。"
+                    "例: {{\"efforts\": [{{\"task_id\": 0, \"days\": 1.5}}, "
+                    "{{\"task_id\": 1, \"days\": 0.5}}, ...]}}"
                     "※ 出力は必ずJSON形式にしてください。"
                 ),
                 type="object(array(objects))"
@@ -43,10 +134,9 @@ class DurationTaskService(BaseService):
 
         prompt_template = ChatPromptTemplate.from_template(
             template="""
-            あなたはプロジェクトタスクの期間算出のエキスパートです。
-            以下は全体のプロジェクト期間 {duration} と、各タスクの情報です。
-            タスク情報は task_id, task_name, content のみが提供されています。
-            タスクの内容から、それぞれの作業期間（開始日と終了日）を算出してください。
+            あなたはプロジェクトタスクの工数見積もりのエキスパートです。
+            以下の各タスクについて、ハッカソン初心者1人が作業した場合の作業量を日数（0.5日刻み）で見積もってください。
+            開始日や終了日、タスク間の依存関係は考慮する必要はありません。
             
             タスク一覧:
             {tasks_input}
@@ -54,39 +144,16 @@ class DurationTaskService(BaseService):
             回答は、厳密に以下のような形式の**JSON形式のみ**で出力してください:
             回答例（イメージ）:
             {{
-            "durations": [
-                {{ "task_id": 0, "start": 1, "end": 5 }},
-                {{ "task_id": 1, "start": 2, "end": 4 }}
+            "efforts": [
+                {{ "task_id": 0, "days": 1.5 }},
+                {{ "task_id": 1, "days": 0.5 }}
             ]
             }}
             
             """,
         )
-        # tasks_input: タスク情報リストをJSON形式（見やすい整形付き）に変換
-        tasks_input = json.dumps(tasks, ensure_ascii=False, indent=2)
-        
-        try:
-            # LLM呼び出し
-            chain = prompt_template | self.llm_pro
-            ai_message = chain.invoke({
-                "duration": duration, 
-                "tasks_input": tasks_input
-            })
-            raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
-            logger.debug("Raw LLM output: %s", raw)
-            
-            # JSON修復→パース
-            repaired = self._repair_json(raw)
-            logger.debug("Repaired JSON: %s", repaired)
-            parsed = parser.parse(repaired)
-            logger.debug("Parsed result: %s", parsed)
-            
-            # result が {"durations": [...]} の形式となることを期待
-            return parsed.get("durations", [])
-        except Exception as e:
-            logger.error("タスク期間生成失敗: %s", e, exc_info=True)
-            # 失敗時はタスクIDのみ持つ基本的なフォールバックを返す
-            return [{"task_id": task["task_id"], "start": 1, "end": 2} for task in tasks]
+        # 見積もりは軽量なモデルで十分
+        return prompt_template | self._managed(self.llm_flash, schema=EffortsOutput), parser
 
 if __name__ == '__main__':
     # 簡易テスト用サンプル
@@ -1,11 +1,16 @@
-from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
+from .output_schemas import HandsOnOutput
 import logging
 
 logger = logging.getLogger(__name__)
 
 class EnvironmentService(BaseService):
+    # 同じ仕様書・フレームワークに対する生成結果は1日キャッシュする
+    cache_ttl_sec = 60 * 60 * 24
+
     def __init__(self):
         super().__init__()
 
@@ -18,6 +23,45 @@ class EnvironmentService(BaseService):
             - backend: バックエンドの初期環境構築手順の詳細説明
             出力はMarkdown形式の文字列とし、JSON形式で返す。
         """
+        try:
+            # LLM呼び出し
+            chain = self._hands_on_chain()
+            return chain.invoke({
+                "specification": specification,
+                "directory": directory,
+                "framework": framework
+            })
+        except Exception as e:
+            logger.error("環境構築ハンズオン生成失敗: %s", e, exc_info=True)
+            return self._fallback(e)
+
+    async def agenerate_hands_on(self, specification: str, directory: str, framework: str):
+        """
+        generate_hands_on の非同期版。
+        """
+        try:
+            # LLM呼び出し
+            chain = self._hands_on_chain()
+            return await chain.ainvoke({
+                "specification": specification,
+                "directory": directory,
+                "framework": framework
+            })
+        except Exception as e:
+            logger.error("環境構築ハンズオン生成失敗: %s", e, exc_info=True)
+            return self._fallback(e)
+
+    def _fallback(self, e: Exception):
+        # 失敗時は基本的な情報を持つフォールバック結果を返す
+        return {
+            "overall": f"環境構築ハンズオン生成に失敗しました: {e}",
+            "devcontainer": "生成失敗",
+            "frontend": "生成失敗", 
+            "backend": "生成失敗"
+        }
+
+    @compiled
+    def _hands_on_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="overall",
@@ -42,16 +86,11 @@ class EnvironmentService(BaseService):
         ]
         parser = StructuredOutputParser.from_response_schemas(response_schemas)
 
-        prompt_template = ChatPromptTemplate.from_template(
-            template="""
-                        以下の情報をもとに、環境構築ハンズオンの説明を生成してください。回答はMarkdown形式で出力してください。
+        prompt_template = context_prompt(
+            project_context("specification", "directory", "framework"),
+            """
+                        上記の情報をもとに、環境構築ハンズオンの説明を生成してください。回答はMarkdown形式で出力してください。
                         ただし、Markdown形式の文字列がJSON形式の形を壊さないように注意してください。
-                        【仕様書】
-                        {specification}
-                        【ディレクトリ構成】
-                        {directory}
-                        【フレームワーク情報】
-                        {framework}
                         Webフレームワークの場合、
                         以下の項目ごとに、詳細なハンズオンの説明を出力してください：
                         1. overall: プロジェクト全体の環境構築ハンズオンの概要説明
@@ -83,25 +122,7 @@ class EnvironmentService(BaseService):
                         '''
                         {format_instructions}
                     """,
-            partial_variables={"format_instructions": parser.get_format_instructions()}
+            partial_variables={"format_instructions": parser.get_format_instructions()},
         )
 
-        try:
-            # LLM呼び出し
-            chain = prompt_template | self.llm_flash | parser
-            parsed = chain.invoke({
-                "specification": specification,
-                "directory": directory,
-                "framework": framework
-            })
-
-            return parsed
-        except Exception as e:
-            logger.error("環境構築ハンズオン生成失敗: %s", e, exc_info=True)
-            # 失敗時は基本的な情報を持つフォールバック結果を返す
-            return {
-                "overall": f"環境構築ハンズオン生成に失敗しました: {e}",
-                "devcontainer": "生成失敗",
-                "frontend": "生成失敗", 
-                "backend": "生成失敗"
-            }
+        return prompt_template | self._managed(self.llm_flash, validate=parser.parse, schema=HandsOnOutput) | parser
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# 応答の定義ファイル（JSON）。未指定の場合は DEFAULT_RESPONSE を返す
+FAKE_RESPONSES_PATH = os.getenv("FAKE_LLM_RESPONSES")
+# 応答時間の分布。"fixed:秒" / "uniform:最小,最大" / "normal:平均,標準偏差" / "lognormal:中央値,シグマ"
+FAKE_LATENCY = os.getenv("FAKE_LLM_LATENCY", "fixed:0")
+# 応答時間の乱数のシード（同じシードなら同じ順序の呼び出しに同じ応答時間を返す）
+FAKE_SEED = os.getenv("FAKE_LLM_SEED")
+# ストリーミング時に1チャンクとして返す文字数
+FAKE_STREAM_CHUNK_CHARS = int(os.getenv("FAKE_LLM_STREAM_CHUNK_CHARS", "16"))
+
+DEFAULT_RESPONSE = "これはテスト用の応答です。"
+
+
+def prompt_hash(messages: List[BaseMessage]) -> str:
+    """
+    メッセージ列の内容から応答を引くためのハッシュ。記録済みの応答（"recorded"）のキーに使う。
+    """
+    return hashlib.sha256(get_buffer_string(messages).encode("utf-8")).hexdigest()
+
+
+def load_responses(path: Optional[str]) -> Dict[str, Any]:
+    """
+    応答の定義ファイルを読み込む。形式:
+        {
+          "default": "<どのルールにも当たらない場合の応答>",
+          "rules": [{"contains": "<プロンプトに含まれる文字列>", "response": "<応答>"}, ...],
+          "recorded": {"<prompt_hash>": "<応答>", ...}
+        }
+    response / default には文字列のほか JSON の値も書ける（その場合は JSON 文字列にして返す）。
+    """
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _as_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+class LatencyModel:
+    """
+    FAKE_LLM_LATENCY の形式の文字列から応答時間をサンプリングする。
+    """
+
+    def __init__(self, spec: str, seed: Optional[int] = None):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip() or "fixed"
+        self.params = [float(p) for p in params.split(",") if p.strip()] or [0.0]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未対応の応答時間の分布です: {spec}")
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        p = self.params
+        match self.kind:
+            case "fixed":
+                value = p[0]
+            case "uniform":
+                value = self._random.uniform(p[0], p[1] if len(p) > 1 else p[0])
+            case "normal":
+                value = self._random.gauss(p[0], p[1] if len(p) > 1 else 0.0)
+            case "lognormal":
+                # 中央値とシグマで指定する（中央値 = exp(mu)）
+                value = p[0] * self._random.lognormvariate(0.0, p[1] if len(p) > 1 else 0.0)
+        return max(0.0, value)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    ネットワークを使わない決定的なチャットモデル。バックエンド自体のオーバーヘッドの計測やオフラインでの動作確認に使う。
+    プロバイダ "fake" として LLM レジストリから生成される（LLM_DEFAULT_PROVIDER=fake や LLM_ROUTES で選択する）。
+    応答はプロンプトの内容で決まり、記録済みの応答 → ルール（部分一致、先頭から順に評価）→ default の順に探す。
+    応答時間は分布からサンプリングし、非同期呼び出しではイベントループを塞がずに待つ。
+    """
+
+    model: str = "fake"
+    temperature: Optional[float] = None
+    responses_path: Optional[str] = FAKE_RESPONSES_PATH
+    latency: str = FAKE_LATENCY
+    seed: Optional[int] = int(FAKE_SEED) if FAKE_SEED else None
+    stream_chunk_chars: int = FAKE_STREAM_CHUNK_CHARS
+
+    _responses: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    _latency: LatencyModel = PrivateAttr()
+    calls: int = 0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._responses = load_responses(self.responses_path)
+        self._latency = LatencyModel(self.latency, self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def respond(self, messages: List[BaseMessage]) -> str:
+        """
+        メッセージ列に対する応答本文を返す（待機はしない）。
+        """
+        recorded = self._responses.get("recorded", {}).get(prompt_hash(messages))
+        if recorded is not None:
+            return _as_text(recorded)
+        prompt = get_buffer_string(messages)
+        for rule in self._responses.get("rules", []):
+            if rule["contains"] in prompt:
+                return _as_text(rule["response"])
+        return _as_text(self._responses.get("default", DEFAULT_RESPONSE))
+
+    def _message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        input_tokens = len(get_buffer_string(messages)) // 2
+        output_tokens = len(text) // 2
+        return AIMessage(
+            content=text,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+            response_metadata={"model_name": self.model},
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        time.sleep(self._latency.sample())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, self.respond(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        await asyncio.sleep(self._latency.sample())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, self.respond(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # 最初のチャンクまでの時間を応答時間とみなす
+        self.calls += 1
+        time.sleep(self._latency.sample())
+        for chunk in self._chunks(messages):
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self._latency.sample())
+        for chunk in self._chunks(messages):
+            yield chunk
+            await asyncio.sleep(0)
+
+    def _chunks(self, messages: List[BaseMessage]) -> Iterator[ChatGenerationChunk]:
+        text = self.respond(messages)
+        size = max(1, self.stream_chunk_chars)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        usage = self._message(messages, text).usage_metadata
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage if last else None))
@@ -1,8 +1,12 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
 
 class FrameworkService(BaseService):
+    # 同じ仕様書に対する生成結果は1日キャッシュする
+    cache_ttl_sec = 60 * 60 * 24
+
     def __init__(self):
         super().__init__()
 
@@ -12,6 +16,18 @@ class FrameworkService(BaseService):
         およびバックエンド候補（Nest, Flask, FastAPI, Rails, Gin）の優先順位と理由を
         JSON 形式で生成する。
         """
+        chain = self._framework_chain()
+        return chain.invoke({"specification": specification})
+
+    async def agenerate_framework_priority(self, specification: str):
+        """
+        generate_framework_priority の非同期版。
+        """
+        chain = self._framework_chain()
+        return await chain.ainvoke({"specification": specification})
+
+    @compiled
+    def _framework_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="frontend",
@@ -40,6 +56,4 @@ class FrameworkService(BaseService):
             partial_variables={"format_instructions": parser.get_format_instructions()}
         )
 
-        chain = prompt_template | self.llm_flash | parser
-        result = chain.invoke({"specification": specification})
-        return result
+        return prompt_template | self._managed(self.llm_flash, validate=parser.parse) | parser
@@ -1,8 +1,14 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
-from typing import List, Dict
+from .prompt_registry import compiled
+from .output_schemas import EdgesOutput
+from .task_graph import TaskGraph
+from typing import List, Dict, Optional
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class GraphTaskService(BaseService):
     def __init__(self):
@@ -13,7 +19,103 @@ class GraphTaskService(BaseService):
         入力のタスクリスト（各タスクは task_id, task_name, content を含む）を受け取り、
         タスク間の依存関係を示すエッジのリストを返す。
         各エッジは {parent: タスクID, child: タスクID} の形式です。
+        LLM の出力は TaskGraph で検証し、循環・重複・存在しない task_id を除去してから返す。
+        """
+        chain = self._graph_chain()
+        result = chain.invoke({"tasks_input": json.dumps(tasks, ensure_ascii=False, indent=2)})
+        # 期待: result は {"edges": [...]} の形式
+        return self._validate(tasks, result.get("edges", []))
+
+    async def agenerate_task_graph(self, tasks: List[Dict]) -> List[Dict]:
+        """
+        generate_task_graph の非同期版。
+        """
+        chain = self._graph_chain()
+        result = await chain.ainvoke({"tasks_input": json.dumps(tasks, ensure_ascii=False, indent=2)})
+        return self._validate(tasks, result.get("edges", []))
+
+    def update_task_graph(
+        self,
+        tasks: List[Dict],
+        edges: List[Dict],
+        changed_task_ids: Optional[List[int]] = None,
+        removed_task_ids: Optional[List[int]] = None,
+    ) -> List[Dict]:
+        """
+        既存のエッジを元に、追加・変更・削除されたタスクの周辺だけを LLM に再推論させる。
+        - 削除されたタスクは親子を繋ぎ直して取り除く（LLM は呼ばない）
+        - 追加・変更されたタスクは全文を、それ以外のタスクは依存先の候補として task_id と task_name だけを LLM に渡し、
+          変更されたタスクに接するエッジだけを採用する
+        """
+        graph, changed = self._prepare_update(tasks, edges, changed_task_ids, removed_task_ids)
+        if changed:
+            chain = self._graph_chain()
+            result = chain.invoke({"tasks_input": self._update_input(tasks, changed)})
+            self._merge(graph, result.get("edges", []), changed)
+        return self._finish(graph)
+
+    async def aupdate_task_graph(
+        self,
+        tasks: List[Dict],
+        edges: List[Dict],
+        changed_task_ids: Optional[List[int]] = None,
+        removed_task_ids: Optional[List[int]] = None,
+    ) -> List[Dict]:
+        """
+        update_task_graph の非同期版。
         """
+        graph, changed = self._prepare_update(tasks, edges, changed_task_ids, removed_task_ids)
+        if changed:
+            chain = self._graph_chain()
+            result = await chain.ainvoke({"tasks_input": self._update_input(tasks, changed)})
+            self._merge(graph, result.get("edges", []), changed)
+        return self._finish(graph)
+
+    def _validate(self, tasks: List[Dict], edges: List[Dict]) -> List[Dict]:
+        graph = TaskGraph([t["task_id"] for t in tasks], edges)
+        return self._finish(graph)
+
+    def _finish(self, graph: TaskGraph) -> List[Dict]:
+        removed = graph.normalize()
+        if graph.dropped or removed:
+            logger.warning("依存関係のエッジを修正しました: dropped=%s removed=%s", graph.dropped, removed)
+        return graph.edges()
+
+    def _prepare_update(self, tasks, edges, changed_task_ids, removed_task_ids):
+        # 既存のエッジは削除済みタスクも含めて読み込み、繋ぎ直してから取り除く
+        known_ids = {t["task_id"] for t in tasks} | set(removed_task_ids or [])
+        graph = TaskGraph(known_ids, edges)
+        for task_id in removed_task_ids or []:
+            graph.remove_task(task_id)
+        changed = [task_id for task_id in changed_task_ids or [] if task_id in graph]
+        # 変更されたタスクに接するエッジは LLM の結果で置き換える
+        for task_id in changed:
+            for child in list(graph.children(task_id)):
+                graph.remove_edge(task_id, child)
+            for parent in list(graph.parents(task_id)):
+                graph.remove_edge(parent, task_id)
+        return graph, changed
+
+    def _update_input(self, tasks: List[Dict], changed: List[int]) -> str:
+        """
+        変更されたタスクは全文、それ以外のタスクは {task_id, task_name} だけにした LLM への入力を作る。
+        新しく追加したタスクにもエッジが無い既存のタスクを親・子として選ばせるため、全タスクを渡す。
+        """
+        changed_ids = set(changed)
+        sub_tasks = [
+            task if task["task_id"] in changed_ids else {"task_id": task["task_id"], "task_name": task.get("task_name", "")}
+            for task in tasks
+        ]
+        return json.dumps(sub_tasks, ensure_ascii=False, indent=2)
+
+    def _merge(self, graph: TaskGraph, new_edges: List[Dict], changed_task_ids: List[int]):
+        changed = set(changed_task_ids)
+        for edge in new_edges:
+            if edge.get("parent") in changed or edge.get("child") in changed:
+                graph.add_edge(edge.get("parent"), edge.get("child"))
+
+    @compiled
+    def _graph_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="edges",
@@ -48,12 +150,7 @@ class GraphTaskService(BaseService):
             partial_variables={"format_instructions": parser.get_format_instructions()}
         )
 
-        tasks_input = json.dumps(tasks, ensure_ascii=False, indent=2)
-        
-        chain = prompt_template | self.llm_pro | parser
-        result = chain.invoke({"tasks_input": tasks_input})
-        # 期待: result は {"edges": [...]} の形式
-        return result.get("edges", [])
+        return prompt_template | self._managed(self.llm_pro, schema=EdgesOutput) | parser
 
 if __name__ == '__main__':
     tasks = [
@@ -0,0 +1,231 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from .request_context import project_scope
+
+logger = logging.getLogger(__name__)
+
+# 同時に実行するジョブの数（ワーカー数）
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# 実行待ちにできるジョブの上限。超えた場合は受け付けない（503）
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+# 進捗の購読（SSE）で、他のワーカープロセスが実行するジョブの状態を DB から読み直す間隔（秒）
+JOB_POLL_SEC = float(os.getenv("JOB_POLL_SEC", "1.0"))
+# この時間（秒）更新の無い実行待ち・実行中のジョブは、プロセスの再起動などで中断したものとみなす
+JOB_STALE_SEC = float(os.getenv("JOB_STALE_SEC", "900"))
+# 終了したジョブを残しておく時間（秒）
+JOB_RETENTION_SEC = float(os.getenv("JOB_RETENTION_SEC", str(60 * 60 * 24 * 7)))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """
+    実行待ちのジョブが JOB_MAX_PENDING に達しているため、ジョブを受け付けなかった。
+    """
+
+
+class JobContext:
+    """
+    ジョブの処理関数に渡す実行中のジョブ。progress() で進捗を記録する。
+    """
+
+    def __init__(self, queue: "JobQueue", job_id: str, project_id: Optional[str]):
+        self._queue = queue
+        self.job_id = job_id
+        self.project_id = project_id
+
+    async def progress(self, **progress):
+        await self._queue._update(self.job_id, progress=progress)
+
+
+Handler = Callable[[JobContext, Dict], Awaitable[Dict]]
+
+
+class JobQueue:
+    """
+    プロセス内の非同期ジョブキュー。時間のかかる生成を HTTP リクエストから切り離して実行する。
+    - submit() はジョブを jobs テーブルに保存してすぐにジョブIDを返し、JOB_WORKERS 個のワーカーが順に実行する
+    - 処理関数は register() で種類ごとに登録する。project_id 付きのジョブは project_scope の中で実行する
+    - 状態・進捗・結果は jobs テーブルに保存するため、どのワーカープロセスからでも参照できる
+    実行待ちのジョブはメモリ上にしか無いため、プロセスが再起動すると失われる（JOB_STALE_SEC 後に failed になる）。
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._handlers: Dict[str, Handler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: list = []
+        self._changed: Dict[str, asyncio.Event] = {}
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, payload: Dict, project_id: Optional[str] = None) -> str:
+        """
+        ジョブを登録してジョブIDを返す。
+        """
+        from database import AsyncSessionLocal
+        from models.job import Job
+
+        if kind not in self._handlers:
+            raise ValueError(f"未登録のジョブの種類です: {kind}")
+        queue = self._ensure_workers()
+        if queue.qsize() >= self.max_pending:
+            raise JobQueueFull(f"実行待ちのジョブが上限（{self.max_pending}件）に達しています")
+        job_id = str(uuid.uuid4())
+        async with AsyncSessionLocal() as db:
+            db.add(Job(job_id=job_id, kind=kind, project_id=project_id, status=QUEUED, payload=payload))
+            await db.commit()
+        # このプロセスで実行するジョブは、状態が変わるたびに購読者へ通知する
+        self._changed[job_id] = asyncio.Event()
+        queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """
+        ジョブの状態を返す。長時間更新の無い未完了のジョブは中断したものとして failed にする。
+        """
+        from database import AsyncSessionLocal
+        from models.job import Job
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None:
+                return None
+            if job.status not in FINISHED and job_id not in self._changed and time.time() - job.updated_at > JOB_STALE_SEC:
+                job.status, job.error = FAILED, "ジョブが中断されました（サーバーの再起動など）"
+                job.finished_at = job.updated_at = time.time()
+                await db.commit()
+            return job.to_dict()
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict]:
+        """
+        ジョブの状態が変わるたびに最新の状態を返し、終了したら止まる。
+        このプロセスで実行中のジョブは更新時に、それ以外は JOB_POLL_SEC ごとに DB を読み直す。
+        """
+        last = None
+        while True:
+            changed = self._changed.get(job_id)
+            job = await self.get(job_id)
+            if job is None:
+                return
+            snapshot = (job["status"], job["progress"])
+            if snapshot != last:
+                last = snapshot
+                yield job
+            if job["status"] in FINISHED:
+                return
+            if changed is None:
+                await asyncio.sleep(JOB_POLL_SEC)
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=JOB_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+
+    def _ensure_workers(self) -> asyncio.Queue:
+        """
+        初回の submit 時に、実行中のイベントループ上でワーカーを起動する。
+        """
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+        return self._queue
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error("ジョブの実行中にエラーが発生しました (%s): %s", job_id, e, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        from database import AsyncSessionLocal
+        from models.job import Job
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None or job.status in FINISHED:
+                self._changed.pop(job_id, None)
+                return
+            kind, payload, project_id = job.kind, job.payload, job.project_id
+        self._changed.setdefault(job_id, asyncio.Event())
+        self.running += 1
+        await self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            with project_scope(project_id):
+                result = await self._handlers[kind](JobContext(self, job_id, project_id), payload)
+        except Exception as e:
+            logger.error("ジョブが失敗しました (%s %s): %s", kind, job_id, e, exc_info=True)
+            self.failed += 1
+            await self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        else:
+            self.succeeded += 1
+            await self._update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+        finally:
+            self.running -= 1
+            self._changed.pop(job_id).set()
+            await self._purge()
+
+    async def _update(self, job_id: str, **fields):
+        from database import AsyncSessionLocal
+        from models.job import Job
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None:
+                return
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            await db.commit()
+        changed = self._changed.get(job_id)
+        if changed is not None:
+            # 待っている購読者を起こし、次の更新用に新しい Event に差し替える
+            changed.set()
+            if job_id in self._changed:
+                self._changed[job_id] = asyncio.Event()
+
+    async def _purge(self):
+        """
+        JOB_RETENTION_SEC より前に終了したジョブを削除する。
+        """
+        from sqlalchemy import delete
+        from database import AsyncSessionLocal
+        from models.job import Job
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Job).where(Job.finished_at < time.time() - JOB_RETENTION_SEC))
+            await db.commit()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
+
+
+# プロセス全体で共有するジョブキュー
+job_queue = JobQueue()
@@ -0,0 +1,267 @@
+import os
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# メモリ上に保持する最大件数
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+# 第2層のバックエンド: "memory"（メモリのみ）または "sql"（DBにも保存）
+CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+# DB 層に保持する最大行数（0 なら無制限）。超えた分は保存時刻の古いものから削除する
+CACHE_SQL_MAX_ROWS = int(os.getenv("LLM_CACHE_SQL_MAX_ROWS", "10000"))
+# DB 層の期限切れ・上限超過の行を削除する間隔（秒）。保存のついでに、前回から この秒数が経っていれば行う
+CACHE_SQL_PURGE_SEC = float(os.getenv("LLM_CACHE_SQL_PURGE_SEC", "300"))
+
+
+def make_cache_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    (モデル名, 展開済みプロンプト, パラメータ) から内容ベースのキャッシュキーを作る。
+    """
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "params": params or {}},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLCacheTier:
+    """
+    DB に LLM 応答を保存する第2層。プロセス再起動やワーカー間でキャッシュを共有したい場合に使う。
+    get / set は同期セッション、aget / aset は非同期セッションを使う（イベントループを止めない）。
+    参照結果は (応答, 有効期限) で返し、メモリ層にも同じ有効期限で載せられるようにする。
+    参照されないまま期限切れになった行や max_rows を超えた行は、purge_sec ごとに保存のついでに削除する。
+    """
+
+    def __init__(self, max_rows: int = CACHE_SQL_MAX_ROWS, purge_sec: float = CACHE_SQL_PURGE_SEC):
+        self.max_rows = max_rows
+        self.purge_sec = purge_sec
+        self._last_purge = time.monotonic()
+        self._purge_lock = threading.Lock()
+        self.purged = 0
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        from database import SessionLocal
+        from models.llm_cache import LLMCacheEntry
+
+        db = SessionLocal()
+        try:
+            entry = db.get(LLMCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at < time.time():
+                db.delete(entry)
+                db.commit()
+                return None
+            return entry.value, entry.expires_at
+        finally:
+            db.close()
+
+    def set(self, key: str, value: str, expires_at: Optional[float]):
+        from database import SessionLocal
+        from models.llm_cache import LLMCacheEntry
+
+        db = SessionLocal()
+        try:
+            db.merge(LLMCacheEntry(key=key, value=value, expires_at=expires_at, created_at=time.time()))
+            db.commit()
+            if self._purge_due():
+                cutoff = db.execute(self._cutoff_query()).scalar() if self.max_rows > 0 else None
+                for statement in self._purge_statements(cutoff):
+                    self.purged += db.execute(statement).rowcount or 0
+                db.commit()
+        finally:
+            db.close()
+
+    async def aget(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        from database import AsyncSessionLocal
+        from models.llm_cache import LLMCacheEntry
+
+        async with AsyncSessionLocal() as db:
+            entry = await db.get(LLMCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at < time.time():
+                await db.delete(entry)
+                await db.commit()
+                return None
+            return entry.value, entry.expires_at
+
+    async def aset(self, key: str, value: str, expires_at: Optional[float]):
+        from database import AsyncSessionLocal
+        from models.llm_cache import LLMCacheEntry
+
+        async with AsyncSessionLocal() as db:
+            await db.merge(LLMCacheEntry(key=key, value=value, expires_at=expires_at, created_at=time.time()))
+            await db.commit()
+            if self._purge_due():
+                cutoff = (await db.execute(self._cutoff_query())).scalar() if self.max_rows > 0 else None
+                for statement in self._purge_statements(cutoff):
+                    self.purged += (await db.execute(statement)).rowcount or 0
+                await db.commit()
+
+    def _purge_due(self) -> bool:
+        """
+        前回の削除から purge_sec 以上経っていれば True を返す（同時に呼ばれても1回だけ True になる）。
+        """
+        now = time.monotonic()
+        with self._purge_lock:
+            if now - self._last_purge < self.purge_sec:
+                return False
+            self._last_purge = now
+            return True
+
+    def _cutoff_query(self):
+        """
+        新しい順で max_rows + 1 番目の行の保存時刻を返すクエリ。この時刻以前の行が上限を超えた分になる。
+        """
+        from sqlalchemy import select
+        from models.llm_cache import LLMCacheEntry
+
+        return (
+            select(LLMCacheEntry.created_at)
+            .order_by(LLMCacheEntry.created_at.desc())
+            .offset(self.max_rows)
+            .limit(1)
+        )
+
+    def _purge_statements(self, cutoff: Optional[float]) -> list:
+        """
+        期限切れの行と、保存時刻が cutoff 以前の行（行数の上限を超えた分）を削除する DELETE 文。
+        """
+        from sqlalchemy import delete, or_
+        from models.llm_cache import LLMCacheEntry
+
+        statements = [delete(LLMCacheEntry).where(LLMCacheEntry.expires_at < time.time())]
+        if cutoff is not None:
+            statements.append(
+                delete(LLMCacheEntry).where(or_(LLMCacheEntry.created_at <= cutoff, LLMCacheEntry.created_at.is_(None)))
+            )
+        return statements
+
+
+class LLMResponseCache:
+    """
+    LLM 応答の内容アドレス型キャッシュ。
+    第1層はメモリ上の LRU（件数上限あり）、第2層は任意で DB を使う。
+    エントリごとに有効期限（TTL）を持ち、期限切れのものは参照時に破棄する。
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, second_tier: Optional[SQLCacheTier] = None):
+        self.max_entries = max_entries
+        self.second_tier = second_tier
+        self._entries: "OrderedDict[str, tuple[Optional[float], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is not None or self.second_tier is None:
+            return self._count(value)
+        try:
+            found = self.second_tier.get(key)
+        except Exception as e:
+            logger.warning("DBキャッシュの参照に失敗しました: %s", e)
+            found = None
+        return self._count(self._promote(key, found))
+
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        get の非同期版。DB 層の参照は非同期セッションで行う。
+        """
+        value = self._get_memory(key)
+        if value is not None or self.second_tier is None:
+            return self._count(value)
+        try:
+            found = await self.second_tier.aget(key)
+        except Exception as e:
+            logger.warning("DBキャッシュの参照に失敗しました: %s", e)
+            found = None
+        return self._count(self._promote(key, found))
+
+    def set(self, key: str, value: str, ttl_sec: Optional[float] = None):
+        expires_at = time.time() + ttl_sec if ttl_sec else None
+        self._put_memory(key, value, expires_at)
+        if self.second_tier is not None:
+            try:
+                self.second_tier.set(key, value, expires_at)
+            except Exception as e:
+                logger.warning("DBキャッシュへの保存に失敗しました: %s", e)
+
+    async def aset(self, key: str, value: str, ttl_sec: Optional[float] = None):
+        """
+        set の非同期版。DB 層への保存は非同期セッションで行う。
+        """
+        expires_at = time.time() + ttl_sec if ttl_sec else None
+        self._put_memory(key, value, expires_at)
+        if self.second_tier is not None:
+            try:
+                await self.second_tier.aset(key, value, expires_at)
+            except Exception as e:
+                logger.warning("DBキャッシュへの保存に失敗しました: %s", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "sql_purged": self.second_tier.purged if self.second_tier is not None else 0,
+            }
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is None or expires_at >= now:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+            return None
+
+    def _promote(self, key: str, found: Optional[Tuple[str, Optional[float]]]) -> Optional[str]:
+        """
+        DBでヒットしたものは、DB と同じ有効期限でメモリ層にも載せる。
+        """
+        if found is None:
+            return None
+        value, expires_at = found
+        self._put_memory(key, value, expires_at)
+        return value
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _put_memory(self, key: str, value: str, expires_at: Optional[float]):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+# プロセス全体で共有するキャッシュ
+llm_cache = LLMResponseCache(second_tier=SQLCacheTier() if CACHE_BACKEND == "sql" else None)
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Dict, Optional
+
+from .llm_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# カセットの動作モード
+# - off: 使わない
+# - record: 実際のプロバイダを呼び、応答と応答時間をカセットに追記する
+# - replay: カセットの応答だけを返す（プロバイダは呼ばない。見つからなければ CassetteMiss）
+# - replay_or_record: カセットにあれば再生し、無ければプロバイダを呼んで記録する（ステージングのキャッシュの下地に使う）
+CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+# カセットのファイル（JSON Lines、1行1応答）
+CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "llm_cassette.jsonl")
+# 再生時の速度。1.0 で記録時と同じ応答時間、0 で待たずに返す
+REPLAY_SPEED = float(os.getenv("LLM_CASSETTE_REPLAY_SPEED", "1.0"))
+# ストリーミングの再生で1チャンクとして返す文字数
+REPLAY_CHUNK_CHARS = int(os.getenv("LLM_CASSETTE_REPLAY_CHUNK_CHARS", "16"))
+
+MODES = ("off", "record", "replay", "replay_or_record")
+
+
+class CassetteMiss(LookupError):
+    """
+    replay モードで、カセットに記録されていないプロンプトが呼ばれた。
+    """
+
+
+def cassette_key(model: str, prompt: str, schema=None) -> str:
+    """
+    モデル名と展開済みプロンプト（と構造化出力のスキーマ名）から再生用のキーを作る。
+    プロバイダのクラスや temperature は含めないため、ルーティングやクライアントの設定が変わっても再生できる。
+    """
+    return make_cache_key(model, prompt, {"schema": schema.__name__} if schema is not None else None)
+
+
+class LLMCassette:
+    """
+    LLM の応答を記録・再生するカセット。BaseService._managed と _astream_text から使う。
+    応答本文と一緒に応答時間（ストリーミングでは最初のトークンまでの時間も）を保存し、
+    再生時は REPLAY_SPEED 倍の時間だけ待ってから返すことで、トークンやネットワーク無しで現実的な負荷を再現する。
+    """
+
+    def __init__(self, mode: str = CASSETTE_MODE, path: str = CASSETTE_PATH, speed: float = REPLAY_SPEED):
+        if mode not in MODES:
+            raise ValueError(f"未対応のカセットモードです: {mode}（{', '.join(MODES)}）")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode in ("replay", "replay_or_record")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode in ("record", "replay_or_record")
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is not None:
+            return self._entries
+        with self._lock:
+            if self._entries is None:
+                entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path, encoding="utf-8") as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                # 同じキーが複数ある場合は後から記録したものを使う
+                                entries[entry["key"]] = entry
+                    logger.info("LLMカセットを読み込みました: %s (%d件)", self.path, len(entries))
+                self._entries = entries
+        return self._entries
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """
+        記録済みの応答を返す。replay モードで見つからない場合は CassetteMiss を送出する。
+        """
+        if not self.replaying:
+            return None
+        entry = self._load().get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        if self.mode == "replay":
+            raise CassetteMiss(f"LLMカセットに記録されていない呼び出しです: {key}")
+        return None
+
+    def record(self, key: str, model: str, content: str, latency_sec: float, first_token_sec: Optional[float] = None, usage: Optional[Dict] = None):
+        if not self.recording:
+            return
+        entry = {
+            "key": key,
+            "model": model,
+            "content": content,
+            "latency_sec": round(latency_sec, 4),
+            "first_token_sec": round(first_token_sec, 4) if first_token_sec is not None else None,
+            "usage": usage,
+            "recorded_at": time.time(),
+        }
+        entries = self._load()
+        with self._lock:
+            entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def replay(self, entry: Dict) -> str:
+        time.sleep(entry["latency_sec"] * self.speed)
+        return entry["content"]
+
+    async def areplay(self, entry: Dict) -> str:
+        await asyncio.sleep(entry["latency_sec"] * self.speed)
+        return entry["content"]
+
+    async def astream(self, entry: Dict) -> AsyncIterator[str]:
+        """
+        記録した応答をチャンクに分けて返す。最初のチャンクまでは first_token_sec、残りは均等な間隔で待つ。
+        """
+        content = entry["content"]
+        first = entry.get("first_token_sec")
+        first = entry["latency_sec"] if first is None else first
+        size = max(1, REPLAY_CHUNK_CHARS)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        interval = max(0.0, entry["latency_sec"] - first) / len(pieces)
+        await asyncio.sleep(first * self.speed)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(interval * self.speed)
+            yield piece
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "entries": len(self._entries) if self._entries is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
+
+
+# プロセス全体で共有するカセット
+llm_cassette = LLMCassette()
@@ -0,0 +1,118 @@
+import os
+import threading
+import logging
+from typing import Dict, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+# LangChain & Model
+from langchain_openai import ChatOpenAI
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_anthropic import ChatAnthropic
+
+load_dotenv("/workspaces/hackson_support_agent/back/.env.local")
+
+logger = logging.getLogger(__name__)
+
+# keep-alive するコネクション数などのプール設定（環境変数で調整可能）
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+
+class LLMClientRegistry:
+    """
+    プロセス全体で共有する LLM クライアントのレジストリ。
+    (provider, model, temperature) をキーに、初回アクセス時にだけクライアントを生成して使い回す。
+    サービスをリクエストごとに生成しても、HTTP/gRPC のコネクションや TLS セッションは再利用される。
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, float], object] = {}
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+
+    def get(self, model_provider: str, model_type: str, temperature: float = 0.5):
+        key = (model_provider, model_type, float(temperature))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            # ロック待ちの間に他スレッドが生成している可能性があるため再確認
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create(model_provider, model_type, temperature)
+                self._clients[key] = client
+                logger.debug("LLMクライアントを生成しました: %s", key)
+            return client
+
+    def clear(self):
+        """
+        登録済みのクライアントを破棄する。テストや API キーの切り替え時に使う。
+        """
+        with self._lock:
+            self._clients.clear()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def _shared_http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits(), timeout=HTTP_TIMEOUT)
+        return self._http_client
+
+    def _shared_http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=HTTP_TIMEOUT)
+        return self._http_async_client
+
+    def _create(self, model_provider: str, model_type: str, temperature: float):
+        match model_provider:
+            case "google":
+                # gRPC チャネルはクライアントインスタンスが保持するため、インスタンスの共有で再利用される
+                api_key = os.getenv("GOOGLE_API_KEY")
+                return ChatGoogleGenerativeAI(
+                    model=model_type,
+                    temperature=temperature,
+                    api_key=api_key
+                )
+            case "openai":
+                api_key = os.getenv("OPENAI_API_KEY")
+                return ChatOpenAI(
+                    model=model_type,
+                    temperature=temperature,
+                    openai_api_key=api_key,
+                    http_client=self._shared_http_client(),
+                    http_async_client=self._shared_http_async_client(),
+                )
+            case "anthropic":
+                api_key = os.getenv("ANTHROPIC_API_KEY")
+                return ChatAnthropic(
+                    model=model_type,
+                    temperature=temperature,
+                    anthropic_api_key=api_key
+                )
+            case "fake":
+                # ネットワークを使わないテスト・ベンチマーク用のモデル（services/fake_llm.py）
+                from .fake_llm import FakeChatModel
+                return FakeChatModel(model=model_type, temperature=temperature)
+            case _:
+                raise ValueError(f"未対応のモデルプロバイダです: {model_provider}")
+
+
+# プロセス全体で共有するレジストリ
+llm_registry = LLMClientRegistry()
+
+
+def get_llm(model_provider: str, model_type: str, temperature: float = 0.5):
+    """
+    共有レジストリから LLM クライアントを取得する。
+    """
+    return llm_registry.get(model_provider, model_type, temperature)
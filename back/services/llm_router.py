@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .llm_scheduler import DeadlineExceeded
+from .telemetry import record_fallback
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# タスクの種類ごとのモデル候補。値は "provider:model" の優先順リスト。
+# キーには用途（"pro", "flash", "flash_thinking", "lite"）か、タスクの種類（"quality", "fast"）を指定する。
+# 例: {"quality": ["google:gemini-2.5-pro-preview-05-06", "anthropic:claude-sonnet-4-20250514"],
+#      "lite": ["google:gemini-2.0-flash-lite", "openai:gpt-4o-mini"]}
+# 指定の無い用途はサービスのデフォルトプロバイダのモデルだけを使う
+ROUTES_JSON = os.getenv("LLM_ROUTES", "")
+# 用途とタスクの種類（高品質 / 安価・高速）の対応
+TASK_CLASSES = {
+    "quality": ("pro", "flash_thinking"),
+    "fast": ("flash", "lite"),
+}
+# レイテンシとエラー率を集計する直近の呼び出し数
+STATS_WINDOW = int(os.getenv("LLM_ROUTE_STATS_WINDOW", "100"))
+# 連続してこの回数失敗したモデルは、COOLDOWN_SEC の間だけ候補の最後に回す
+FAILURE_THRESHOLD = int(os.getenv("LLM_ROUTE_FAILURE_THRESHOLD", "3"))
+COOLDOWN_SEC = float(os.getenv("LLM_ROUTE_COOLDOWN_SEC", "30"))
+# 直近のエラー率がこれを超えるモデルは、エラー率の低い候補より後に回す
+MAX_ERROR_RATE = float(os.getenv("LLM_ROUTE_MAX_ERROR_RATE", "0.5"))
+# ヘッジリクエスト: 1つ目の呼び出しが一定時間で返らなければ、次の候補にも同じリクエストを送り、先に成功した方を使う
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+# ヘッジを送るまでの待ち時間。未指定の場合は1つ目のモデルの p95 レイテンシ（ただし HEDGE_MIN_DELAY_SEC 以上）
+HEDGE_AFTER_SEC = os.getenv("LLM_HEDGE_AFTER_SEC")
+HEDGE_MIN_DELAY_SEC = float(os.getenv("LLM_HEDGE_MIN_DELAY_SEC", "2"))
+# p95 を使うのに必要な成功呼び出しの数。これより少ない場合は HEDGE_DEFAULT_DELAY_SEC を使う
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_SEC = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SEC", "10"))
+
+
+def parse_routes(raw: str) -> Dict[str, List[Tuple[str, str]]]:
+    """
+    LLM_ROUTES の JSON を {用途: [(provider, model), ...]} に変換する。
+    タスクの種類で指定したものは、その種類に属する用途に展開する（用途の直接指定が優先）。
+    """
+    if not raw:
+        return {}
+    try:
+        config = json.loads(raw)
+    except ValueError:
+        logger.error("LLM_ROUTES を JSON として解釈できません。ルーティングを無効にします: %s", raw)
+        return {}
+    routes: Dict[str, List[Tuple[str, str]]] = {}
+    for name, targets in config.items():
+        parsed = []
+        for target in targets:
+            provider, sep, model = target.partition(":")
+            if not sep or not model:
+                logger.error("LLM_ROUTES のモデル指定は provider:model の形式にしてください: %s", target)
+                continue
+            parsed.append((provider, model))
+        for tier in TASK_CLASSES.get(name, ()):
+            if tier not in config:
+                routes[tier] = parsed
+        if name not in TASK_CLASSES:
+            routes[name] = parsed
+    return routes
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelStats:
+    """
+    1つの (provider, model) の直近の呼び出し結果（レイテンシと成否）。
+    """
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.samples: deque = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.samples.append((latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.cooldown_until = time.monotonic() + COOLDOWN_SEC
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency(self, q: float) -> Optional[float]:
+        return _percentile([latency for latency, ok in self.samples if ok], q)
+
+    def successes(self) -> int:
+        return sum(1 for _, ok in self.samples if ok)
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+class LLMRouter:
+    """
+    プロセス全体で共有するモデルのルーティング。
+    - 用途ごとに設定したモデル候補を、直近のエラー率と連続失敗による一時除外を見て並べ替える
+    - 呼び出しが失敗したら次の候補にフォールバックする
+    - LLM_HEDGE を有効にすると、1つ目の候補が p95 レイテンシを超えても返らない場合に次の候補へ
+      同じリクエストを並行して送り、先に成功した応答を返す（もう一方はキャンセルする）
+    個々の候補への呼び出し（レート制限・再試行）は呼び出し側が LLMScheduler 経由で行う。
+    """
+
+    def __init__(self, routes: Optional[Dict[str, List[Tuple[str, str]]]] = None):
+        self._routes = parse_routes(ROUTES_JSON) if routes is None else routes
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def routes(self, tier: Optional[str]) -> List[Tuple[str, str]]:
+        """
+        用途に設定された (provider, model) の候補を返す。設定が無ければ空リスト。
+        """
+        return list(self._routes.get(tier, ())) if tier else []
+
+    def configure(self, routes: Dict[str, List[Tuple[str, str]]]):
+        """
+        ルーティング設定を差し替える。ベンチマークや設定の再読み込みに使う。
+        """
+        self._routes = routes
+
+    def stats_for(self, key: Tuple[str, str]) -> ModelStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, ModelStats())
+        return stats
+
+    def record(self, key: Tuple[str, str], latency: float, ok: bool):
+        self.stats_for(key).record(latency, ok)
+
+    def order(self, candidates: List[Tuple[Tuple[str, str], object]]) -> List[Tuple[Tuple[str, str], object]]:
+        """
+        (key, llm) の候補を、使える順に並べ替える。
+        一時除外中のモデル → エラー率が高いモデルの順に後ろへ回し、それ以外は設定の順序を保つ。
+        """
+        def rank(item):
+            index, (key, _) = item
+            stats = self.stats_for(key)
+            return (stats.cooling_down(), stats.error_rate > MAX_ERROR_RATE, index)
+
+        return [candidate for _, candidate in sorted(enumerate(candidates), key=rank)]
+
+    def hedge_delay(self, key: Tuple[str, str]) -> Optional[float]:
+        """
+        ヘッジリクエストを送るまでの待ち時間。ヘッジが無効な場合は None。
+        """
+        if not HEDGE_ENABLED:
+            return None
+        if HEDGE_AFTER_SEC:
+            return float(HEDGE_AFTER_SEC)
+        stats = self.stats_for(key)
+        if stats.successes() < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SEC
+        return max(HEDGE_MIN_DELAY_SEC, stats.latency(0.95))
+
+    def run(self, candidates: List[Tuple[Tuple[str, str], object]], call: Callable[[object], T]) -> T:
+        """
+        同期版。候補を順に呼び、最初に成功した結果を返す（ヘッジは行わない）。
+        """
+        error: Optional[Exception] = None
+        for key, llm in self.order(candidates):
+            started = time.monotonic()
+            try:
+                result = call(llm)
+            except Exception as e:
+                self.record(key, time.monotonic() - started, ok=False)
+                if isinstance(e, DeadlineExceeded):
+                    raise
+                record_fallback(key[1], "fallback")
+                logger.warning("LLM 呼び出しに失敗したため次の候補を試します %s: %s", key, e)
+                error = e
+                continue
+            self.record(key, time.monotonic() - started, ok=True)
+            return result
+        raise error
+
+    async def arun(self, candidates: List[Tuple[Tuple[str, str], object]], call: Callable[[object], Awaitable[T]]) -> T:
+        """
+        非同期版。失敗時は次の候補にフォールバックし、ヘッジが有効なら遅い呼び出しと並行して次の候補を呼ぶ。
+        """
+        queue = self.order(candidates)
+        if len(queue) == 1:
+            key, llm = queue[0]
+            return await self._timed(key, call(llm))
+
+        hedge_after = self.hedge_delay(queue[0][0])
+        pending: Dict[asyncio.Task, Tuple[str, str]] = {}
+        error: Optional[BaseException] = None
+
+        def launch():
+            key, llm = queue.pop(0)
+            pending[asyncio.ensure_future(self._timed(key, call(llm)))] = key
+
+        launch()
+        try:
+            while pending:
+                timeout = hedge_after if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 1つ目が遅いので次の候補にも送る（ヘッジは1回だけ）
+                    self.stats_for(queue[0][0]).hedges += 1
+                    record_fallback(queue[0][0][1], "hedge")
+                    logger.info("LLM 呼び出しが %.1f 秒を超えたため %s にもリクエストします", hedge_after, queue[0][0])
+                    hedge_after = None
+                    launch()
+                    continue
+                for task in done:
+                    key = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    if isinstance(error, DeadlineExceeded):
+                        raise error
+                    record_fallback(key[1], "fallback")
+                    logger.warning("LLM 呼び出しに失敗したため次の候補を試します %s: %s", key, error)
+                if not pending and queue:
+                    launch()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, key: Tuple[str, str], awaitable: Awaitable[T]) -> T:
+        started = time.monotonic()
+        try:
+            result = await awaitable
+        except asyncio.CancelledError:
+            # ヘッジで負けた呼び出しのキャンセルは失敗として数えない
+            raise
+        except Exception:
+            self.record(key, time.monotonic() - started, ok=False)
+            raise
+        self.record(key, time.monotonic() - started, ok=True)
+        return result
+
+    def stats(self) -> Dict[str, Dict]:
+        result = {}
+        for (provider, model), stats in list(self._stats.items()):
+            p50, p95 = stats.latency(0.5), stats.latency(0.95)
+            result[f"{provider}/{model}"] = {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "error_rate": round(stats.error_rate, 3),
+                "p50_sec": round(p50, 3) if p50 is not None else None,
+                "p95_sec": round(p95, 3) if p95 is not None else None,
+                "hedges": stats.hedges,
+                "cooling_down": stats.cooling_down(),
+            }
+        return result
+
+
+# プロセス全体で共有するルーター
+llm_router = LLMRouter()
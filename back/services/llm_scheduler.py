@@ -0,0 +1,257 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .telemetry import record_retry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 1モデルあたりの1分間の呼び出し上限（トークンバケットの補充速度）
+RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", "60"))
+# トークンバケットの容量（瞬間的に許すバースト数）
+BURST = float(os.getenv("LLM_RATE_BURST", "10"))
+# 同時実行数の初期値・下限・上限（AIMD で調整される）
+INITIAL_CONCURRENCY = float(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+MIN_CONCURRENCY = float(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+MAX_CONCURRENCY = float(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# この時間を超える応答は混雑のサインとみなし、同時実行数を増やさない
+LATENCY_TARGET_SEC = float(os.getenv("LLM_LATENCY_TARGET_SEC", "30"))
+# リトライ回数とバックオフ
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SEC = float(os.getenv("LLM_BACKOFF_BASE_SEC", "0.5"))
+BACKOFF_MAX_SEC = float(os.getenv("LLM_BACKOFF_MAX_SEC", "20"))
+
+# リクエスト単位の締め切り（time.monotonic() 基準）
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """
+    リクエストの締め切りまでに LLM 呼び出しが完了しなかった。
+    """
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    この with ブロック内の LLM 呼び出しに締め切りを設定する。
+    既により早い締め切りが設定されている場合はそちらを優先する。
+    """
+    if seconds is None:
+        yield
+        return
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(current, new_deadline) if current else new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    プロバイダからの 429 / クォータ超過エラーかどうかを判定する。
+    プロバイダごとに例外クラスが異なるため、ステータスコードと名前・メッセージで判定する。
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(s in text for s in ("429", "resourceexhausted", "resource_exhausted", "rate limit", "ratelimit", "quota"))
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    時間をおけば成功する可能性が高いエラー（タイムアウト・5xx・接続エラー）かどうか。
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(s in text for s in ("serviceunavailable", "deadlineexceeded", "internalservererror", "timeout", "503", "502"))
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    指数バックオフ（full jitter）の待ち時間を返す。attempt は 1 始まり。
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** (attempt - 1))))
+
+
+class TokenBucket:
+    """
+    非同期のトークンバケット。rate_per_sec の速度で補充され、最大 capacity まで貯まる。
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate_per_sec
+                remaining = remaining_time()
+                if remaining is not None and remaining < wait:
+                    raise DeadlineExceeded("レート制限の待機中に締め切りを過ぎました")
+                await asyncio.sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    AIMD（加算的増加・乗算的減少）で同時実行数を調整するリミッタ。
+    成功するたびに上限を 1/limit ずつ増やし、429 を受けたら半分にする。
+    """
+
+    def __init__(self, initial: float, minimum: float, maximum: float):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            remaining = remaining_time()
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_flight < int(self.limit)),
+                    timeout=remaining,
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("同時実行枠の待機中に締め切りを過ぎました")
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if latency <= LATENCY_TARGET_SEC:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class ModelLane:
+    """
+    1つの (provider, model) に対するレート制限と同時実行制御の組。
+    """
+
+    def __init__(self):
+        # asyncio のロックはイベントループに紐づくため、作成時のループを覚えておく
+        self.loop = asyncio.get_running_loop()
+        self.bucket = TokenBucket(RATE_PER_MIN / 60, BURST)
+        self.limiter = AIMDLimiter(INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY)
+        self.throttled = 0
+
+    async def acquire(self):
+        await self.bucket.acquire()
+        await self.limiter.acquire()
+
+    async def release(self):
+        await self.limiter.release()
+
+
+class LLMScheduler:
+    """
+    プロセス全体で共有する LLM 呼び出しのスケジューラ。
+    モデルごとにトークンバケットと AIMD リミッタを持ち、429 や一時的なエラーは
+    ジッタ付き指数バックオフで再試行する。deadline() で設定した締め切りを超える待機・再試行は行わない。
+    """
+
+    def __init__(self):
+        self._lanes: Dict[Tuple[str, str], ModelLane] = {}
+
+    def lane(self, key: Tuple[str, str]) -> ModelLane:
+        """
+        モデルごとのレーンを返す。イベントループ内から呼ぶこと。
+        別のイベントループ（テストクライアントなど）から呼ばれた場合はレーンを作り直す。
+        """
+        lane = self._lanes.get(key)
+        if lane is None or lane.loop is not asyncio.get_running_loop():
+            lane = self._lanes[key] = ModelLane()
+        return lane
+
+    async def run(self, key: Tuple[str, str], call: Callable[[], Awaitable[T]], max_retries: int = MAX_RETRIES) -> T:
+        lane = self.lane(key)
+        attempt = 0
+        while True:
+            attempt += 1
+            await lane.acquire()
+            started = time.monotonic()
+            try:
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceeded("LLM 呼び出し前に締め切りを過ぎました")
+                result = await asyncio.wait_for(call(), timeout=remaining)
+                lane.limiter.on_success(time.monotonic() - started)
+                return result
+            except asyncio.TimeoutError as e:
+                if remaining_time() is not None and remaining_time() <= 0:
+                    raise DeadlineExceeded("LLM 呼び出し中に締め切りを過ぎました") from e
+                error = e
+            except Exception as e:
+                error = e
+            finally:
+                await lane.release()
+
+            if is_rate_limited(error):
+                lane.throttled += 1
+                lane.limiter.on_overload()
+            elif not is_transient(error):
+                raise error
+            if attempt > max_retries:
+                raise error
+            delay = backoff_delay(attempt)
+            remaining = remaining_time()
+            if remaining is not None and remaining < delay:
+                raise error
+            record_retry(key[1], "rate_limited" if is_rate_limited(error) else "transient")
+            logger.warning("LLM 呼び出しを再試行します %s (試行 %d, %.2f秒後): %s", key, attempt, delay, error)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            f"{provider}/{model}": {
+                "concurrency_limit": round(lane.limiter.limit, 2),
+                "in_flight": lane.limiter.in_flight,
+                "throttled": lane.throttled,
+            }
+            for (provider, model), lane in self._lanes.items()
+        }
+
+
+# プロセス全体で共有するスケジューラ
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,57 @@
+from typing import List, Literal
+from pydantic import BaseModel, Field
+
+# with_structured_output に渡す出力スキーマ。
+# フィールド名は各サービスの StructuredOutputParser が期待する JSON と一致させている。
+
+
+class QuestionItem(BaseModel):
+    Question: str = Field(description="仕様を決めるための質問")
+    Answer: str = Field(description="質問に対する回答例")
+
+
+class QuestionsOutput(BaseModel):
+    Question: List[QuestionItem] = Field(description="質問と回答例のリスト")
+
+
+class TaskOutputItem(BaseModel):
+    task_name: str = Field(description="タスク名")
+    priority: Literal["Must", "Should", "Could"] = Field(description="優先度")
+    content: str = Field(description="タスクの具体的な内容")
+
+
+class TasksOutput(BaseModel):
+    tasks: List[TaskOutputItem] = Field(description="アプリ制作に必要なタスクの一覧")
+
+
+class TaskDetailOutputItem(TaskOutputItem):
+    detail: str = Field(description="タスクの詳細な手順（Markdown）")
+
+
+class TaskDetailsOutput(BaseModel):
+    tasks: List[TaskDetailOutputItem] = Field(description="入力の各タスクに detail を追加した配列")
+
+
+class EdgeOutput(BaseModel):
+    parent: int = Field(description="先に行うタスクの task_id")
+    child: int = Field(description="parent の完了後に行うタスクの task_id")
+
+
+class EdgesOutput(BaseModel):
+    edges: List[EdgeOutput] = Field(description="タスク間の依存関係")
+
+
+class EffortOutput(BaseModel):
+    task_id: int = Field(description="タスクID")
+    days: float = Field(description="作業量（日数、0.5刻み）")
+
+
+class EffortsOutput(BaseModel):
+    efforts: List[EffortOutput] = Field(description="各タスクの作業量")
+
+
+class HandsOnOutput(BaseModel):
+    overall: str = Field(description="全体の環境構築ハンズオンの説明（Markdown）")
+    devcontainer: str = Field(description=".devcontainer の使い方と設定内容の詳細説明（Markdown）")
+    frontend: str = Field(description="フロントエンドの初期環境構築手順の詳細説明（Markdown）")
+    backend: str = Field(description="バックエンドの初期環境構築手順の詳細説明（Markdown）")
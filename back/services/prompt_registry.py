@@ -0,0 +1,54 @@
+import functools
+import threading
+from typing import Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class PromptRegistry:
+    """
+    プロンプトテンプレート・出力パーサ・チェーンをプロセス内で1度だけ組み立てて使い回すレジストリ。
+    ResponseSchema の生成、get_format_instructions()、textwrap.dedent、ChatPromptTemplate の構築は
+    呼び出しごとに行う必要がないため、初回アクセス時に作成したものを返す。
+    """
+
+    def __init__(self):
+        self._entries: Dict[Hashable, object] = {}
+        # チェーンの組み立て中にプロンプトを取得する入れ子呼び出しがあるため再入可能なロックを使う
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, factory: Callable[[], T]) -> T:
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = factory()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# プロセス全体で共有するレジストリ
+prompt_registry = PromptRegistry()
+
+
+def compiled(method: Callable[..., T]) -> Callable[..., T]:
+    """
+    引数なしのチェーン・プロンプト生成メソッドの結果を prompt_registry に保存するデコレータ。
+    キーは (サービスクラス, メソッド名, model_provider)。チェーンが参照する LLM も
+    レジストリ共有のクライアントなので、同じキーであれば同じチェーンを再利用できる。
+    元の生成処理は method.__wrapped__ で呼べる。
+    """
+
+    @functools.wraps(method)
+    def wrapper(self):
+        key = (type(self).__qualname__, method.__name__, getattr(self, "model_provider", None))
+        return prompt_registry.get(key, lambda: method(self))
+
+    return wrapper
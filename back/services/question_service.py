@@ -2,6 +2,8 @@ from langchain.prompts import PromptTemplate, ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain.schema.runnable import RunnableSequence
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .output_schemas import QuestionsOutput
 
 class QuestionService(BaseService):
     def __init__(self):
@@ -11,6 +13,20 @@ class QuestionService(BaseService):
         """
         Q&Aの質問と想定回答を生成するメソッド。
         """
+        chain = self._question_chain()
+        result = chain.invoke({"idea_prompt": idea_prompt})
+        return {"result": {"Question": result["Question"]}}
+
+    async def agenerate_question(self, idea_prompt: str):
+        """
+        generate_question の非同期版。
+        """
+        chain = self._question_chain()
+        result = await chain.ainvoke({"idea_prompt": idea_prompt})
+        return {"result": {"Question": result["Question"]}}
+
+    @compiled
+    def _question_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="Question",
@@ -35,6 +51,4 @@ class QuestionService(BaseService):
             partial_variables={"format_instructions": parser.get_format_instructions()},
         )
 
-        chain = prompt_template | self.llm_flash_thinking | parser
-        result = chain.invoke({"idea_prompt": idea_prompt})
-        return {"result": {"Question": result["Question"]}}
+        return prompt_template | self._managed(self.llm_flash_thinking, schema=QuestionsOutput) | parser
@@ -0,0 +1,68 @@
+import contextvars
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# リクエストが対象とするプロジェクト（コンテキストキャッシュなどのキーに使う）
+_project_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("project_id", default=None)
+# 処理中の HTTP リクエストの ASGI scope（使用量をエンドポイントごとに集計するために使う）
+_http_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("http_scope", default=None)
+
+
+@contextmanager
+def project_scope(project_id: Optional[str]):
+    """
+    この with ブロック内の LLM 呼び出しを project_id のプロジェクトに紐づける。
+    """
+    token = _project_id.set(project_id)
+    try:
+        yield
+    finally:
+        _project_id.reset(token)
+
+
+def current_project_id() -> Optional[str]:
+    return _project_id.get()
+
+
+@contextmanager
+def request_scope(scope: dict):
+    """
+    この with ブロック内の処理を、ASGI scope の HTTP リクエストに紐づける（MetricsMiddleware が設定する）。
+    """
+    token = _http_scope.set(scope)
+    try:
+        yield
+    finally:
+        _http_scope.reset(token)
+
+
+def route_template(scope) -> str:
+    """
+    ルーティング後に scope に入るルートのテンプレート（/projects/{project_id} など）を返す。
+    include_router したルートは scope["route"] がプレフィックス無しのパスになる版があるため、
+    FastAPI が記録するプレフィックス込みのパスを優先する。一致するルートが無ければ "unmatched"。
+    """
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+def current_endpoint() -> Optional[str]:
+    """
+    処理中のリクエストのメソッドとルートのテンプレート（"POST /api/tasks/" など）。リクエスト外では None。
+    """
+    scope = _http_scope.get()
+    if scope is None:
+        return None
+    return f"{scope.get('method', '')} {route_template(scope)}".strip()
+
+
+async def scoped_stream(project_id: Optional[str], events: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    ストリーミング応答用。StreamingResponse が events を読み進める間だけ project_scope を有効にする。
+    """
+    with project_scope(project_id):
+        async for event in events:
+            yield event
@@ -0,0 +1,159 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 1チャンクの最大文字数と、長い段落を分割するときの重なり
+CHUNK_MAX_CHARS = int(os.getenv("RETRIEVAL_CHUNK_MAX_CHARS", "600"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_CHARS", "80"))
+# メモリに保持するプロジェクトのインデックス数
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_INDEX_CACHE_MAX_ENTRIES", "64"))
+
+_ASCII_WORD = re.compile(r"[a-z0-9_]+")
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-鿿豈-﫿ｦ-ﾟ]+")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\n(?=#)")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 用の簡易トークナイザ。英数字は単語単位、日本語は文字 bigram（1文字の語は unigram）に分ける。
+    形態素解析器を使わずに日本語の仕様書を検索できるようにするため。
+    """
+    text = text.lower()
+    tokens = _ASCII_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_MAX_CHARS, overlap: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """
+    空行・見出しで段落に分け、max_chars 以内になるように段落をまとめる。
+    1段落が長すぎる場合は overlap 文字ずつ重ねて分割する。
+    """
+    chunks: List[str] = []
+    current = ""
+    for paragraph in _PARAGRAPH_BREAK.split(text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            step = max(1, max_chars - overlap)
+            chunks.extend(paragraph[i:i + max_chars] for i in range(0, len(paragraph), step) if paragraph[i:i + max_chars].strip())
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_chunks(specification: str, directory: str, tasks: Iterable[Dict]) -> List[Dict]:
+    """
+    仕様書・ディレクトリ構成・各タスク（名前・内容・詳細）をチャンクに分ける。
+    """
+    chunks = []
+    for source, text, title in [("specification", specification, "仕様書"), ("directory", directory, "ディレクトリ構成")]:
+        for position, chunk in enumerate(chunk_text(text)):
+            chunks.append({"source": source, "position": position, "title": title, "text": chunk})
+    for task in tasks:
+        chunks.extend(build_task_chunks(task))
+    return chunks
+
+
+def build_task_chunks(task: Dict) -> List[Dict]:
+    """
+    1タスク（名前・内容・詳細）のチャンク。出典は "task:<task_id>"。
+    """
+    body = "\n\n".join(part for part in (task.get("content"), task.get("detail")) if part)
+    return [
+        {"source": f"task:{task['task_id']}", "position": position, "title": task.get("task_name"), "text": chunk}
+        for position, chunk in enumerate(chunk_text(f"{task.get('task_name', '')}\n\n{body}"))
+    ]
+
+
+class BM25Index:
+    """
+    チャンクのリストに対する Okapi BM25 の転置インデックス。
+    """
+
+    def __init__(self, chunks: List[Dict], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for i, chunk in enumerate(chunks):
+            tf = Counter(tokenize(f"{chunk.get('title') or ''}\n{chunk['text']}"))
+            self._lengths.append(sum(tf.values()))
+            for term, count in tf.items():
+                self._postings.setdefault(term, []).append((i, count))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n = len(chunks)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """
+        スコアの高い順に最大 k 件のチャンクを返す（score を付ける）。一致する語が無ければ空リスト。
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1))
+                scores[i] = scores.get(i, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [{**self.chunks[i], "score": round(score, 4)} for i, score in ranked]
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+class ProjectIndexCache:
+    """
+    プロジェクトごとの BM25Index を (project_id, built_at) をキーにメモリに保持する LRU。
+    チャンクの保存時刻が変わったら作り直す。
+    """
+
+    def __init__(self, max_entries: int = INDEX_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, BM25Index]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, project_id: str, built_at: float) -> Optional[BM25Index]:
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is None or entry[0] != built_at:
+                return None
+            self._entries.move_to_end(project_id)
+            return entry[1]
+
+    def put(self, project_id: str, built_at: float, index: BM25Index):
+        with self._lock:
+            self._entries[project_id] = (built_at, index)
+            self._entries.move_to_end(project_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, project_id: str):
+        with self._lock:
+            self._entries.pop(project_id, None)
+
+
+# プロセス全体で共有するキャッシュ
+project_indexes = ProjectIndexCache()
@@ -0,0 +1,159 @@
+import re
+import heapq
+import math
+from typing import List, Dict, Optional
+
+from .task_graph import TaskGraph
+
+# 優先度ごとの作業量の目安（日）。LLM で見積もらない場合に使う
+PRIORITY_EFFORT = {"Must": 2.0, "Should": 1.5, "Could": 1.0}
+
+# 期間の単位 → 日数
+_DURATION_UNITS = [
+    (r"(\d+(?:\.\d+)?)\s*(?:ヶ月|か月|カ月|ヵ月|month|months)", 30),
+    (r"(\d+(?:\.\d+)?)\s*(?:週間|週|week|weeks)", 7),
+    (r"(\d+(?:\.\d+)?)\s*(?:日|day|days)", 1),
+    (r"(\d+(?:\.\d+)?)\s*(?:時間|hour|hours|h)", 1 / 24),
+]
+
+
+def parse_duration_days(duration) -> Optional[int]:
+    """
+    "10", "10日", "2週間", "48時間" などの期間表記を日数に変換する。解釈できない場合は None を返す。
+    """
+    if isinstance(duration, (int, float)):
+        return max(1, math.ceil(duration))
+    text = str(duration).strip().lower()
+    if not text:
+        return None
+    for pattern, days in _DURATION_UNITS:
+        m = re.search(pattern, text)
+        if m:
+            return max(1, math.ceil(float(m.group(1)) * days))
+    m = re.search(r"\d+(?:\.\d+)?", text)
+    if m:
+        return max(1, math.ceil(float(m.group(0))))
+    return None
+
+
+def estimate_effort(task: Dict) -> float:
+    """
+    タスクの優先度と内容の長さから作業量（日）を簡易的に見積もる。
+    """
+    base = PRIORITY_EFFORT.get(task.get("priority"), 1.0)
+    # 内容が長いタスクほど重いとみなす（最大 +1 日）
+    length_bonus = min(len(task.get("content", "")) / 400, 1.0)
+    return base + length_bonus
+
+
+def schedule_tasks(
+    tasks: List[Dict],
+    edges: Optional[List[Dict]] = None,
+    efforts: Optional[Dict[int, float]] = None,
+    duration_days: Optional[int] = None,
+    num_people: int = 1,
+    stretch: bool = False,
+) -> List[Dict]:
+    """
+    依存関係（parent → child）、各タスクの作業量、人数をもとに、
+    クリティカルパスを優先するリストスケジューリングで開始日・終了日を算出する。
+
+    - efforts が無いタスクは estimate_effort で見積もる
+    - 人数分の作業者が同時に作業でき、1タスクは1人が担当する
+    - 全体が duration_days を超える場合は期間内に収まるよう圧縮する
+      （stretch=True の場合は短い場合も期間いっぱいに引き伸ばす）
+    - 不正なエッジや循環は TaskGraph で除去・修復してから計算する
+    - 日単位に丸めた後も、子タスクは親タスクの終了日の翌日以降に始まる
+      （期間が短すぎて収まらない場合のみ、最終日に親子が重なる）
+
+    戻り値は [{"task_id": 0, "start": 1, "end": 3}, ...]（日は1始まり、end を含む）。
+    """
+    if not tasks:
+        return []
+    ids = [t["task_id"] for t in tasks]
+    order = {task_id: i for i, task_id in enumerate(ids)}
+    efforts = efforts or {}
+    effort = {
+        t["task_id"]: max(float(efforts.get(t["task_id"]) or estimate_effort(t)), 0.5)
+        for t in tasks
+    }
+
+    graph = TaskGraph(ids, edges or [])
+    graph.repair_cycles()
+    children = {i: sorted(graph.children(i)) for i in ids}
+
+    # 後続タスクを含めた残り作業量（クリティカルパス長）を優先度にする
+    rank: Dict[int, float] = {}
+    for task_id in reversed(graph.topological_sort()):
+        rank[task_id] = effort[task_id] + max((rank[c] for c in children[task_id]), default=0.0)
+
+    remaining = {i: len(graph.parents(i)) for i in ids}
+    ready = [(-rank[i], order[i], i) for i in ids if remaining[i] == 0]
+    heapq.heapify(ready)
+    # (終了時刻, 作業者番号)
+    workers = [(0.0, w) for w in range(max(1, num_people))]
+    heapq.heapify(workers)
+    finish_events: List[tuple] = []
+    earliest: Dict[int, float] = {i: 0.0 for i in ids}
+    start_at: Dict[int, float] = {}
+    end_at: Dict[int, float] = {}
+
+    while len(end_at) < len(ids):
+        if not ready:
+            # 着手可能なタスクが無ければ、次に終わるタスクの完了を待つ
+            _complete(heapq.heappop(finish_events), children, remaining, earliest, ready, rank, order, end_at)
+            continue
+
+        free_at, worker = heapq.heappop(workers)
+        # 作業者が空くまでに終わるタスクの後続も候補に入れる
+        while finish_events and finish_events[0][0] <= free_at:
+            _complete(heapq.heappop(finish_events), children, remaining, earliest, ready, rank, order, end_at)
+        _, _, task_id = heapq.heappop(ready)
+        start = max(free_at, earliest[task_id])
+        end = start + effort[task_id]
+        start_at[task_id] = start
+        heapq.heappush(workers, (end, worker))
+        heapq.heappush(finish_events, (end, order[task_id], task_id))
+        if len(start_at) == len(ids):
+            while finish_events:
+                _complete(heapq.heappop(finish_events), children, remaining, earliest, ready, rank, order, end_at)
+
+    makespan = max(end_at.values())
+    scale = 1.0
+    if duration_days and (makespan > duration_days or stretch):
+        scale = duration_days / makespan
+
+    days: Dict[int, List[int]] = {}
+    for task_id in ids:
+        start_day = int(math.floor(start_at[task_id] * scale)) + 1
+        end_day = max(start_day, int(math.ceil(end_at[task_id] * scale)))
+        days[task_id] = [start_day, end_day]
+    # 日単位に丸めると親の終了日と子の開始日が重なることがあるため、
+    # トポロジカル順に子の開始日を親の終了日の翌日以降へずらす（期間の長さは保つ）
+    for task_id in graph.topological_sort():
+        start_day, end_day = days[task_id]
+        earliest_day = max((days[p][1] + 1 for p in graph.parents(task_id)), default=1)
+        if start_day < earliest_day:
+            days[task_id] = [earliest_day, earliest_day + end_day - start_day]
+
+    result = []
+    for task_id in ids:
+        start_day, end_day = days[task_id]
+        if duration_days:
+            # 期間に収まらない分は最終日に寄せる（親子が同じ日になるのは最終日だけ）
+            end_day = min(end_day, duration_days)
+            start_day = min(start_day, end_day)
+        result.append({"task_id": task_id, "start": start_day, "end": end_day})
+    return result
+
+
+def _complete(event, children, remaining, earliest, ready, rank, order, end_at):
+    end, _, task_id = event
+    if task_id in end_at:
+        return
+    end_at[task_id] = end
+    for child in children[task_id]:
+        earliest[child] = max(earliest[child], end)
+        remaining[child] -= 1
+        if remaining[child] == 0:
+            heapq.heappush(ready, (-rank[child], order[child], child))
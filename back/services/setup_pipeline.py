@@ -0,0 +1,129 @@
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from .directory_service import DirectoryService
+from .tasks_service import TasksService, FALLBACK_TASK_NAME
+from .environment_service import EnvironmentService
+from .taskDetail_service import TaskDetailService
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(NamedTuple):
+    """
+    パイプラインの1段階。deps の段階の結果が揃ってから run(results) を実行する。
+    """
+    name: str
+    deps: Sequence[str]
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+async def run_stages(stages: List[Stage]) -> AsyncIterator[tuple]:
+    """
+    依存する段階が完了したものから並行に実行し、完了した順に (name, result, 開始からの秒数) を返す。
+    いずれかの段階が失敗した場合は、実行中の段階をキャンセルして例外を送出する。
+    """
+    started = time.monotonic()
+    results: Dict[str, Any] = {}
+    remaining = list(stages)
+    pending: Dict[asyncio.Future, str] = {}
+    try:
+        while remaining or pending:
+            for stage in [s for s in remaining if all(dep in results for dep in s.deps)]:
+                remaining.remove(stage)
+                pending[asyncio.ensure_future(stage.run(results))] = stage.name
+            if not pending:
+                raise ValueError(f"依存関係を解決できない段階があります: {[s.name for s in remaining]}")
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                results[name] = future.result()
+                yield name, results[name], time.monotonic() - started
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class SetupFailed(Exception):
+    """
+    セットアップの段階が使える結果を返さなかった（フォールバックの応答など）。
+    """
+
+
+class SetupPipeline:
+    """
+    プロジェクトのセットアップに必要な生成を、依存関係に沿って1つのリクエストの中で実行する。
+        directory ─┬─ tasks ── task_details
+                   └─ environment
+    フロントエンドが API を1つずつ順番に呼ぶ場合と違い、environment は tasks・task_details と並行に実行する。
+    """
+
+    def __init__(self, specification: str, framework: str, batch_size: int = 3, deadline_sec: Optional[float] = None):
+        self.specification = specification
+        self.framework = framework
+        self.batch_size = batch_size
+        self.deadline_sec = deadline_sec
+        self.results: Dict[str, Any] = {}
+
+    async def astream(self) -> AsyncIterator[Dict]:
+        """
+        段階が完了するたびにイベントを返す。
+        - {"type": "stage", "stage": "directory", "result": ..., "elapsed_sec": 1.2}
+        - {"type": "progress", "stage": "task_details", "completed": 3, "total": 10}
+        すべての段階の結果は self.results に残る。
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        stages = [
+            Stage("directory", (), self._directory),
+            Stage("tasks", ("directory",), self._tasks),
+            Stage("environment", ("directory",), self._environment),
+            Stage("task_details", ("tasks",), lambda results: self._task_details(results, events)),
+        ]
+
+        async def run():
+            try:
+                async for name, result, elapsed in run_stages(stages):
+                    self.results[name] = result
+                    events.put_nowait({"type": "stage", "stage": name, "result": result, "elapsed_sec": round(elapsed, 3)})
+            finally:
+                events.put_nowait(None)
+
+        runner = asyncio.ensure_future(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            # 失敗した段階の例外をここで送出する
+            await runner
+        finally:
+            runner.cancel()
+
+    async def _directory(self, results: Dict) -> str:
+        return await DirectoryService().agenerate_directory_structure(framework=self.framework, specification=self.specification)
+
+    async def _tasks(self, results: Dict) -> List[Dict]:
+        tasks = await TasksService().agenerate_tasks(self.specification, results["directory"], self.framework)
+        failed = [task for task in tasks if task.get("task_name") == FALLBACK_TASK_NAME]
+        if failed:
+            raise SetupFailed(failed[0].get("content") or "タスクの生成に失敗しました")
+        return tasks
+
+    async def _environment(self, results: Dict) -> Dict:
+        return await EnvironmentService().agenerate_hands_on(self.specification, results["directory"], self.framework)
+
+    async def _task_details(self, results: Dict, events: asyncio.Queue) -> List[Dict]:
+        tasks = results["tasks"]
+        detailed: List[Optional[Dict]] = [None] * len(tasks)
+        completed = 0
+        async for event in TaskDetailService().astream_task_details(tasks, self.specification, self.batch_size, self.deadline_sec):
+            if event["type"] != "batch":
+                continue
+            for task in event["tasks"]:
+                detailed[task["task_index"]] = task
+            completed += len(event["tasks"])
+            events.put_nowait({"type": "progress", "stage": "task_details", "completed": completed, "total": len(tasks)})
+        return detailed
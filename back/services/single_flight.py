@@ -0,0 +1,100 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from .request_context import current_project_id
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 同じ内容のリクエストが処理中なら、LLM を呼ばずにその結果を待つかどうか
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _normalize(value: Any) -> Any:
+    """
+    文字列の前後の空白・行末の空白・改行コードの違いを無視できるように揃える。
+    """
+    if isinstance(value, str):
+        return "\n".join(line.rstrip() for line in value.strip().splitlines())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def flight_key(name: str, payload: Dict, project_id: Optional[str] = None) -> str:
+    """
+    処理の名前・プロジェクトID・正規化したリクエスト内容からキーを作る。
+    """
+    body = json.dumps({"name": name, "project_id": project_id, "payload": _normalize(payload)}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    プロセス全体で共有するリクエストの合流（single-flight）。
+    同じキーの処理が実行中の間に来た呼び出しは、新しく実行せずに実行中の処理の結果（または例外）を受け取る。
+    処理は最初の呼び出しのコンテキスト（project_scope など）で別タスクとして実行する。使用量の記録と予算の確認は
+    そのプロジェクトに対して行われるため、合流するのは同じプロジェクト（current_project_id）の呼び出しに限る。
+    別タスクなので、最初のリクエストが切断されても、待っている他のリクエストには結果が届く。待つ呼び出しが全て無くなった場合だけ処理をキャンセルする。
+    完了した結果は保持しない（繰り返しの呼び出しは応答キャッシュが受け持つ）。
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, name: str, payload: Dict, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        name と payload が同じ処理が実行中ならその結果を待ち、無ければ factory() を実行する。
+        """
+        if not self.enabled:
+            return await factory()
+        key = flight_key(name, payload, current_project_id())
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.debug("実行中の同じリクエストの結果を待ちます: %s", name)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+# プロセス全体で共有する合流の管理
+single_flight = SingleFlight()
@@ -0,0 +1,33 @@
+import json
+from typing import AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+
+def format_sse(event: Dict) -> str:
+    """
+    イベントの dict を Server-Sent Events の1メッセージに変換する。
+    event フィールドに type を、data フィールドに JSON を載せる。
+    """
+    data = json.dumps(event, ensure_ascii=False)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
+
+
+async def _sse_iter(events: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            yield format_sse(event)
+    except Exception as e:
+        # ストリーム開始後は HTTP ステータスを変えられないため、エラーイベントとして通知する
+        yield format_sse({"type": "error", "detail": str(e)})
+
+
+def sse_response(events: AsyncIterator[Dict]) -> StreamingResponse:
+    """
+    イベントの非同期イテレータを SSE の StreamingResponse として返す。
+    """
+    return StreamingResponse(
+        _sse_iter(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
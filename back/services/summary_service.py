@@ -1,6 +1,7 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
 
 class SummaryService(BaseService):
     def __init__(self):
@@ -10,11 +11,36 @@ class SummaryService(BaseService):
         """
         ユーザーのQ&A回答リストから要約を生成する。
         """
+        chain = self._summary_chain()
+        return chain.invoke({"question_answer": self._format_question_answer(question_answer)})
+
+    async def agenerate_summary_docment(self, question_answer: list[dict]):
+        """
+        generate_summary_docment の非同期版。
+        """
+        chain = self._summary_chain()
+        return await chain.ainvoke({"question_answer": self._format_question_answer(question_answer)})
+
+    def astream_summary_docment(self, question_answer: list[dict]):
+        """
+        generate_summary_docment のストリーミング版。トークンごとのイベントを非同期に返す。
+        """
+        return self._astream_text(
+            self._summary_prompt(), self.llm_pro, {"question_answer": self._format_question_answer(question_answer)}
+        )
+
+    def _format_question_answer(self, question_answer: list[dict]) -> str:
         # list[dict] => "Q: 〇〇\nA: 〇〇" のテキストに変換
-        question_answer_str = "\n".join(
+        return "\n".join(
             [f"Q: {item.dict()['Question']}\nA: {item.dict()['Answer']}" for item in question_answer]
         )
 
+    @compiled
+    def _summary_chain(self):
+        return self._summary_prompt() | self._managed(self.llm_pro) | StrOutputParser()
+
+    @compiled
+    def _summary_prompt(self):
 
         yume_summary_system_prompt = ChatPromptTemplate.from_template(
             template="""
@@ -31,6 +57,4 @@ class SummaryService(BaseService):
             """
         )
 
-        chain = yume_summary_system_prompt | self.llm_pro | StrOutputParser()
-        yume_summary = chain.invoke({"question_answer": question_answer_str})
-        return yume_summary
+        return yume_summary_system_prompt
@@ -1,43 +1,79 @@
-from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
 
 class taskChatService(BaseService):
     def __init__(self):
         super().__init__()
 
-    def generate_response(self, specification: str, directory_structure: str, chat_history: str, user_question: str, framework: str, taskDetail: str) -> str:
+    def generate_response(self, specification: str, directory_structure: str, chat_history: str, user_question: str, framework: str, taskDetail: str, excerpts: str = "") -> str:
         """
         仕様書、ディレクトリ構造、チャット履歴、新たなユーザーからの質問内容、
         使用しているフレームワークに基づいて、最適な回答をテキスト形式で生成する。
+        excerpts には質問に関連する仕様書・タスクの抜粋を渡す（長い仕様書で回答の根拠を示すため。省略可）。
         """
-        prompt_template = ChatPromptTemplate.from_template(
-            template="""
-            あなたはエンジニアを補助するプロフェッショナルなChatBotです。以下の情報を元に、ユーザーの質問に対して最適な回答をテキスト形式で提供してください。
+        chain = self._chat_chain()
+        return chain.invoke({
+            "specification": specification,
+            "directory_structure": directory_structure,
+            "chat_history": chat_history,
+            "user_question": user_question,
+            "framework": framework,
+            "taskDetail": taskDetail,
+            "excerpts": excerpts or "（なし）",
+        })
+
+    async def agenerate_response(self, specification: str, directory_structure: str, chat_history: str, user_question: str, framework: str, taskDetail: str, excerpts: str = "") -> str:
+        """
+        generate_response の非同期版。
+        """
+        chain = self._chat_chain()
+        return await chain.ainvoke({
+            "specification": specification,
+            "directory_structure": directory_structure,
+            "chat_history": chat_history,
+            "user_question": user_question,
+            "framework": framework,
+            "taskDetail": taskDetail,
+            "excerpts": excerpts or "（なし）",
+        })
+
+    def astream_response(self, specification: str, directory_structure: str, chat_history: str, user_question: str, framework: str, taskDetail: str, excerpts: str = ""):
+        """
+        generate_response のストリーミング版。トークンごとのイベントを非同期に返す。
+        """
+        return self._astream_text(self._chat_prompt(), self.llm_flash, {
+            "specification": specification,
+            "directory_structure": directory_structure,
+            "chat_history": chat_history,
+            "user_question": user_question,
+            "framework": framework,
+            "taskDetail": taskDetail,
+            "excerpts": excerpts or "（なし）",
+        })
+
+    @compiled
+    def _chat_chain(self):
+        return self._chat_prompt() | self._managed(self.llm_flash) | StrOutputParser()
+
+    @compiled
+    def _chat_prompt(self):
+        # 仕様書・ディレクトリ構造・フレームワークはチャットの各ターンで共通なので先頭に置く
+        return context_prompt(
+            project_context("specification", "directory_structure", "framework"),
+            """
+            あなたはエンジニアを補助するプロフェッショナルなChatBotです。上記の情報を元に、ユーザーの質問に対して最適な回答をテキスト形式で提供してください。
             ユーザーが着手しているのはタスク詳細の内容で、仕様書、ディレクトリ構造などは全体を包括したものです。
             また、マークダウン形式で回答してください。
             現在のタスク詳細:
             {taskDetail}
-            仕様書:
-            {specification}
-            ディレクトリ構造:
-            {directory_structure}
+            仕様書・タスクのうち質問に関連する部分の抜粋:
+            {excerpts}
             チャット履歴:
             {chat_history}
             新たなユーザーからのチャットでの質問内容:
             {user_question}
-            使用しているフレームワーク:
-            {framework}
             回答は、他の情報を含まずに、テキストのみで回答してください。
-            """
+            """,
         )
-        chain = prompt_template | self.llm_flash | StrOutputParser()
-        result = chain.invoke({
-            "specification": specification,
-            "directory_structure": directory_structure,
-            "chat_history": chat_history,
-            "user_question": user_question,
-            "framework": framework,
-            "taskDetail": taskDetail
-        })
-        return result
@@ -1,12 +1,19 @@
+import os
 import time
 import json
+import hashlib
+import asyncio
 import textwrap
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict
-from langchain.prompts import ChatPromptTemplate
+from typing import List, Dict, Optional, AsyncIterator
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from pydantic import BaseModel
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
+from .output_schemas import TaskDetailsOutput
+from .llm_scheduler import deadline, backoff_delay, DeadlineExceeded
+from .llm_cache import llm_cache, make_cache_key
 import logging
 
 from json_repair import repair_json  # 追加
@@ -15,96 +22,131 @@ from copy import deepcopy      # 追加
 logger = logging.getLogger(__name__)
 
 RATE_LIMIT_SEC = 0.5  # 呼び出し間隔（秒）
+# タスク単位の detail キャッシュの有効期限（秒）
+DETAIL_CACHE_TTL_SEC = int(os.getenv("TASK_DETAIL_CACHE_TTL_SEC", str(60 * 60 * 24 * 7)))
+# フォールバック時の detail の接頭辞（キャッシュしない）
+FAILED_DETAIL_PREFIX = "バッチ呼び出し失敗"
 
 class TaskItem(BaseModel):
     task_name: str
     priority: str  # "Must", "Should", "Could"
     content: str
+    task_id: Optional[int] = None  # プロジェクト内のタスクID（ジョブの結果をプロジェクトのタスクに保存するときの対応付けに使う）
 
 class TaskDetailService(BaseService):
     def __init__(self):
         super().__init__()
 
     def generate_task_details_batch(self, specification: str, tasks: List[Dict]) -> List[Dict]:
-            """
-            複数タスクをまとめてLLMに投げ、失敗時は最大3回まで再試行します。
-            生の文字列を json_repair で補正してからパースし、最終的にフォールバックします。
-            """
-            response_schema = ResponseSchema(
-                name="tasks",
-                description="複数タスクに detail を追加した配列",
-                type="array(objects)"
-            )
-            parser = StructuredOutputParser.from_response_schemas([response_schema])
-            template = textwrap.dedent("""
-            あなたはタスク詳細化のエキスパートです。以下のタスクリストについて、各タスクに対して具体的なハンズオンの手順を「detail」として生成してください。
-            detailは、タスクの内容をさらに具体化したもので、この形式を必ず守ってください。
-            具体的なハンズオンは、詳細な手順やコマンド、コードの記述などを含めてください。
-            また、マークダウン形式でこれを見るだけでこのタスクを完了できるほどの詳細さで出力してください。
-            ただし、コードに関しては最小限の記述で十分です。ある程度は読者の自力で考えられるようにしてください。
-            ユーザーはハッカソンに参加する初心者です。
-            重要: 応答は必ず有効なJSONである必要があります。特殊文字（バックスラッシュ、引用符など）は適切にエスケープしてください。Markdownのコードブロック内でも引用符とバックスラッシュには特に注意が必要です。
-            以下の制約を厳密に守ってください:
-            1. 出力は単純な構造を持つ必要があります: "tasks"キーの配列のみです
-            2. 各タスクには task_name, priority, content, detail フィールドのみを含めてください
-            3. 改行は文字列内で "\\n" としてエスケープしてください
-            4. コードブロックを含める場合は、Markdown記法の ```の代わりに "```" とエスケープしてください
-            5. JSON文字列として有効であることを優先し、必要に応じて内容を簡略化してください
-            以下の JSON 形式 **以外** は一切含めず、純粋な JSON オブジェクトだけを返してください。
-            ```json
-            {{'tasks':[{{
-            'task_name': "<タスクの名前、インプットから一切変えてはいけない>",
-            'priority': "<タスクの優先度、インプットから一切変えてはいけない>",
-            'content': "<タスクの簡単な内容、インプットから一切変えてはいけない>",
-            'detail': "<タスクの詳細な手順の Markdown 文字列>"
-            }}
-            ...
-            ]
-            }}
-            '''
-            {format_instructions}
-            
-            仕様書(全体内のタスクの位置を把握するのに参考にしてください):
-            {specification}
-
-            入力は以下の形式のタスク情報です:
-            {tasks_input}
-        """)
-            prompt = ChatPromptTemplate.from_template(
-                template=template,
-                partial_variables={"format_instructions": parser.get_format_instructions()}
-            )
-
-            max_retries = 3
-            for attempt in range(1, max_retries + 1):
-                try:
-                    # LLM呼び出し
-                    tasks_json = json.dumps(tasks, ensure_ascii=False)
-                    chain = prompt | self.llm_flash
-                    ai_message = chain.invoke({
-                        "tasks_input": tasks_json,
-                        "specification": specification
-                    })
-                    raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
-                    logger.debug("Raw LLM output (試行 %d): %s", attempt, raw)
-
-                    # JSON修復→パース
-                    repaired = self._repair_json(raw)
-                    logger.debug("Repaired JSON (試行 %d): %s", attempt, repaired)
-                    parsed = parser.parse(repaired)
-                    logger.debug("Parsed result (試行 %d): %s", attempt, parsed)
-
-                    # 正常終了
-                    return parsed["tasks"]
+        """
+        複数タスクをまとめてLLMに投げ、失敗時は最大3回まで再試行します。
+        生の文字列を json_repair で補正してからパースし、最終的にフォールバックします。
+        """
+        chain, parser = self._detail_chain()
+        max_retries = 3
+        for attempt in range(1, max_retries + 1):
+            try:
+                # LLM呼び出し
+                ai_message = chain.invoke({
+                    "tasks_input": json.dumps(tasks, ensure_ascii=False),
+                    "specification": specification
+                })
+                return self._parse_batch(ai_message, parser, attempt)
+            except Exception as e:
+                logger.error("バッチ呼び出し失敗 (試行 %d/%d): %s", attempt, max_retries, e, exc_info=True)
+                # 最終試行ならフォールバック
+                if attempt == max_retries:
+                    logger.error("最大試行回数に到達したためフォールバックします。")
+                    return [{**t, "detail": f"バッチ呼び出し失敗(試行{attempt}回): {e}"} for t in tasks]
+                # リトライ間隔
+                time.sleep(RATE_LIMIT_SEC)
 
-                except Exception as e:
-                    logger.error("バッチ呼び出し失敗 (試行 %d/%d): %s", attempt, max_retries, e, exc_info=True)
-                    # リトライ間隔
-                    time.sleep(RATE_LIMIT_SEC)
-                    # 最終試行ならフォールバック
-                    if attempt == max_retries:
-                        logger.error("最大試行回数に到達したためフォールバックします。")
-                        return [{**t, "detail": f"バッチ呼び出し失敗(試行{attempt}回): {e}"} for t in tasks]
+    async def agenerate_task_details_batch(self, specification: str, tasks: List[Dict]) -> List[Dict]:
+        """
+        generate_task_details_batch の非同期版。待機中もイベントループを塞がない。
+        """
+        chain, parser = self._detail_chain()
+        max_retries = 3
+        for attempt in range(1, max_retries + 1):
+            try:
+                # LLM呼び出し
+                ai_message = await chain.ainvoke({
+                    "tasks_input": json.dumps(tasks, ensure_ascii=False),
+                    "specification": specification
+                })
+                return self._parse_batch(ai_message, parser, attempt)
+            except DeadlineExceeded as e:
+                # 締め切りを過ぎた場合は再試行せずにフォールバックする
+                logger.error("バッチ呼び出しが締め切りを過ぎました: %s", e)
+                return [{**t, "detail": f"バッチ呼び出し失敗(締め切り超過): {e}"} for t in tasks]
+            except Exception as e:
+                logger.error("バッチ呼び出し失敗 (試行 %d/%d): %s", attempt, max_retries, e, exc_info=True)
+                if attempt == max_retries:
+                    logger.error("最大試行回数に到達したためフォールバックします。")
+                    return [{**t, "detail": f"バッチ呼び出し失敗(試行{attempt}回): {e}"} for t in tasks]
+                # 429 などの再試行はスケジューラが行うため、ここでは主にパース失敗時の再試行
+                await asyncio.sleep(backoff_delay(attempt))
+
+    def _parse_batch(self, ai_message, parser, attempt: int) -> List[Dict]:
+        raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
+        logger.debug("Raw LLM output (試行 %d): %s", attempt, raw)
+
+        # JSON修復→パース
+        repaired = self._repair_json(raw)
+        logger.debug("Repaired JSON (試行 %d): %s", attempt, repaired)
+        parsed = parser.parse(repaired)
+        logger.debug("Parsed result (試行 %d): %s", attempt, parsed)
+
+        # 正常終了
+        return parsed["tasks"]
+
+    @compiled
+    def _detail_chain(self):
+        response_schema = ResponseSchema(
+            name="tasks",
+            description="複数タスクに detail を追加した配列",
+            type="array(objects)"
+        )
+        parser = StructuredOutputParser.from_response_schemas([response_schema])
+        template = textwrap.dedent("""
+        あなたはタスク詳細化のエキスパートです。以下のタスクリストについて、各タスクに対して具体的なハンズオンの手順を「detail」として生成してください。
+        detailは、タスクの内容をさらに具体化したもので、この形式を必ず守ってください。
+        具体的なハンズオンは、詳細な手順やコマンド、コードの記述などを含めてください。
+        また、マークダウン形式でこれを見るだけでこのタスクを完了できるほどの詳細さで出力してください。
+        ただし、コードに関しては最小限の記述で十分です。ある程度は読者の自力で考えられるようにしてください。
+        ユーザーはハッカソンに参加する初心者です。
+        重要: 応答は必ず有効なJSONである必要があります。特殊文字（バックスラッシュ、引用符など）は適切にエスケープしてください。Markdownのコードブロック内でも引用符とバックスラッシュには特に注意が必要です。
+        以下の制約を厳密に守ってください:
+        1. 出力は単純な構造を持つ必要があります: "tasks"キーの配列のみです
+        2. 各タスクには task_name, priority, content, detail フィールドのみを含めてください
+        3. 改行は文字列内で "\\n" としてエスケープしてください
+        4. コードブロックを含める場合は、Markdown記法の ```の代わりに "```" とエスケープしてください
+        5. JSON文字列として有効であることを優先し、必要に応じて内容を簡略化してください
+        6. 上記の仕様書は、全体の中でのタスクの位置を把握するための参考にしてください
+        以下の JSON 形式 **以外** は一切含めず、純粋な JSON オブジェクトだけを返してください。
+        ```json
+        {{'tasks':[{{
+        'task_name': "<タスクの名前、インプットから一切変えてはいけない>",
+        'priority': "<タスクの優先度、インプットから一切変えてはいけない>",
+        'content': "<タスクの簡単な内容、インプットから一切変えてはいけない>",
+        'detail': "<タスクの詳細な手順の Markdown 文字列>"
+        }}
+        ...
+        ]
+        }}
+        '''
+        {format_instructions}
+
+        入力は以下の形式のタスク情報です:
+        {tasks_input}
+    """)
+        # 仕様書はバッチ間で共通なので先頭の system メッセージに置き、タスクだけを差し替える
+        prompt = context_prompt(
+            project_context("specification"),
+            template,
+            partial_variables={"format_instructions": parser.get_format_instructions()},
+        )
+        return prompt | self._managed(self.llm_flash, schema=TaskDetailsOutput), parser
 
     def generate_task_details_parallel(
         self,
@@ -125,4 +167,110 @@ class TaskDetailService(BaseService):
                     logger.error("並列バッチ呼び出し失敗: %s", e, exc_info=True)
                     for t in futures[future]:
                         results.append({**t, "detail": "バッチ呼び出し失敗"})
-        return results
\ No newline at end of file
+        return results
+
+    async def agenerate_task_details_parallel(
+        self,
+        tasks: List[Dict],
+        specification: str,
+        batch_size: int = 3,
+        deadline_sec: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        generate_task_details_parallel の非同期版。
+        全バッチを並行に投げ、同時実行数とレート制限は共有スケジューラ（llm_scheduler）に任せる。
+        deadline_sec を指定すると、それまでに終わらなかったバッチはフォールバックの detail になる。
+        結果は入力と同じ順序で、各タスクに入力上の位置 task_index を付けて返す。
+        """
+        results: List[Optional[Dict]] = [None] * len(tasks)
+        async for event in self.astream_task_details(tasks, specification, batch_size, deadline_sec):
+            for task in event.get("tasks", []):
+                results[task["task_index"]] = task
+        return results
+
+    async def astream_task_details(
+        self,
+        tasks: List[Dict],
+        specification: str,
+        batch_size: int = 3,
+        deadline_sec: Optional[float] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        バッチが完了した順に {"type": "batch", "tasks": [...]} を返し、最後に {"type": "done"} を返す。
+        各タスクには入力上の位置 task_index が付くため、受け取り側で入力順に並べ直せる。
+        (タスク内容, 仕様書) が同じタスクは以前の detail をキャッシュから返し、LLM には未キャッシュのものだけを送る。
+        キャッシュから返したタスクは最初の {"type": "batch", "cached": true} にまとめる。
+        """
+        spec_fingerprint = self._spec_fingerprint(specification)
+        cache_keys = [self._detail_cache_key(t, spec_fingerprint) for t in tasks]
+        cached_tasks = []
+        missing: List[int] = []
+        for index, (task, key) in enumerate(zip(tasks, cache_keys)):
+            detail = await llm_cache.aget(key)
+            if detail is None:
+                missing.append(index)
+            else:
+                cached_tasks.append({**task, "detail": detail, "task_index": index})
+        logger.debug("タスク詳細キャッシュ: hit=%d miss=%d", len(cached_tasks), len(missing))
+        if cached_tasks:
+            yield {"type": "batch", "tasks": cached_tasks, "cached": True}
+
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+        async def run(indices: List[int]) -> List[Dict]:
+            batch = [tasks[i] for i in indices]
+            try:
+                detailed = await self.agenerate_task_details_batch(specification, batch)
+            except Exception as e:
+                logger.error("並列バッチ呼び出し失敗: %s", e, exc_info=True)
+                detailed = [{**t, "detail": FAILED_DETAIL_PREFIX} for t in batch]
+            aligned = self._align_batch(indices, batch, detailed)
+            for task in aligned:
+                if not task["detail"].startswith(FAILED_DETAIL_PREFIX):
+                    await llm_cache.aset(cache_keys[task["task_index"]], task["detail"], DETAIL_CACHE_TTL_SEC)
+            return aligned
+
+        with deadline(deadline_sec):
+            pending = [asyncio.ensure_future(run(indices)) for indices in batches]
+            try:
+                for future in asyncio.as_completed(pending):
+                    yield {"type": "batch", "tasks": await future, "cached": False}
+            finally:
+                # クライアント切断などで途中終了した場合は残りのバッチを止める
+                for future in pending:
+                    future.cancel()
+        yield {"type": "done", "count": len(tasks), "cached": len(cached_tasks)}
+
+    def _spec_fingerprint(self, specification: str) -> str:
+        return hashlib.sha256(specification.encode("utf-8")).hexdigest()
+
+    def _detail_cache_key(self, task: Dict, spec_fingerprint: str) -> str:
+        """
+        タスクの名前・優先度・内容と仕様書のハッシュから、タスク単位のキャッシュキーを作る。
+        """
+        identity = json.dumps(
+            {k: task.get(k) for k in ("task_name", "priority", "content")},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return make_cache_key("task_detail", identity, {"specification": spec_fingerprint})
+
+    def _align_batch(self, indices: List[int], batch: List[Dict], detailed: List[Dict]) -> List[Dict]:
+        """
+        LLM の出力を入力タスクに対応付ける。順序が入れ替わったり欠けたりしても、
+        task_name が一致するものを優先し、無ければ同じ位置のものを使う。
+        入力の task_name / priority / content はそのまま保持する。
+        """
+        by_name = {d.get("task_name"): d for d in detailed if isinstance(d, dict)}
+        aligned = []
+        for offset, task in enumerate(batch):
+            match = by_name.get(task.get("task_name"))
+            if match is None and offset < len(detailed) and isinstance(detailed[offset], dict):
+                match = detailed[offset]
+            detail = match.get("detail") if match else None
+            aligned.append({
+                **task,
+                "detail": detail if isinstance(detail, str) else FAILED_DETAIL_PREFIX,
+                "task_index": indices[offset],
+            })
+        return aligned
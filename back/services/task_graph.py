@@ -0,0 +1,212 @@
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class TaskGraph:
+    """
+    タスク間の依存関係（parent → child）を扱う有向グラフ。
+    隣接関係は task_id をキーにした子・親の集合で持ち、タスク・エッジの追加削除を差分で行える。
+
+    LLM が返すエッジの検証（存在しない task_id・重複・自己ループの除去）、
+    循環の検出と修復、推移的に冗長なエッジの削除、トポロジカルソートを提供する。
+    """
+
+    def __init__(self, task_ids: Iterable[int] = (), edges: Iterable[Dict] = ()):
+        self._children: Dict[int, Set[int]] = {}
+        self._parents: Dict[int, Set[int]] = {}
+        # 検証で捨てたエッジ（理由つき）
+        self.dropped: List[Dict] = []
+        for task_id in task_ids:
+            self.add_task(task_id)
+        for edge in edges:
+            self.add_edge(edge.get("parent"), edge.get("child"))
+
+    # ---- 基本操作 ----
+
+    @property
+    def task_ids(self) -> List[int]:
+        return list(self._children)
+
+    def __contains__(self, task_id) -> bool:
+        return task_id in self._children
+
+    def __len__(self) -> int:
+        return len(self._children)
+
+    def children(self, task_id: int) -> Set[int]:
+        return self._children[task_id]
+
+    def parents(self, task_id: int) -> Set[int]:
+        return self._parents[task_id]
+
+    def add_task(self, task_id: int):
+        if task_id not in self._children:
+            self._children[task_id] = set()
+            self._parents[task_id] = set()
+
+    def remove_task(self, task_id: int, bridge: bool = True):
+        """
+        タスクを削除する。bridge=True の場合は親から子へエッジを張り直し、間接的な依存関係を保つ。
+        """
+        if task_id not in self._children:
+            return
+        parents = self._parents.pop(task_id)
+        children = self._children.pop(task_id)
+        for parent in parents:
+            self._children[parent].discard(task_id)
+        for child in children:
+            self._parents[child].discard(task_id)
+        if bridge:
+            for parent in parents:
+                for child in children:
+                    self.add_edge(parent, child)
+
+    def add_edge(self, parent, child) -> bool:
+        """
+        エッジを追加する。不正なエッジは追加せず dropped に記録して False を返す。
+        """
+        reason = None
+        if parent not in self._children or child not in self._children:
+            reason = "unknown_task"
+        elif parent == child:
+            reason = "self_loop"
+        elif child in self._children[parent]:
+            reason = "duplicate"
+        if reason is not None:
+            self.dropped.append({"parent": parent, "child": child, "reason": reason})
+            return False
+        self._children[parent].add(child)
+        self._parents[child].add(parent)
+        return True
+
+    def remove_edge(self, parent: int, child: int):
+        if parent in self._children:
+            self._children[parent].discard(child)
+        if child in self._parents:
+            self._parents[child].discard(parent)
+
+    def edges(self) -> List[Dict]:
+        return [
+            {"parent": parent, "child": child}
+            for parent in sorted(self._children)
+            for child in sorted(self._children[parent])
+        ]
+
+    def copy(self) -> "TaskGraph":
+        graph = TaskGraph(self.task_ids)
+        for parent, children in self._children.items():
+            for child in children:
+                graph.add_edge(parent, child)
+        return graph
+
+    # ---- 解析 ----
+
+    def topological_sort(self) -> List[int]:
+        """
+        Kahn 法によるトポロジカルソート。同順位は task_id の小さい順。循環がある場合は ValueError。
+        """
+        indegree = {task_id: len(parents) for task_id, parents in self._parents.items()}
+        ready = [task_id for task_id, degree in indegree.items() if degree == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            task_id = heapq.heappop(ready)
+            order.append(task_id)
+            for child in self._children[task_id]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    heapq.heappush(ready, child)
+        if len(order) != len(self._children):
+            raise ValueError("タスクの依存関係に循環があります")
+        return order
+
+    def find_cycle(self) -> Optional[List[int]]:
+        """
+        循環を1つ探し、[a, b, ..., a] の形で返す。循環が無ければ None。
+        """
+        WHITE, GRAY, BLACK = 0, 1, 2
+        color = {task_id: WHITE for task_id in self._children}
+        for root in sorted(self._children):
+            if color[root] != WHITE:
+                continue
+            stack: List[Tuple[int, List[int]]] = [(root, sorted(self._children[root]))]
+            path = [root]
+            color[root] = GRAY
+            while stack:
+                node, pending = stack[-1]
+                if not pending:
+                    color[node] = BLACK
+                    stack.pop()
+                    path.pop()
+                    continue
+                child = pending.pop(0)
+                if color[child] == GRAY:
+                    return path[path.index(child):] + [child]
+                if color[child] == WHITE:
+                    color[child] = GRAY
+                    path.append(child)
+                    stack.append((child, sorted(self._children[child])))
+        return None
+
+    def repair_cycles(self) -> List[Dict]:
+        """
+        循環が無くなるまでエッジを削除する。
+        各循環では、ID の大きいタスクから小さいタスクへ向かう（プロンプトの規約に反する）エッジを優先して削除する。
+        削除したエッジのリストを返す。
+        """
+        removed = []
+        while True:
+            cycle = self.find_cycle()
+            if cycle is None:
+                return removed
+            cycle_edges = list(zip(cycle, cycle[1:]))
+            backward = [e for e in cycle_edges if e[0] > e[1]]
+            parent, child = max(backward or cycle_edges, key=lambda e: e[0] - e[1])
+            self.remove_edge(parent, child)
+            removed.append({"parent": parent, "child": child, "reason": "cycle"})
+
+    def transitive_reduction(self) -> List[Dict]:
+        """
+        他の経路でも到達できる冗長なエッジ（a→c に対し a→b→c がある等）を削除する。循環が無いことが前提。
+        削除したエッジのリストを返す。
+        """
+        removed = []
+        order = self.topological_sort()
+        position = {task_id: i for i, task_id in enumerate(order)}
+        for parent in order:
+            children = sorted(self._children[parent], key=lambda c: position[c])
+            reachable: Set[int] = set()
+            for child in children:
+                if child in reachable:
+                    self.remove_edge(parent, child)
+                    removed.append({"parent": parent, "child": child, "reason": "transitive"})
+                else:
+                    reachable |= self.descendants(child) | {child}
+        return removed
+
+    def descendants(self, task_id: int) -> Set[int]:
+        seen: Set[int] = set()
+        stack = list(self._children[task_id])
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(self._children[node])
+        return seen
+
+    def neighborhood(self, task_ids: Iterable[int]) -> Set[int]:
+        """
+        指定タスクとその親・子からなる集合を返す。差分更新で LLM に渡す部分グラフの範囲に使う。
+        """
+        result: Set[int] = set()
+        for task_id in task_ids:
+            if task_id in self._children:
+                result.add(task_id)
+                result |= self._children[task_id] | self._parents[task_id]
+        return result
+
+    def normalize(self) -> List[Dict]:
+        """
+        循環の修復と推移簡約を行い、削除したエッジを返す。
+        """
+        return self.repair_cycles() + self.transitive_reduction()
@@ -1,10 +1,15 @@
-from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from .base_service import BaseService
+from .prompt_registry import compiled
+from .context_cache import context_prompt, project_context
+from .output_schemas import TasksOutput
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 生成に失敗したときに返すタスクの名前
+FALLBACK_TASK_NAME = "タスク生成エラー"
+
 class TasksService(BaseService):
     def __init__(self):
         super().__init__()
@@ -15,6 +20,61 @@ class TasksService(BaseService):
         アプリ制作に必要なタスクをリスト形式で生成する。
         各タスクはタスク名、優先度（Must, Should, Could）、具体的な内容を含む。
         """
+        try:
+            # LLM呼び出し
+            chain, parser = self._tasks_chain()
+            ai_message = chain.invoke({
+                "specification": specification,
+                "directory": directory,
+                "framework": framework
+            })
+            return self._parse_tasks(ai_message, parser)
+        except Exception as e:
+            logger.error("タスク生成失敗: %s", e, exc_info=True)
+            return self._fallback(e)
+
+    async def agenerate_tasks(self, specification: str, directory: str, framework: str):
+        """
+        generate_tasks の非同期版。
+        """
+        try:
+            # LLM呼び出し
+            chain, parser = self._tasks_chain()
+            ai_message = await chain.ainvoke({
+                "specification": specification,
+                "directory": directory,
+                "framework": framework
+            })
+            return self._parse_tasks(ai_message, parser)
+        except Exception as e:
+            logger.error("タスク生成失敗: %s", e, exc_info=True)
+            return self._fallback(e)
+
+    def _parse_tasks(self, ai_message, parser):
+        # AIMessage → str 変換
+        raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
+        logger.debug("Raw LLM output: %s", raw)
+
+        # JSON修復→パース
+        repaired = self._repair_json(raw)
+        logger.debug("Repaired JSON: %s", repaired)
+        parsed = parser.parse(repaired)
+        logger.debug("Parsed result: %s", parsed)
+
+        return parsed.get("tasks", [])
+
+    def _fallback(self, e: Exception):
+        # 失敗時は基本的なフォールバックタスクを返す
+        return [
+            {
+                "task_name": FALLBACK_TASK_NAME,
+                "priority": "Must", 
+                "content": f"タスク生成中にエラーが発生しました: {e}"
+            }
+        ]
+
+    @compiled
+    def _tasks_chain(self):
         response_schemas = [
             ResponseSchema(
                 name="tasks",
@@ -26,49 +86,16 @@ class TasksService(BaseService):
             )
         ]
         parser = StructuredOutputParser.from_response_schemas(response_schemas)
-        prompt_template = ChatPromptTemplate.from_template(
-            template="""
-                        あなたはアプリ制作のプロフェッショナルです。以下の情報に基づいて、アプリ制作に必要な全タスクを具体的にリストアップしてください。
+        prompt_template = context_prompt(
+            project_context("specification", "directory", "framework"),
+            """
+                        あなたはアプリ制作のプロフェッショナルです。上記の情報に基づいて、アプリ制作に必要な全タスクを具体的にリストアップしてください。
                         ただし、環境構築に関するタスクは含めないでください。
-                        仕様書:
-                        {specification}
-                        ディレクトリ構成:
-                        {directory}
-                        フレームワーク:
-                        {framework}
                         各タスクには、タスク名、優先度（Must, Should, Could）、具体的な内容を含めてください。
                         具体的に言うと、task_name: str 、priority: str ("Must", "Should", "Could") のいずれか 、content: strの全てを必ず含むものです。
                         回答は以下のフォーマットに従い、JSON形式で出力してください。
                         {format_instructions}
                     """,
-            partial_variables={"format_instructions": parser.get_format_instructions()}
+            partial_variables={"format_instructions": parser.get_format_instructions()},
         )
-        try:
-            # LLM呼び出し
-            chain = prompt_template | self.llm_pro
-            ai_message = chain.invoke({
-                "specification": specification,
-                "directory": directory,
-                "framework": framework
-            })
-            # AIMessage → str 変換
-            raw: str = ai_message.content if hasattr(ai_message, "content") else str(ai_message)
-            logger.debug("Raw LLM output: %s", raw)
-
-            # JSON修復→パース
-            repaired = self._repair_json(raw)
-            logger.debug("Repaired JSON: %s", repaired)
-            parsed = parser.parse(repaired)
-            logger.debug("Parsed result: %s", parsed)
-            
-            return parsed.get("tasks", [])
-        except Exception as e:
-            logger.error("タスク生成失敗: %s", e, exc_info=True)
-            # 失敗時は基本的なフォールバックタスクを返す
-            return [
-                {
-                    "task_name": "タスク生成エラー", 
-                    "priority": "Must", 
-                    "content": f"タスク生成中にエラーが発生しました: {e}"
-                }
-            ]
+        return prompt_template | self._managed(self.llm_pro, schema=TasksOutput), parser
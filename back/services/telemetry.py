@@ -0,0 +1,199 @@
+import os
+import time
+import logging
+from typing import Any, Dict
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from starlette.responses import PlainTextResponse, Response
+
+from .request_context import request_scope, route_template
+from .usage_ledger import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+# prometheus_client と opentelemetry はどちらも任意の依存。無い場合は該当する計測だけを行わない
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+except ImportError:
+    Counter = Histogram = None
+try:
+    from opentelemetry import trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+# 計測の有効・無効
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class _NoopMetric:
+    """
+    prometheus_client が無い場合の代わり。何も記録しない。
+    """
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+
+def _metric(kind, name: str, documentation: str, labels, **kwargs):
+    if kind is None or not METRICS_ENABLED:
+        return _NoopMetric()
+    return kind(name, documentation, labels, **kwargs)
+
+
+HTTP_LATENCY = _metric(Histogram, "http_request_duration_seconds", "エンドポイントごとのレスポンス完了までの時間", ["method", "route", "status"], buckets=HTTP_BUCKETS)
+LLM_LATENCY = _metric(Histogram, "llm_call_duration_seconds", "サービス・モデルごとの LLM 呼び出し1回の時間", ["service", "model", "outcome"], buckets=LLM_BUCKETS)
+LLM_TOKENS = _metric(Counter, "llm_tokens_total", "LLM の入力・出力トークン数", ["service", "model", "direction"])
+LLM_RETRIES = _metric(Counter, "llm_retries_total", "スケジューラによる LLM 呼び出しの再試行回数", ["model", "reason"])
+LLM_FALLBACKS = _metric(Counter, "llm_fallbacks_total", "ルーターが別のモデル候補に切り替えた回数", ["model", "kind"])
+JSON_REPAIRS = _metric(Counter, "llm_json_repairs_total", "json_repair で応答を修復した回数", ["service"])
+PARSE_FAILURES = _metric(Counter, "llm_parse_failures_total", "応答を期待した形式として解釈できなかった回数", ["service", "stage"])
+CACHE_LOOKUPS = _metric(Counter, "llm_cache_lookups_total", "応答キャッシュ・カセットの参照結果", ["service", "layer", "result"])
+
+_tracer = trace.get_tracer("hackson_support_agent") if trace is not None and TRACING_ENABLED else None
+
+
+def record_retry(model: str, reason: str):
+    LLM_RETRIES.labels(model, reason).inc()
+
+
+def record_fallback(model: str, kind: str):
+    LLM_FALLBACKS.labels(model, kind).inc()
+
+
+def record_json_repair(service: str):
+    JSON_REPAIRS.labels(service).inc()
+
+
+def record_parse_failure(service: str, stage: str):
+    PARSE_FAILURES.labels(service, stage).inc()
+
+
+def record_cache_lookup(service: str, layer: str, hit: bool):
+    CACHE_LOOKUPS.labels(service, layer, "hit" if hit else "miss").inc()
+
+
+def metrics_response() -> Response:
+    """
+    /metrics の応答（Prometheus のテキスト形式）。
+    """
+    if Counter is None or not METRICS_ENABLED:
+        return PlainTextResponse("prometheus_client がインストールされていないか、METRICS_ENABLED が無効です\n", status_code=503)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class LLMCallHandler(BaseCallbackHandler):
+    """
+    BaseService が LLM 呼び出しごとに付ける LangChain のコールバック。
+    呼び出し時間・トークン数を Prometheus に記録し、呼び出しを OpenTelemetry のスパンにする。
+    トークン数はプロジェクト・エンドポイントごとの使用量台帳（usage_ledger）にも記録する。
+    """
+
+    # 非同期の呼び出しでもスレッドプールに回さずにその場で実行する（スパンの親子関係を保つため）
+    run_inline = True
+
+    def __init__(self, service: str, model: str):
+        self.service = service
+        self.model = model
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        started, current = self._runs.pop(run_id, (None, None))
+        input_tokens, output_tokens = self._usage(response)
+        usage_ledger.record(self.service, self.model, input_tokens, output_tokens)
+        if input_tokens:
+            LLM_TOKENS.labels(self.service, self.model, "input").inc(input_tokens)
+        if output_tokens:
+            LLM_TOKENS.labels(self.service, self.model, "output").inc(output_tokens)
+        if started is not None:
+            LLM_LATENCY.labels(self.service, self.model, "success").observe(time.monotonic() - started)
+        if current is not None:
+            current.set_attribute("llm.input_tokens", input_tokens)
+            current.set_attribute("llm.output_tokens", output_tokens)
+            current.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        started, current = self._runs.pop(run_id, (None, None))
+        if started is not None:
+            LLM_LATENCY.labels(self.service, self.model, "error").observe(time.monotonic() - started)
+        if current is not None:
+            current.record_exception(error)
+            current.set_status(Status(StatusCode.ERROR, str(error)))
+            current.end()
+
+    def _start(self, run_id: UUID):
+        current = None
+        if _tracer is not None:
+            current = _tracer.start_span(
+                f"llm {self.model}",
+                kind=SpanKind.CLIENT,
+                attributes={"llm.service": self.service, "llm.model": self.model},
+            )
+        self._runs[run_id] = (time.monotonic(), current)
+
+    def _usage(self, response) -> tuple:
+        """
+        LLMResult からトークン数を取り出す。usage_metadata が無いプロバイダでは llm_output を見る。
+        """
+        try:
+            message = response.generations[0][0].message
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        except (IndexError, AttributeError):
+            pass
+        usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage") or {}
+        return (
+            usage.get("prompt_tokens", usage.get("input_tokens", 0)),
+            usage.get("completion_tokens", usage.get("output_tokens", 0)),
+        )
+
+
+class MetricsMiddleware:
+    """
+    エンドポイントごとのレイテンシを記録する ASGI ミドルウェア。
+    ストリーミング応答も最後のチャンクを送り終えるまでを計測する。ラベルにはパスではなくルートのテンプレートを使う。
+    処理中は request_scope を設定し、LLM の使用量をエンドポイントごとに集計できるようにする。
+    リクエストのスパンは FastAPI が OpenTelemetry で作成するため、ここでは作らない（LLM 呼び出しのスパンはその子になる）。
+    """
+
+    def __init__(self, app, excluded_paths=("/metrics",)):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.monotonic()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            with request_scope(scope):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(scope["method"], route_template(scope), str(status)).observe(time.monotonic() - started)
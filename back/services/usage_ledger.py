@@ -0,0 +1,325 @@
+import os
+import json
+import asyncio
+import math
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from .request_context import current_endpoint, current_project_id
+
+logger = logging.getLogger(__name__)
+
+# プロジェクトごとの累計コストの上限（USD）。0 なら無制限
+PROJECT_BUDGET_USD = float(os.getenv("USAGE_PROJECT_BUDGET_USD", "0"))
+# プロジェクトごとの直近1分間のトークン数（入力＋出力）の上限。0 なら無制限
+PROJECT_TOKENS_PER_MINUTE = int(os.getenv("USAGE_PROJECT_TOKENS_PER_MINUTE", "0"))
+# 上限を超えたプロジェクトの扱い
+# - downgrade: 以降の呼び出しを llm_lite に切り替える（上限の HARD_LIMIT_RATIO 倍を超えたら拒否する）
+# - reject: 上限を超えた時点で拒否する（HTTP 429）
+BUDGET_ACTION = os.getenv("USAGE_BUDGET_ACTION", "downgrade").lower()
+HARD_LIMIT_RATIO = float(os.getenv("USAGE_HARD_LIMIT_RATIO", "2.0"))
+# 集計を DB に書き出す間隔（秒）
+FLUSH_SEC = float(os.getenv("USAGE_FLUSH_SEC", "5"))
+
+# モデルごとの単価（USD / 100万トークン、[入力, 出力]）。USAGE_PRICES に同じ形式の JSON を指定すると上書き・追加できる
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-pro-preview-05-06": (1.25, 10.0),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-thinking-exp": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+try:
+    PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("USAGE_PRICES", "{}")).items()})
+except (ValueError, TypeError):
+    logger.error("USAGE_PRICES を解釈できません。既定の単価を使います")
+
+WINDOW_SEC = 60.0
+
+OK = "ok"
+DOWNGRADE = "downgrade"
+
+
+class BudgetExceeded(Exception):
+    """
+    プロジェクトの使用量が上限を超えたため、LLM の呼び出しを拒否した。API では 429 を返す。
+    """
+
+    def __init__(self, project_id: str, reason: str, retry_after: Optional[int] = None):
+        super().__init__(f"プロジェクト {project_id} の LLM 使用量が上限を超えました: {reason}")
+        self.project_id = project_id
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """
+    トークン数から推定コスト（USD）を計算する。単価が分からないモデルは 0。
+    """
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class UsageLedger:
+    """
+    プロセス全体で共有する LLM 使用量の台帳。
+    - LLM 呼び出しごとのトークン数を (プロジェクト, エンドポイント, サービス, モデル, 日) 単位でメモリ上に集計し、
+      FLUSH_SEC ごとにバックグラウンドのスレッドで llm_usage テーブルに加算する
+    - プロジェクトごとの累計コストと直近1分間のトークン数を保持し、check() で上限と比べる
+    累計コストは初めて見たプロジェクトの時点で DB から読み込み、書き出しのたびに DB の値に合わせ直す
+    （複数ワーカーで動かす場合も、他のワーカーの使用量が FLUSH_SEC 程度の遅れで反映される）。
+    """
+
+    def __init__(self, budget_usd: float = PROJECT_BUDGET_USD, tokens_per_minute: int = PROJECT_TOKENS_PER_MINUTE, action: str = BUDGET_ACTION):
+        if action not in (DOWNGRADE, "reject"):
+            raise ValueError(f"未対応の USAGE_BUDGET_ACTION です: {action}（downgrade, reject）")
+        self.budget_usd = budget_usd
+        self.tokens_per_minute = tokens_per_minute
+        self.action = action
+        self._pending: Dict[Tuple[str, str, str, str, str], list] = {}
+        self._spent: Dict[str, float] = {}
+        self._recent: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self.recorded_calls = 0
+        self.downgrades = 0
+        self.rejections = 0
+
+    @property
+    def limited(self) -> bool:
+        return self.budget_usd > 0 or self.tokens_per_minute > 0
+
+    def record(self, service: str, model: str, input_tokens: int, output_tokens: int):
+        """
+        1回の LLM 呼び出しの使用量を、処理中のプロジェクトとエンドポイントに加算する。
+        """
+        project_id = current_project_id() or ""
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        key = (project_id, current_endpoint() or "", service, model, day)
+        with self._lock:
+            bucket = self._pending.setdefault(key, [0, 0, 0, 0.0])
+            bucket[0] += 1
+            bucket[1] += input_tokens
+            bucket[2] += output_tokens
+            bucket[3] += cost
+            self.recorded_calls += 1
+            if project_id and project_id in self._spent:
+                self._spent[project_id] += cost
+            if project_id and self.tokens_per_minute:
+                self._recent.setdefault(project_id, deque()).append((time.monotonic(), input_tokens + output_tokens))
+        self._ensure_flusher()
+
+    def check(self, project_id: Optional[str]) -> str:
+        """
+        プロジェクトの使用量を上限と比べ、OK か DOWNGRADE を返す。拒否する場合は BudgetExceeded を送出する。
+        プロジェクトに紐づかない呼び出しは制限しない。
+        """
+        if not project_id or not self.limited:
+            return OK
+        ratio, reason, retry_after = self._usage_ratio(project_id)
+        if ratio < 1:
+            return OK
+        if self.action == "reject" or ratio >= HARD_LIMIT_RATIO:
+            self.rejections += 1
+            raise BudgetExceeded(project_id, reason, retry_after)
+        self.downgrades += 1
+        return DOWNGRADE
+
+    async def precheck(self, project_id: Optional[str]):
+        """
+        リクエストの受付時の確認。拒否すべき場合だけ BudgetExceeded を送出する（集計の回数には数えない）。
+        累計コストの初回の読み込みはスレッドで行い、イベントループを止めない。
+        """
+        if not project_id or not self.limited:
+            return
+        await self.preload(project_id)
+        ratio, reason, retry_after = self._usage_ratio(project_id)
+        if ratio >= (1 if self.action == "reject" else HARD_LIMIT_RATIO):
+            self.rejections += 1
+            raise BudgetExceeded(project_id, reason, retry_after)
+
+    def _usage_ratio(self, project_id: str) -> Tuple[float, str, Optional[int]]:
+        """
+        上限に対する使用量の割合（累計コストと直近1分間のトークン数の大きい方）と、その理由・再試行までの秒数。
+        """
+        ratio, reason, retry_after = 0.0, "", None
+        if self.budget_usd > 0:
+            spent = self.spent(project_id)
+            ratio, reason = spent / self.budget_usd, f"累計コスト ${spent:.4f} / ${self.budget_usd:.4f}"
+        if self.tokens_per_minute > 0:
+            used, oldest = self._window(project_id)
+            if used / self.tokens_per_minute > ratio:
+                ratio = used / self.tokens_per_minute
+                reason = f"直近1分間のトークン数 {used} / {self.tokens_per_minute}"
+                retry_after = max(1, math.ceil(WINDOW_SEC - (time.monotonic() - oldest))) if oldest is not None else None
+        return ratio, reason, retry_after
+
+    def _window(self, project_id: str) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            recent = self._recent.get(project_id)
+            if not recent:
+                return 0, None
+            cutoff = time.monotonic() - WINDOW_SEC
+            while recent and recent[0][0] < cutoff:
+                recent.popleft()
+            return sum(tokens for _, tokens in recent), (recent[0][0] if recent else None)
+
+    async def preload(self, project_id: Optional[str]):
+        """
+        累計コストの上限を使う設定で、まだ読み込んでいないプロジェクトの累計コストを DB から読み込んでおく。
+        非同期の呼び出し経路から check() の前に呼び、check() が同期の DB 読み込みでイベントループを止めないようにする。
+        """
+        if not project_id or self.budget_usd <= 0 or project_id in self._spent:
+            return
+        total = (await asyncio.to_thread(self._load_totals, [project_id])).get(project_id, 0.0)
+        self._cache_spent(project_id, total)
+
+    def spent(self, project_id: str) -> float:
+        """
+        プロジェクトの累計コスト（USD）。初回は DB から読み込む（非同期の経路では preload() で読み込み済み）。
+        """
+        spent = self._spent.get(project_id)
+        if spent is not None:
+            return spent
+        return self._cache_spent(project_id, self._load_totals([project_id]).get(project_id, 0.0))
+
+    def _cache_spent(self, project_id: str, total: float) -> float:
+        with self._lock:
+            pending = sum(bucket[3] for key, bucket in self._pending.items() if key[0] == project_id)
+            return self._spent.setdefault(project_id, total + pending)
+
+    def status(self, project_id: str) -> Dict:
+        """
+        プロジェクトの上限と現在の使用量（使用量 API 用）。
+        """
+        used, _ = self._window(project_id)
+        ratio, reason, retry_after = self._usage_ratio(project_id) if self.limited else (0.0, "", None)
+        return {
+            "action": self.action,
+            "budget_usd": self.budget_usd or None,
+            "spent_usd": round(self.spent(project_id), 6),
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "tokens_last_minute": used,
+            "usage_ratio": round(ratio, 3),
+            "state": "rejected" if ratio >= (1 if self.action == "reject" else HARD_LIMIT_RATIO) else DOWNGRADE if ratio >= 1 else OK,
+            "reason": reason or None,
+            "retry_after_sec": retry_after,
+        }
+
+    def discard(self, project_id: str):
+        """
+        削除したプロジェクトの未書き出しの集計と上限の状態を捨てる。
+        """
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == project_id]:
+                del self._pending[key]
+            self._spent.pop(project_id, None)
+            self._recent.pop(project_id, None)
+
+    def flush(self):
+        """
+        メモリ上の集計を llm_usage テーブルに加算し、累計コストを DB の値に合わせ直す。
+        """
+        from sqlalchemy.exc import SQLAlchemyError
+        from database import SessionLocal
+        from models.usage import LLMUsage
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            db = SessionLocal()
+            try:
+                for (project_id, endpoint, service, model, day), (calls, input_tokens, output_tokens, cost) in pending.items():
+                    row = (
+                        db.query(LLMUsage)
+                        .filter_by(project_id=project_id, endpoint=endpoint, service=service, model=model, day=day)
+                        .first()
+                    )
+                    if row is None:
+                        row = LLMUsage(
+                            project_id=project_id, endpoint=endpoint, service=service, model=model, day=day,
+                            calls=0, input_tokens=0, output_tokens=0, cost_usd=0.0,
+                        )
+                        db.add(row)
+                    row.calls += calls
+                    row.input_tokens += input_tokens
+                    row.output_tokens += output_tokens
+                    row.cost_usd += cost
+                db.commit()
+            except SQLAlchemyError as e:
+                db.rollback()
+                logger.error("LLM 使用量の書き出しに失敗しました。次回に持ち越します: %s", e)
+                self._restore(pending)
+                return
+            finally:
+                db.close()
+        if self.budget_usd > 0 and self._spent:
+            self._refresh_spent()
+
+    def _restore(self, pending: Dict):
+        with self._lock:
+            for key, values in pending.items():
+                bucket = self._pending.setdefault(key, [0, 0, 0, 0.0])
+                for i, value in enumerate(values):
+                    bucket[i] += value
+
+    def _refresh_spent(self):
+        totals = self._load_totals(list(self._spent))
+        with self._lock:
+            for project_id in self._spent:
+                pending = sum(bucket[3] for key, bucket in self._pending.items() if key[0] == project_id)
+                self._spent[project_id] = totals.get(project_id, 0.0) + pending
+
+    def _load_totals(self, project_ids) -> Dict[str, float]:
+        from sqlalchemy import func
+        from database import SessionLocal
+        from models.usage import LLMUsage
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(LLMUsage.project_id, func.sum(LLMUsage.cost_usd))
+                .filter(LLMUsage.project_id.in_(project_ids))
+                .group_by(LLMUsage.project_id)
+                .all()
+            )
+            return {project_id: total or 0.0 for project_id, total in rows}
+        finally:
+            db.close()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="usage-ledger-flush", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SEC)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("LLM 使用量の書き出し中にエラーが発生しました: %s", e, exc_info=True)
+
+    def stats(self) -> Dict:
+        return {
+            "action": self.action,
+            "budget_usd": self.budget_usd or None,
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "recorded_calls": self.recorded_calls,
+            "pending_buckets": len(self._pending),
+            "downgrades": self.downgrades,
+            "rejections": self.rejections,
+        }
+
+
+# プロセス全体で共有する使用量の台帳
+usage_ledger = UsageLedger()
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# back/ をインポートパスに追加する（services や routers をトップレベルのパッケージとして読み込むため）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# LLM はネットワークを使わないテスト用のモデルにする
+os.environ.setdefault("LLM_DEFAULT_PROVIDER", "fake")
+# DB を使うテストは一時ディレクトリの SQLite を使う
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+
+
+@pytest.fixture
+def db_tables():
+    """
+    全テーブルを作り直し、テスト後に削除する。
+    """
+    from database import Base, engine
+    import create_tables  # noqa: F401  全モデルを Base.metadata に登録する
+
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
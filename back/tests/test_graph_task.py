@@ -0,0 +1,66 @@
+import json
+
+from services.graphTask_service import GraphTaskService
+
+TASKS = [
+    {"task_id": 0, "task_name": "API設計", "content": "API の仕様を決める"},
+    {"task_id": 1, "task_name": "ログインAPIの実装", "content": "ログイン API を作る"},
+    {"task_id": 2, "task_name": "タスクAPIの実装", "content": "タスクの CRUD API を作る"},
+]
+
+
+class FakeChain:
+    """
+    渡された入力を記録し、決まったエッジを返すチェーン。
+    """
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.inputs = []
+
+    def invoke(self, variables):
+        self.inputs.append(json.loads(variables["tasks_input"]))
+        return {"edges": self.edges}
+
+
+def _service(chain):
+    service = GraphTaskService()
+    service._graph_chain = lambda: chain
+    return service
+
+
+def test_added_task_gets_parent():
+    tasks = TASKS + [{"task_id": 3, "task_name": "タスク検索APIの実装", "content": "タスクを検索する API を作る"}]
+    chain = FakeChain([{"parent": 0, "child": 3}, {"parent": 2, "child": 3}, {"parent": 0, "child": 1}])
+    edges = [{"parent": 0, "child": 1}, {"parent": 0, "child": 2}]
+
+    result = _service(chain).update_task_graph(tasks, edges, changed_task_ids=[3])
+
+    # 追加したタスク以外は task_id と task_name だけを依存先の候補として渡す
+    assert chain.inputs == [[
+        {"task_id": 0, "task_name": "API設計"},
+        {"task_id": 1, "task_name": "ログインAPIの実装"},
+        {"task_id": 2, "task_name": "タスクAPIの実装"},
+        tasks[3],
+    ]]
+    # 0 → 3 は 0 → 2 → 3 があるため冗長なエッジとして取り除かれる
+    assert result == [{"parent": 0, "child": 1}, {"parent": 0, "child": 2}, {"parent": 2, "child": 3}]
+
+
+def test_changed_task_can_relink_to_new_parent():
+    chain = FakeChain([{"parent": 1, "child": 2}])
+    edges = [{"parent": 0, "child": 1}, {"parent": 0, "child": 2}]
+
+    result = _service(chain).update_task_graph(TASKS, edges, changed_task_ids=[2])
+
+    assert result == [{"parent": 0, "child": 1}, {"parent": 1, "child": 2}]
+
+
+def test_removed_task_is_bridged_without_llm():
+    chain = FakeChain([])
+    edges = [{"parent": 0, "child": 1}, {"parent": 1, "child": 2}]
+
+    result = _service(chain).update_task_graph([TASKS[0], TASKS[2]], edges, removed_task_ids=[1])
+
+    assert chain.inputs == []
+    assert result == [{"parent": 0, "child": 2}]
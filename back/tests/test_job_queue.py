@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from services.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobQueueFull
+from services.request_context import current_project_id
+
+
+async def _finish(queue: JobQueue, job_id: str):
+    """
+    ジョブが終了するまでに観測した状態の列と、最後の状態を返す。
+    """
+    seen = [job async for job in queue.watch(job_id)]
+    return [(job["status"], job["progress"]) for job in seen], seen[-1]
+
+
+def _run(main):
+    from database import async_engine
+
+    async def wrapper():
+        try:
+            return await main()
+        finally:
+            # 接続はテストごとのイベントループに紐づくため、閉じておく
+            await async_engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+def test_job_moves_from_queued_to_succeeded_with_progress(db_tables):
+    running = []
+
+    async def handler(job, payload):
+        await job.progress(completed=1, total=2)
+        running.append(await queue.get(job.job_id))
+        await job.progress(completed=2, total=2)
+        return {"echo": payload["value"], "project_id": current_project_id()}
+
+    async def main():
+        job_id = await queue.submit("echo", {"value": 42}, project_id="p1")
+        first = await queue.get(job_id)
+        return first, await _finish(queue, job_id), queue.stats()
+
+    queue = JobQueue(workers=1)
+    queue.register("echo", handler)
+    first, (states, job), stats = _run(main)
+
+    assert first["status"] == QUEUED
+    assert (running[0]["status"], running[0]["progress"]) == (RUNNING, {"completed": 1, "total": 2})
+    assert states[-1] == (SUCCEEDED, {"completed": 2, "total": 2})
+    # 処理関数はジョブのプロジェクトのスコープで実行される
+    assert job["result"] == {"echo": 42, "project_id": "p1"}
+    assert job["finished_at"] >= job["started_at"]
+    assert (stats["succeeded"], stats["failed"], stats["running"]) == (1, 0, 0)
+
+
+def test_failing_job_records_error(db_tables):
+    async def handler(job, payload):
+        raise RuntimeError("生成に失敗しました")
+
+    async def main():
+        queue = JobQueue(workers=1)
+        queue.register("broken", handler)
+        job_id = await queue.submit("broken", {})
+        return await _finish(queue, job_id), queue.stats()
+
+    (states, job), stats = _run(main)
+
+    assert states[-1][0] == FAILED
+    assert job["error"] == "生成に失敗しました"
+    assert job["result"] is None
+    assert stats["failed"] == 1
+
+
+def test_submit_rejects_unknown_kind_and_full_queue(db_tables):
+    async def handler(job, payload):
+        await asyncio.sleep(1)
+        return {}
+
+    async def main():
+        queue = JobQueue(workers=1, max_pending=1)
+        queue.register("slow", handler)
+        with pytest.raises(ValueError):
+            await queue.submit("unknown", {})
+        await queue.submit("slow", {})
+        # 1件目がワーカーに取り出されるのを待ってから、実行待ちを上限まで埋める
+        await asyncio.sleep(0.05)
+        await queue.submit("slow", {})
+        with pytest.raises(JobQueueFull):
+            await queue.submit("slow", {})
+
+    _run(main)
+
+
+def test_stale_job_from_another_process_is_marked_failed(db_tables, monkeypatch):
+    from database import SessionLocal
+    from models.job import Job
+    from services import job_queue as job_queue_module
+
+    monkeypatch.setattr(job_queue_module, "JOB_STALE_SEC", 60)
+    with SessionLocal() as db:
+        db.add(Job(job_id="orphan", kind="echo", status=RUNNING, payload={}, updated_at=time.time() - 120))
+        db.commit()
+
+    job = _run(lambda: JobQueue(workers=1).get("orphan"))
+
+    assert job["status"] == FAILED
+    assert job["error"]
@@ -0,0 +1,74 @@
+from services import llm_cache as llm_cache_module
+from services.llm_cache import LLMResponseCache, SQLCacheTier
+
+
+class Clock:
+    """
+    time.time() の代わりに使う、進め方を指定できる時計。
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache_module.time, "time", clock)
+    cache = LLMResponseCache(max_entries=10)
+
+    cache.set("short", "a", ttl_sec=10)
+    cache.set("forever", "b")
+    clock.now += 9
+    assert cache.get("short") == "a"
+
+    clock.now += 2
+    assert cache.get("short") is None
+    assert cache.get("forever") == "b"
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LLMResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # a を参照すると b が最も古くなる
+    assert cache.get("a") == "1"
+
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sql_tier_hit_is_promoted_with_its_expiry(db_tables, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache_module.time, "time", clock)
+    LLMResponseCache(second_tier=SQLCacheTier()).set("key", "value", ttl_sec=10)
+
+    # 別プロセス相当の空のメモリ層からは DB の値が返り、DB と同じ有効期限でメモリ層に載る
+    cache = LLMResponseCache(second_tier=SQLCacheTier())
+    assert cache.get("key") == "value"
+    clock.now += 11
+    assert cache.get("key") is None
+
+
+def test_sql_tier_purges_expired_and_excess_rows(db_tables, monkeypatch):
+    from database import SessionLocal
+    from models.llm_cache import LLMCacheEntry
+
+    clock = Clock()
+    monkeypatch.setattr(llm_cache_module.time, "time", clock)
+    tier = SQLCacheTier(max_rows=2, purge_sec=0)
+    tier.set("expired", "v", expires_at=clock.now - 1)
+    for key in ("old", "middle", "new"):
+        clock.now += 1
+        tier.set(key, "v", expires_at=None)
+
+    with SessionLocal() as db:
+        assert sorted(row.key for row in db.query(LLMCacheEntry)) == ["middle", "new"]
+    assert tier.purged == 2
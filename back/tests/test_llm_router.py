@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from services import llm_router as llm_router_module
+from services.llm_router import LLMRouter
+from services.llm_scheduler import DeadlineExceeded
+
+PRIMARY = ("fake", "primary")
+SECONDARY = ("fake", "secondary")
+CANDIDATES = [(PRIMARY, "primary"), (SECONDARY, "secondary")]
+
+
+def test_falls_back_to_next_candidate_on_error():
+    called = []
+
+    async def call(llm):
+        called.append(llm)
+        if llm == "primary":
+            raise RuntimeError("503 Service Unavailable")
+        return f"{llm} answer"
+
+    router = LLMRouter(routes={})
+    result = asyncio.run(router.arun(CANDIDATES, call))
+
+    assert result == "secondary answer"
+    assert called == ["primary", "secondary"]
+    assert router.stats_for(PRIMARY).errors == 1
+    assert router.stats_for(SECONDARY).errors == 0
+
+
+def test_raises_last_error_when_all_candidates_fail():
+    async def call(llm):
+        raise RuntimeError(f"{llm} failed")
+
+    with pytest.raises(RuntimeError, match="secondary failed"):
+        asyncio.run(LLMRouter(routes={}).arun(CANDIDATES, call))
+
+
+def test_deadline_is_not_retried_on_other_candidates():
+    called = []
+
+    async def call(llm):
+        called.append(llm)
+        raise DeadlineExceeded("締め切り")
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(LLMRouter(routes={}).arun(CANDIDATES, call))
+    assert called == ["primary"]
+
+
+def test_cooling_down_candidate_is_tried_last():
+    router = LLMRouter(routes={})
+    for _ in range(llm_router_module.FAILURE_THRESHOLD):
+        router.record(PRIMARY, 0.1, ok=False)
+
+    assert [key for key, _ in router.order(CANDIDATES)] == [SECONDARY, PRIMARY]
+
+
+def test_hedge_returns_faster_candidate_and_cancels_slow_one(monkeypatch):
+    monkeypatch.setattr(llm_router_module, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_router_module, "HEDGE_AFTER_SEC", "0.05")
+    cancelled = []
+
+    async def call(llm):
+        if llm == "primary":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(llm)
+                raise
+        return f"{llm} answer"
+
+    async def main():
+        result = await router.arun(CANDIDATES, call)
+        # キャンセルされたタスクの後処理を待つ
+        await asyncio.sleep(0)
+        return result
+
+    router = LLMRouter(routes={})
+    result = asyncio.run(main())
+
+    assert result == "secondary answer"
+    assert cancelled == ["primary"]
+    assert router.stats_for(SECONDARY).hedges == 1
+    # ヘッジで負けた呼び出しは失敗として数えない
+    assert router.stats_for(PRIMARY).errors == 0
+
+
+def test_no_hedge_when_disabled(monkeypatch):
+    monkeypatch.setattr(llm_router_module, "HEDGE_ENABLED", False)
+    called = []
+
+    async def call(llm):
+        called.append(llm)
+        await asyncio.sleep(0.1)
+        return llm
+
+    assert asyncio.run(LLMRouter(routes={}).arun(CANDIDATES, call)) == "primary"
+    assert called == ["primary"]
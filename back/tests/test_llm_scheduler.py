@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from services import llm_scheduler as llm_scheduler_module
+from services.llm_scheduler import AIMDLimiter, DeadlineExceeded, LLMScheduler, TokenBucket, deadline
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_token_bucket_allows_burst_then_waits_for_refill():
+    async def main():
+        bucket = TokenBucket(rate_per_sec=20, capacity=2)
+        started = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        burst = time.monotonic() - started
+        await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(main())
+
+    assert burst < 0.03
+    # 3つ目は 1 / 20 秒の補充を待つ
+    assert total >= 0.045
+
+
+def test_token_bucket_gives_up_when_wait_exceeds_deadline():
+    async def main():
+        bucket = TokenBucket(rate_per_sec=1, capacity=1)
+        await bucket.acquire()
+        with deadline(0.1):
+            await bucket.acquire()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+
+
+def test_aimd_halves_on_overload_and_grows_additively():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=5)
+
+    limiter.on_overload()
+    assert limiter.limit == 2
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 1
+
+    limiter.on_success(latency=0.1)
+    assert limiter.limit == 2
+    limiter.on_success(latency=0.1)
+    assert limiter.limit == 2.5
+    # 目標より遅い応答では増やさない
+    limiter.on_success(latency=llm_scheduler_module.LATENCY_TARGET_SEC + 1)
+    assert limiter.limit == 2.5
+    for _ in range(20):
+        limiter.on_success(latency=0.1)
+    assert limiter.limit == 5
+
+
+def test_aimd_blocks_beyond_limit_until_release():
+    async def main():
+        limiter = AIMDLimiter(initial=1, minimum=1, maximum=4)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.02)
+        blocked = not waiter.done()
+        await limiter.release()
+        await asyncio.wait_for(waiter, timeout=1)
+        return blocked, limiter.in_flight
+
+    blocked, in_flight = asyncio.run(main())
+
+    assert blocked
+    assert in_flight == 1
+
+
+def test_scheduler_retries_rate_limited_call_and_reduces_concurrency(monkeypatch):
+    monkeypatch.setattr(llm_scheduler_module, "BACKOFF_BASE_SEC", 0.001)
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RateLimited("429 Too Many Requests")
+        return "ok"
+
+    async def main():
+        scheduler = LLMScheduler()
+        result = await scheduler.run(("fake", "model"), call)
+        return result, scheduler.lane(("fake", "model"))
+
+    result, lane = asyncio.run(main())
+
+    assert result == "ok"
+    assert len(calls) == 2
+    assert lane.throttled == 1
+    assert lane.limiter.limit < llm_scheduler_module.INITIAL_CONCURRENCY
+
+
+def test_scheduler_does_not_retry_permanent_errors():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise ValueError("invalid request")
+
+    async def main():
+        await LLMScheduler().run(("fake", "model"), call)
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    assert len(calls) == 1
@@ -0,0 +1,68 @@
+from services.retrieval import BM25Index, ProjectIndexCache, build_chunks, chunk_text, tokenize
+
+SPECIFICATION = """# 概要
+ToDo を管理する Web アプリ。
+
+# 認証
+メールアドレスとパスワードでログインする。ログイン後は JWT をクッキーに保存する。
+
+# タスク管理
+タスクの作成・編集・削除ができる。期限の近いタスクは一覧の先頭に表示する。"""
+
+TASKS = [
+    {"task_id": 0, "task_name": "ログインAPIの実装", "content": "FastAPI でログインの API を作る", "detail": ""},
+    {"task_id": 1, "task_name": "タスク一覧画面", "content": "Next.js でタスクの一覧を表示する", "detail": ""},
+]
+
+
+def _index() -> BM25Index:
+    return BM25Index(build_chunks(SPECIFICATION, "front/\nback/", TASKS))
+
+
+def test_tokenize_splits_japanese_into_bigrams():
+    assert tokenize("JWT を クッキーに保存") == ["jwt", "を", "クッ", "ッキ", "キー", "ーに", "に保", "保存"]
+
+
+def test_search_ranks_matching_chunks_first():
+    hits = _index().search("ログインの実装", k=2)
+
+    assert [hit["source"] for hit in hits] == ["task:0", "specification"]
+    assert "ログイン" in hits[1]["text"]
+    assert hits[0]["score"] >= hits[1]["score"] > 0
+
+
+def test_search_respects_k_and_returns_empty_without_matches():
+    index = _index()
+
+    assert len(index.search("タスク", k=1)) == 1
+    assert index.search("kubernetes") == []
+    assert BM25Index([]).search("ログイン") == []
+
+
+def test_rare_terms_outweigh_common_ones():
+    chunks = [
+        {"source": "a", "title": "", "text": "api api api"},
+        {"source": "b", "title": "", "text": "api jwt"},
+        {"source": "c", "title": "", "text": "api"},
+    ]
+
+    assert BM25Index(chunks).search("api jwt", k=1)[0]["source"] == "b"
+
+
+def test_chunk_text_keeps_chunks_within_limit():
+    chunks = chunk_text("あ" * 250 + "\n\n" + "い" * 50, max_chars=100, overlap=20)
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert chunks[-1] == "い" * 50
+    # 長い段落は重ねて分割する
+    assert chunks[0][-20:] == chunks[1][:20]
+
+
+def test_index_cache_is_invalidated_by_rebuild():
+    cache, index = ProjectIndexCache(max_entries=1), _index()
+    cache.put("p1", 1.0, index)
+
+    assert cache.get("p1", 1.0) is index
+    assert cache.get("p1", 2.0) is None
+    cache.put("p2", 1.0, index)
+    assert cache.get("p1", 1.0) is None
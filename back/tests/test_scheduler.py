@@ -0,0 +1,46 @@
+from services.scheduler import schedule_tasks, parse_duration_days
+
+TASKS = [{"task_id": i, "task_name": f"task{i}", "priority": "Must", "content": ""} for i in range(5)]
+
+
+def _by_id(result):
+    return {item["task_id"]: item for item in result}
+
+
+def _assert_precedence(result, edges):
+    days = _by_id(result)
+    for edge in edges:
+        parent, child = days[edge["parent"]], days[edge["child"]]
+        assert child["start"] > parent["end"], (parent, child)
+
+
+def test_chain_is_not_overlapped_after_stretch_rounding():
+    edges = [{"parent": 0, "child": 1}]
+    result = schedule_tasks(TASKS[:2], edges, efforts={0: 1, 1: 1}, duration_days=3, stretch=True)
+
+    _assert_precedence(result, edges)
+    assert all(1 <= item["start"] <= item["end"] <= 3 for item in result)
+
+
+def test_precedence_holds_after_compression_rounding():
+    edges = [{"parent": 0, "child": 1}, {"parent": 1, "child": 2}, {"parent": 0, "child": 3}, {"parent": 3, "child": 4}]
+    efforts = {0: 1.3, 1: 0.7, 2: 2.2, 3: 1.1, 4: 0.9}
+    result = schedule_tasks(TASKS, edges, efforts=efforts, duration_days=7, num_people=2)
+
+    _assert_precedence(result, edges)
+    assert max(item["end"] for item in result) <= 7
+
+
+def test_too_short_duration_only_overlaps_on_last_day():
+    edges = [{"parent": 0, "child": 1}, {"parent": 1, "child": 2}, {"parent": 2, "child": 3}]
+    result = _by_id(schedule_tasks(TASKS[:4], edges, efforts={i: 1 for i in range(4)}, duration_days=2))
+
+    for edge in edges:
+        parent, child = result[edge["parent"]], result[edge["child"]]
+        assert child["start"] > parent["end"] or child["start"] == parent["end"] == 2
+
+
+def test_parse_duration_days():
+    assert parse_duration_days("2週間") == 14
+    assert parse_duration_days("48時間") == 2
+    assert parse_duration_days("") is None
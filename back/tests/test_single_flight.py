@@ -0,0 +1,102 @@
+import asyncio
+
+from services.request_context import project_scope
+from services.single_flight import SingleFlight, flight_key
+
+PAYLOAD = {"idea": "ToDo アプリ", "framework": "Next.js"}
+
+
+class Work:
+    """
+    呼ばれた回数を数え、release() されるまで待ってから結果を返す処理。
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return f"result {self.calls}"
+
+
+def test_identical_requests_share_one_call():
+    async def main():
+        flights, work = SingleFlight(enabled=True), Work()
+        first = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        # 空白の違いは同じリクエストとみなす
+        second = asyncio.ensure_future(flights.run("framework", {**PAYLOAD, "idea": " ToDo アプリ \n"}, work))
+        await asyncio.sleep(0.01)
+        work.release.set()
+        return await asyncio.gather(first, second), work.calls, flights.stats()
+
+    results, calls, stats = asyncio.run(main())
+
+    assert results == ["result 1", "result 1"]
+    assert calls == 1
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 1, 0)
+
+
+def test_requests_from_different_projects_are_not_coalesced():
+    async def main():
+        flights, work = SingleFlight(enabled=True), Work()
+        with project_scope("project-a"):
+            first = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        with project_scope("project-b"):
+            second = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        await asyncio.sleep(0.01)
+        work.release.set()
+        await asyncio.gather(first, second)
+        return work.calls
+
+    assert asyncio.run(main()) == 2
+    assert flight_key("framework", PAYLOAD, "project-a") != flight_key("framework", PAYLOAD, "project-b")
+
+
+def test_call_survives_while_another_waiter_remains():
+    async def main():
+        flights, work = SingleFlight(enabled=True), Work()
+        first = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        second = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        await asyncio.sleep(0.01)
+        # 最初のリクエストが切断されても、待っている2つ目には結果が届く
+        first.cancel()
+        await asyncio.sleep(0.01)
+        work.release.set()
+        return await second, work.cancelled
+
+    result, cancelled = asyncio.run(main())
+
+    assert result == "result 1"
+    assert not cancelled
+
+
+def test_call_is_cancelled_when_no_waiters_are_left():
+    async def main():
+        flights, work = SingleFlight(enabled=True), Work()
+        waiter = asyncio.ensure_future(flights.run("framework", PAYLOAD, work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        return work.cancelled, flights.stats()["in_flight"]
+
+    cancelled, in_flight = asyncio.run(main())
+
+    assert cancelled
+    assert in_flight == 0
+
+
+def test_disabled_single_flight_runs_every_call():
+    async def main():
+        flights, work = SingleFlight(enabled=False), Work()
+        work.release.set()
+        await asyncio.gather(flights.run("framework", PAYLOAD, work), flights.run("framework", PAYLOAD, work))
+        return work.calls
+
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from services.request_context import project_scope
+from services.usage_ledger import DOWNGRADE, OK, BudgetExceeded, UsageLedger
+
+MODEL = "gemini-2.0-flash"  # 入力 $0.10 / 100万トークン
+
+
+def _ledger(monkeypatch, **limits) -> UsageLedger:
+    ledger = UsageLedger(**limits)
+    # 集計の DB への書き出しは行わない
+    monkeypatch.setattr(ledger, "_ensure_flusher", lambda: None)
+    return ledger
+
+
+def _record(ledger: UsageLedger, project_id: str, tokens: int):
+    with project_scope(project_id):
+        ledger.record("test", MODEL, tokens, 0)
+
+
+def test_unlimited_ledger_never_limits(monkeypatch):
+    ledger = _ledger(monkeypatch, budget_usd=0, tokens_per_minute=0, action="reject")
+    _record(ledger, "p1", 1_000_000)
+
+    assert ledger.check("p1") == OK
+
+
+def test_downgrade_over_limit_and_reject_over_hard_limit(monkeypatch):
+    ledger = _ledger(monkeypatch, budget_usd=0, tokens_per_minute=100, action="downgrade")
+    _record(ledger, "p1", 50)
+    assert ledger.check("p1") == OK
+
+    _record(ledger, "p1", 100)
+    assert ledger.check("p1") == DOWNGRADE
+    # 受付時の確認では、切り替えで済む範囲なら断らない
+    asyncio.run(ledger.precheck("p1"))
+
+    _record(ledger, "p1", 100)
+    with pytest.raises(BudgetExceeded) as exc_info:
+        ledger.check("p1")
+    assert exc_info.value.retry_after is not None
+    assert (ledger.downgrades, ledger.rejections) == (1, 1)
+
+
+def test_reject_action_rejects_at_limit(monkeypatch):
+    ledger = _ledger(monkeypatch, budget_usd=0, tokens_per_minute=100, action="reject")
+    _record(ledger, "p1", 100)
+
+    with pytest.raises(BudgetExceeded):
+        ledger.check("p1")
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(ledger.precheck("p1"))
+
+
+def test_limits_are_per_project(monkeypatch):
+    ledger = _ledger(monkeypatch, budget_usd=0, tokens_per_minute=100, action="reject")
+    _record(ledger, "p1", 100)
+
+    assert ledger.check("p2") == OK
+    assert ledger.check(None) == OK
+
+
+def test_cost_budget_uses_preloaded_totals(db_tables, monkeypatch):
+    ledger = _ledger(monkeypatch, budget_usd=0.001, action="downgrade")
+    # 累計コストは precheck で DB から読み込まれ、以降の使用量はメモリ上で加算される
+    asyncio.run(ledger.precheck("p1"))
+    _record(ledger, "p1", 10_000)
+
+    assert ledger.spent("p1") == pytest.approx(0.001)
+    assert ledger.check("p1") == DOWNGRADE
+    _record(ledger, "p1", 10_000)
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(ledger.precheck("p1"))
+
+
+def test_invalid_action_is_rejected():
+    with pytest.raises(ValueError):
+        UsageLedger(action="block")
@@ -1,6 +1,7 @@
 // app/api/taskDetail/route.ts の修正バージョン
 
-import { DivideTask, TaskResponse } from "@/types/taskTypes";
+import { DivideTask } from "@/types/taskTypes";
+import { streamTaskDetails, toTaskInfo } from "@/lib/taskDetailStream";
 
 type TaskDetailGetProps = {
   idea: string;
@@ -16,49 +17,13 @@ type TaskDetailGetProps = {
 
 const fetchTaskDetail = async (tasks: DivideTask[], specification: string) => {
   try {
-    // ここでは、送信前にログ出力を追加して内容を確認
-    console.log("タスク詳細APIにリクエスト送信:", JSON.stringify({
-      "tasks": tasks,
-      "specification": specification,
-    }));
-    
-    const taskDetail = await fetch(
-      process.env.NEXT_PUBLIC_API_URL + "/api/taskDetail/",
-      {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          "tasks": tasks,
-          "specification": specification,
-        }),
-      }
-    ); 
-    
-    // レスポンスのステータスとテキストをログ出力
-    console.log("タスク詳細API レスポンスステータス:", taskDetail.status);
-    console.log("タスク詳細API レスポンステキスト:", taskDetail.statusText);
-    
-    if (!taskDetail.ok) {
-      throw new Error("タスク詳細APIエラー: " + taskDetail.statusText);
-    }
-    // tasksを取得する
-    const taskDetailJSON: TaskResponse = await taskDetail.json();
-    // tasksを取得する
-    const taskDetailData = taskDetailJSON.tasks;
-
-    console.log("タスク詳細APIレスポンス:", taskDetailData);
-
-    // 各タスクに assignment, ID プロパティを追加
-    const tasksWithAssignment = taskDetailData.map((task, index: number) => ({
-      ...task,
-      assignment: task.assignment ?? "",
-      task_id: index,
-    }));
-
-
-    // タスク情報を文字列に変換
-    const taskInfoStrings = tasksWithAssignment.map((taskObj) => JSON.stringify(taskObj));
-    return taskInfoStrings;
+    // ストリーミング API からバッチごとに受け取り、入力順に並べ直す
+    const detailed = await streamTaskDetails(tasks, specification, (_, completed) => {
+      console.log(`タスク詳細: ${completed}/${tasks.length} 件完了`);
+    });
+    console.log("タスク詳細APIレスポンス:", detailed);
+    // タスク情報を文字列に変換（task_id はサーバーが付けた入力順の位置）
+    return toTaskInfo(detailed);
   } catch (err: unknown) {
     console.error("TaskDetail API エラー:", err);
     return null;
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState } from "react";
+import React, { useEffect, useState } from "react";
 import MarkdownViewer from "./MarkdownViewer";
 
 interface ChatBotProps {
@@ -9,6 +9,8 @@ interface ChatBotProps {
   framework: string;
   taskDetail: string;
   isDarkMode: boolean; // 追加
+  projectId?: string; // コンテキストキャッシュのキーとしてバックエンドに渡す
+  sessionKey?: string; // 指定するとチャット履歴をサーバー側に保存する（"task-3" など）
 }
 
 interface ChatMessage {
@@ -22,9 +24,23 @@ export default function ChatBot({
   framework,
   taskDetail,
   isDarkMode,
+  projectId,
+  sessionKey,
 }: ChatBotProps) {
   const [chatHistory, setChatHistory] = useState<ChatMessage[]>([]);
   const [userQuestion, setUserQuestion] = useState("");
+  const useServerSession = Boolean(projectId && sessionKey);
+
+  // サーバー側に保存された履歴を復元する
+  useEffect(() => {
+    if (!projectId || !sessionKey) return;
+    fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/taskChat/sessions/${projectId}/${sessionKey}`)
+      .then((res) => (res.ok ? res.json() : { turns: [] }))
+      .then((data: { turns: ChatMessage[] }) => {
+        setChatHistory(data.turns.map(({ role, content }) => ({ role, content })));
+      })
+      .catch((error) => console.error("チャット履歴の取得に失敗しました:", error));
+  }, [projectId, sessionKey]);
 
   const handleSend = async () => {
     if (!userQuestion) return;
@@ -38,31 +54,63 @@ export default function ChatBot({
     const requestBody = {
       specification,
       directory_structure: directoryStructure,
-      chat_history: newHistory.map((msg) => `${msg.role}:${msg.content}`).join("\n"),
+      // サーバー側の履歴を使う場合は、履歴全体を毎回送らない
+      chat_history: useServerSession
+        ? ""
+        : newHistory.map((msg) => `${msg.role}:${msg.content}`).join("\n"),
       user_question: userQuestion,
       framework,
       taskDetail,
+      project_id: projectId,
+      session_key: useServerSession ? sessionKey : undefined,
     };
 
     setUserQuestion("");
 
     try {
-      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/taskChat/`, {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/taskChat/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(requestBody),
       });
-      if (!res.ok) {
+      if (!res.ok || !res.body) {
         const text = await res.text();
         console.error("ChatBot APIエラー:", text);
         return;
       }
-      const data = await res.json();
-      const assistantMsg: ChatMessage = {
-        role: "assistant",
-        content: data.response,
+      // 空のアシスタントメッセージを追加し、届いたトークンを順に追記していく
+      setChatHistory((prev) => [...prev, { role: "assistant", content: "" }]);
+      const appendToLast = (text: string, replace = false) => {
+        setChatHistory((prev) => {
+          const last = prev[prev.length - 1];
+          const content = replace ? text : last.content + text;
+          return [...prev.slice(0, -1), { ...last, content }];
+        });
       };
-      setChatHistory((prev) => [...prev, assistantMsg]);
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // SSE のメッセージは空行区切り
+        const messages = buffer.split("\n\n");
+        buffer = messages.pop() ?? "";
+        for (const message of messages) {
+          const dataLine = message.split("\n").find((line) => line.startsWith("data: "));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice("data: ".length));
+          if (event.type === "token") {
+            appendToLast(event.content);
+          } else if (event.type === "done") {
+            appendToLast(event.content, true);
+          } else if (event.type === "error") {
+            console.error("ChatBot ストリーミングエラー:", event.detail);
+          }
+        }
+      }
     } catch (err) {
       console.error("チャット送信失敗:", err);
     }
@@ -1,8 +1,12 @@
 // app/api/taskDetail/route.ts の修正バージョン
 
-import { DivideTask, TaskResponse } from "@/types/taskTypes";
+import { DivideTask, Task } from "@/types/taskTypes";
+import { streamTaskDetails, toTaskInfo } from "@/lib/taskDetailStream";
 import { detailRequestType } from "./page";
 
+// タスク詳細の途中経過（未完了の位置は null）を受け取るコールバック
+export type TaskDetailProgress = (detailed: (Task | null)[], completed: number) => void;
+
 type TaskDetailGetProps = {
   idea: string;
   duration: string;
@@ -15,51 +19,17 @@ type TaskDetailGetProps = {
   envHanson: string;
 };
 
-const fetchTaskDetail = async (tasks: DivideTask[], specification: string) => {
+const fetchTaskDetail = async (
+  tasks: DivideTask[],
+  specification: string,
+  onProgress?: TaskDetailProgress,
+) => {
   try {
-    // ここでは、送信前にログ出力を追加して内容を確認
-    console.log("タスク詳細APIにリクエスト送信:", JSON.stringify({
-      "tasks": tasks,
-      "specification": specification,
-    }));
-    
-    const taskDetail = await fetch(
-      process.env.NEXT_PUBLIC_API_URL + "/api/taskDetail/",
-      {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          "tasks": tasks,
-          "specification": specification,
-        }),
-      }
-    ); 
-    
-    // レスポンスのステータスとテキストをログ出力
-    console.log("タスク詳細API レスポンスステータス:", taskDetail.status);
-    console.log("タスク詳細API レスポンステキスト:", taskDetail.statusText);
-    
-    if (!taskDetail.ok) {
-      throw new Error("タスク詳細APIエラー: " + taskDetail.statusText);
-    }
-    // tasksを取得する
-    const taskDetailJSON: TaskResponse = await taskDetail.json();
-    // tasksを取得する
-    const taskDetailData = taskDetailJSON.tasks;
-
-    console.log("タスク詳細APIレスポンス:", taskDetailData);
-
-    // 各タスクに assignment, ID プロパティを追加
-    const tasksWithAssignment = taskDetailData.map((task, index: number) => ({
-      ...task,
-      assignment: task.assignment ?? "",
-      task_id: index,
-    }));
-
-
-    // タスク情報を文字列に変換
-    const taskInfoStrings = tasksWithAssignment.map((taskObj) => JSON.stringify(taskObj));
-    return taskInfoStrings;
+    // バッチが完了するたびに、揃ったタスクを onProgress に渡す
+    const detailed = await streamTaskDetails(tasks, specification, onProgress);
+    console.log("タスク詳細APIレスポンス:", detailed);
+    // タスク情報を文字列に変換（task_id は入力順の位置）
+    return toTaskInfo(detailed);
   } catch (err: unknown) {
     console.error("TaskDetail API エラー:", err);
     return null;
@@ -98,9 +68,9 @@ const postToDB = async (reqBody: TaskDetailGetProps): Promise<string | null> =>
 };
 
 
-export async function taskDetailGetAndpost(projectData:detailRequestType,tasksData: DivideTask[]) {
+export async function taskDetailGetAndpost(projectData:detailRequestType,tasksData: DivideTask[], onProgress?: TaskDetailProgress) {
 
-  const taskInfo = await fetchTaskDetail(tasksData, projectData.specification);
+  const taskInfo = await fetchTaskDetail(tasksData, projectData.specification, onProgress);
   if (!taskInfo) {
     throw new Error("タスク情報の取得に失敗しました");
   }
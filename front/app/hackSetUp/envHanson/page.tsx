@@ -3,7 +3,7 @@
 import React, { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 import MarkdownViewer from "../../components/MarkdownViewer";
-import { ArrowRight, Terminal, Code, Settings, Layout, Server, Sun, Moon, AlertTriangle } from "lucide-react";
+import { ArrowRight, Terminal, Code, Settings, Layout, Server, Sun, Moon, AlertTriangle, CheckCircle } from "lucide-react";
 
 import Loading from "@/components/Loading";
 import { taskDetailGetAndpost } from "./detail"
@@ -30,6 +30,8 @@ export default function EnvHandsOnPage() {
   const [activeSection, setActiveSection] = useState<string>("overall");
   const [darkMode, setDarkMode] = useState(true);
   const [processingStart, setProcessingStart] = useState(false);
+  // タスク詳細の生成状況（バッチが届くたびに更新する）
+  const [detailProgress, setDetailProgress] = useState<{ taskName: string; done: boolean }[]>([]);
 
   const toggleDarkMode = () => {
     setDarkMode(!darkMode);
@@ -95,6 +97,8 @@ export default function EnvHandsOnPage() {
   
   
   /**
+   * - セットアップAPIで保存済みのプロジェクトがあれば、その project_id へ遷移する
+   * - 無い場合（セッションストレージに setupProjectId が無い場合）は以下の従来の処理を行う
    * - detailedTasks が取得できるまで待機（最大30秒）
    * - セッションストレージから他の必要データも取得
    * - POST ボディを組み立てて DB へ送信
@@ -102,6 +106,12 @@ export default function EnvHandsOnPage() {
    */
 
   const handleBack = async () => {
+    // タスク分割のページでセットアップAPIが保存済みのプロジェクトがあれば、そのまま遷移する
+    const setupProjectId = sessionStorage.getItem("setupProjectId");
+    if (setupProjectId) {
+      router.push(`/projects/${setupProjectId}`);
+      return;
+    }
     setProcessingStart(true);
   
     try {
@@ -141,7 +151,10 @@ export default function EnvHandsOnPage() {
       // JSON.parse を適用（文字列がエンコードされているため）
       // JSON.parse を適用（文字列がエンコードされているため）
       const taskList: DivideTask[] = JSON.parse(tasks);
-      const projectId = await taskDetailGetAndpost(requestBody, taskList);
+      setDetailProgress(taskList.map((task) => ({ taskName: task.task_name, done: false })));
+      const projectId = await taskDetailGetAndpost(requestBody, taskList, (detailed) => {
+        setDetailProgress(taskList.map((task, index) => ({ taskName: task.task_name, done: detailed[index] !== null })));
+      });
       if (!projectId) {
         throw new Error("プロジェクトIDが返されませんでした");
       }
@@ -305,6 +318,27 @@ export default function EnvHandsOnPage() {
                       </>
                     )}
                   </button>
+                  {processingStart && detailProgress.length > 0 && (
+                    <div className={`mt-4 p-3 rounded-lg text-sm ${
+                      darkMode ? 'bg-gray-800 text-gray-300' : 'bg-white text-gray-700'
+                    }`}>
+                      <p className={`mb-2 font-bold ${darkMode ? 'text-cyan-400' : 'text-purple-700'}`}>
+                        タスク詳細を生成中 ({detailProgress.filter((task) => task.done).length}/{detailProgress.length})
+                      </p>
+                      <ul className="space-y-1">
+                        {detailProgress.map((task, index) => (
+                          <li key={index} className={`flex items-center ${task.done ? '' : 'opacity-50'}`}>
+                            {task.done ? (
+                              <CheckCircle size={14} className={`mr-2 ${darkMode ? 'text-pink-500' : 'text-blue-600'}`} />
+                            ) : (
+                              <span className="inline-block w-3 h-3 mr-2 rounded-full border animate-pulse"></span>
+                            )}
+                            <span className="truncate">{task.taskName}</span>
+                          </li>
+                        ))}
+                      </ul>
+                    </div>
+                  )}
                 </div>
               </div>
               
@@ -3,6 +3,7 @@
 import React, { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 import SummaryEditor from "../../components/SummaryEditor";
+import { runJob } from "@/lib/jobs";
 import { Sun, Moon, FileText, Save, ChevronRight, Info } from "lucide-react";
 
 
@@ -59,13 +60,9 @@ export default function SetUpSummaryPage() {
         setLoading(true);
         try {
             // hackQAで整形したデータをそのままAPIに送る
+            // 生成に時間がかかるため、ジョブとして登録して結果をポーリングで受け取る
             const requestBody = qaData.yume_answer;
-            const res = await fetch(process.env.NEXT_PUBLIC_API_URL + "/api/summary/", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify(requestBody),
-            });
-            const summaryText = await res.json();
+            const summaryText = await runJob<{ summary: string }>("/api/summary/jobs", requestBody);
             setSummary(summaryText.summary);
         } catch (error) {
             console.error("summary API 呼び出しエラー:", error);
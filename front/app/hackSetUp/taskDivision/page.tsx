@@ -6,7 +6,8 @@ import Loading from "@/components/Loading";
 import { Sun, Moon, CheckCircle, List, ArrowRight } from "lucide-react";
 
 
-import { Task, TaskResponse,DirectoryResponse  } from "@/types/taskTypes";
+import { Task, TaskResponse } from "@/types/taskTypes";
+import { streamProjectSetup } from "@/lib/setupStream";
 import TaskCard from "../../components/TaskCard";
 import ErrorLog from "@/components/Error";
 
@@ -24,10 +25,16 @@ export default function TaskDivisionPage() {
     setDarkMode(!darkMode);
   };
 
+  // セットアップ全体（環境構築・タスク詳細の生成と保存）が完了したかどうか
+  const [setupDone, setSetupDone] = useState<boolean>(false);
+  // 生成中の段階の表示（"タスク詳細 3/10" など）
+  const [setupStatus, setSetupStatus] = useState<string>("ディレクトリ構成を生成中");
+
   // fetchDirectoryAndTasks が既に呼ばれたかどうかのフラグ
   const hasFetchedRef = useRef(false);
 
-  // 初回ロード時に、ディレクトリ作成APIとタスク分割APIを呼び出す
+  // 初回ロード時に、セットアップAPIでディレクトリ構成・タスク分割・環境構築・タスク詳細をまとめて生成する
+  // タスク分割が終わった時点で一覧を表示し、残りの段階はサーバー側で並行に進む
   const fetchTaskDivision = async () => {
     if (typeof window === "undefined") return;
 
@@ -39,41 +46,45 @@ export default function TaskDivisionPage() {
       setLoading(false);
       return;
     }
+    const numPeople = parseInt(sessionStorage.getItem("numPeople") ?? "1", 10) || 1;
+    // 前回のセットアップの結果を使わないように消しておく
+    sessionStorage.removeItem("envHanson");
+    sessionStorage.removeItem("setupProjectId");
 
-    // ディレクトリ作成APIを呼び出す
-    const dirRes = await fetch(
-      process.env.NEXT_PUBLIC_API_URL + "/api/directory/",
-      {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ framework, specification }),
-      }
-    );
-    if (!dirRes.ok) {
-      throw new Error("ディレクトリ作成APIエラー: " + dirRes.statusText);
-    }
-    const dirData: DirectoryResponse = await dirRes.json();
-    const directoryText = dirData.directory_structure;
-    // ディレクトリ情報をセッションストレージに保存
-    sessionStorage.setItem("directory", directoryText);
-
-    // タスク分割APIを呼び出す
-    const tasksRes = await fetch(
-      process.env.NEXT_PUBLIC_API_URL + "/api/get_object_and_tasks/",
+    const projectId = await streamProjectSetup(
       {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ specification, directory: directoryText, framework }),
+        idea: sessionStorage.getItem("dream") ?? "",
+        duration: sessionStorage.getItem("duration") ?? "",
+        num_people: numPeople,
+        specification,
+        framework,
+        // 人数分のメンバーの文字列の配列を作成
+        menber_info: Array.from({ length: numPeople }, () => "member" + Math.floor(Math.random() * 1000)),
+      },
+      (event) => {
+        if (event.type === "stage" && event.stage === "directory") {
+          // ディレクトリ情報をセッションストレージに保存
+          sessionStorage.setItem("directory", event.result as string);
+          setSetupStatus("タスクを分割中");
+        } else if (event.type === "stage" && event.stage === "tasks") {
+          const tasksData: TaskResponse = { tasks: event.result as Task[] };
+          // タスク情報をセッションストレージに保存
+          sessionStorage.setItem("taskRes", JSON.stringify(tasksData));
+          // UI には詳細なしのタスクリストを表示する
+          setTasks(tasksData.tasks);
+          setLoading(false);
+          setSetupStatus("環境構築ハンズオンとタスク詳細を生成中");
+        } else if (event.type === "stage" && event.stage === "environment") {
+          // envData は { overall: string, devcontainer: string, frontend: string, backend: string }
+          sessionStorage.setItem("envHanson", JSON.stringify(event.result));
+        } else if (event.type === "progress") {
+          setSetupStatus(`タスク詳細を生成中 (${event.completed}/${event.total})`);
+        }
       }
     );
-    if (!tasksRes.ok) {
-      throw new Error("タスク分割APIエラー: " + tasksRes.statusText);
-    }
-    const tasksData: TaskResponse = await tasksRes.json();
-    // タスク情報をセッションストレージに保存
-    sessionStorage.setItem("taskRes", JSON.stringify(tasksData));
-    // UI には詳細なしのタスクリストを表示する
-    setTasks(tasksData.tasks);
+    // サーバー側で保存済みのプロジェクト。環境構築ハンズオンのページから直接遷移する
+    sessionStorage.setItem("setupProjectId", projectId);
+    setSetupDone(true);
   };
 
   useEffect(() => {
@@ -179,10 +190,21 @@ export default function TaskDivisionPage() {
           )}
           
           {!loading && !error && tasks.length > 0 && (
-            <div className="mt-8 flex justify-end">
+            <div className="mt-8 flex items-center justify-end">
+              {!setupDone && (
+                <div className={`mr-4 flex items-center text-sm ${darkMode ? 'text-cyan-400' : 'text-purple-700'}`}>
+                  <div className={`animate-spin rounded-full h-4 w-4 border-2 border-t-transparent mr-2 ${
+                    darkMode ? 'border-cyan-400' : 'border-purple-700'
+                  }`}></div>
+                  <span>{setupStatus}</span>
+                </div>
+              )}
               <button
                 onClick={handleProceedToEnv}
-                className={`px-8 py-3 flex items-center justify-center rounded-full shadow-lg focus:outline-none transform transition hover:-translate-y-1 ${
+                disabled={!setupDone}
+                className={`px-8 py-3 flex items-center justify-center rounded-full shadow-lg focus:outline-none transform transition ${
+                  setupDone ? 'hover:-translate-y-1' : 'opacity-50 cursor-not-allowed'
+                } ${
                   darkMode 
                     ? 'bg-cyan-500 hover:bg-cyan-600 text-gray-900 focus:ring-2 focus:ring-cyan-400' 
                     : 'bg-gradient-to-r from-purple-500 to-blue-600 hover:from-purple-600 hover:to-blue-700 text-white focus:ring-2 focus:ring-purple-400'
@@ -0,0 +1,53 @@
+// 時間のかかる生成をバックグラウンドのジョブ (/api/.../jobs) として実行し、結果をポーリングで受け取るための関数
+// HTTP 接続を生成の間ずっと保持しないため、プロキシのタイムアウト（Vercel の 60 秒など）に掛からない
+
+export type JobStatus = "queued" | "running" | "succeeded" | "failed";
+
+export type Job<T> = {
+  job_id: string;
+  status: JobStatus;
+  progress: Record<string, unknown> | null;
+  result: T | null;
+  error: string | null;
+};
+
+// ポーリングの間隔（ミリ秒）
+const POLL_INTERVAL_MS = 1500;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * ジョブを登録し、終了するまで GET /api/jobs/{job_id} をポーリングして結果を返す。
+ * 実行中の状態が変わるたびに onProgress を呼ぶ。ジョブが失敗した場合は例外を送出する。
+ */
+export const runJob = async <T>(
+  path: string,
+  body: unknown,
+  onProgress?: (job: Job<T>) => void,
+): Promise<T> => {
+  const res = await fetch(process.env.NEXT_PUBLIC_API_URL + path, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok) {
+    throw new Error("ジョブの登録に失敗しました: " + res.statusText);
+  }
+  const { job_id: jobId } = await res.json();
+
+  while (true) {
+    await sleep(POLL_INTERVAL_MS);
+    const statusRes = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/jobs/${jobId}`);
+    if (!statusRes.ok) {
+      throw new Error("ジョブの状態の取得に失敗しました: " + statusRes.statusText);
+    }
+    const job: Job<T> = await statusRes.json();
+    if (job.status === "succeeded" && job.result !== null) {
+      return job.result;
+    }
+    if (job.status === "failed") {
+      throw new Error("ジョブが失敗しました: " + (job.error ?? "不明なエラー"));
+    }
+    onProgress?.(job);
+  }
+};
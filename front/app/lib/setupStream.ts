@@ -0,0 +1,67 @@
+// プロジェクトのセットアップ（ディレクトリ構成・タスク分割・環境構築・タスク詳細）を
+// 1回のリクエスト (/api/setup/stream) で実行し、段階が完了するたびにイベントを受け取るための関数
+
+export type SetupRequest = {
+  idea: string;
+  duration: string;
+  num_people: number;
+  specification: string;
+  framework: string;
+  menber_info: string[];
+};
+
+// サーバーから届くイベント（Server-Sent Events の data）
+export type SetupEvent =
+  | { type: "start"; project_id: string }
+  | { type: "stage"; stage: "directory" | "tasks" | "environment" | "task_details"; result: unknown; elapsed_sec: number }
+  | { type: "progress"; stage: "task_details"; completed: number; total: number }
+  | { type: "done"; project_id: string; elapsed_sec: number }
+  | { type: "error"; detail: string };
+
+/**
+ * セットアップを実行し、イベントが届くたびに onEvent を呼ぶ。
+ * サーバーは全段階が成功した場合だけプロジェクトを保存し、最後に done イベントで project_id を返す。
+ * いずれかの段階が失敗した場合は例外を送出する（プロジェクトは保存されない）。
+ */
+export const streamProjectSetup = async (
+  request: SetupRequest,
+  onEvent: (event: SetupEvent) => void,
+): Promise<string> => {
+  const res = await fetch(process.env.NEXT_PUBLIC_API_URL + "/api/setup/stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(request),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error("セットアップAPIエラー: " + res.statusText);
+  }
+
+  let projectId: string | null = null;
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    // SSE のメッセージは空行区切り
+    const messages = buffer.split("\n\n");
+    buffer = messages.pop() ?? "";
+    for (const message of messages) {
+      const dataLine = message.split("\n").find((line) => line.startsWith("data: "));
+      if (!dataLine) continue;
+      const event: SetupEvent = JSON.parse(dataLine.slice("data: ".length));
+      if (event.type === "error") {
+        throw new Error("セットアップAPIエラー: " + event.detail);
+      }
+      if (event.type === "done") {
+        projectId = event.project_id;
+      }
+      onEvent(event);
+    }
+  }
+  if (!projectId) {
+    throw new Error("セットアップが完了する前に接続が切れました");
+  }
+  return projectId;
+};
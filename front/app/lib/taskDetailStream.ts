@@ -0,0 +1,79 @@
+// タスク詳細をストリーミング API (/api/taskDetail/stream) から受け取るための関数
+import { DivideTask, Task } from "@/types/taskTypes";
+
+// ストリームの1行（NDJSON）
+type TaskDetailEvent =
+  | { type: "batch"; tasks: Task[]; cached?: boolean }
+  | { type: "done"; count: number }
+  | { type: "error"; detail: string };
+
+/**
+ * タスク詳細をバッチごとに受け取り、届くたびに onBatch を呼ぶ。
+ * - サーバーは完了したバッチから順に返すので、各タスクの task_index で入力順の位置に入れる
+ * - onBatch には、その時点までに揃ったタスク（未完了の位置は null）を渡す
+ * - 全バッチが揃ったら、入力順に並んだタスクのリストを返す
+ */
+export const streamTaskDetails = async (
+  tasks: DivideTask[],
+  specification: string,
+  onBatch?: (detailed: (Task | null)[], completed: number) => void,
+  projectId?: string,
+): Promise<Task[]> => {
+  const res = await fetch(process.env.NEXT_PUBLIC_API_URL + "/api/taskDetail/stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ tasks, specification, project_id: projectId }),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error("タスク詳細APIエラー: " + res.statusText);
+  }
+
+  const detailed: (Task | null)[] = tasks.map(() => null);
+  let completed = 0;
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const event: TaskDetailEvent = JSON.parse(line);
+    if (event.type === "error") {
+      throw new Error("タスク詳細APIエラー: " + event.detail);
+    }
+    if (event.type !== "batch") return;
+    for (const task of event.tasks) {
+      const index = task.task_index ?? detailed.indexOf(null);
+      if (index < 0 || index >= detailed.length) continue;
+      detailed[index] = task;
+      completed += 1;
+    }
+    onBatch?.([...detailed], completed);
+  };
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    // NDJSON は1行に1イベント
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+
+  // 締め切りなどで返ってこなかったタスクは、詳細なしの元のタスクで埋める
+  return detailed.map((task, index) => task ?? ({ ...tasks[index], detail: "", task_index: index } as Task));
+};
+
+/**
+ * タスク詳細を、プロジェクト保存用の task_info（JSON 文字列のリスト）に変換する。
+ * task_id はサーバーが付けた入力順の位置（task_index）を使う。
+ */
+export const toTaskInfo = (tasks: Task[]): string[] =>
+  tasks.map((task, index) => {
+    const { task_index, ...rest } = task;
+    return JSON.stringify({
+      ...rest,
+      assignment: task.assignment ?? "",
+      task_id: task_index ?? index,
+    });
+  });
@@ -228,6 +228,8 @@ export default function DirectoryPage() {
               framework={framework}
               taskDetail={dummyTaskDetail}
               isDarkMode={darkMode}
+              projectId={projectId}
+              sessionKey="directory"
             />
           </div>
         </div>
@@ -292,6 +292,8 @@ export default function EnvHansonPage() {
                     framework={framework}
                     taskDetail={(envData?.overall || "") + (envData?.devcontainer || "") + (envData?.frontend || "") + (envData?.backend || "")}
                     isDarkMode={darkMode}
+                    projectId={projectId}
+                    sessionKey="envHanson"
                   />
                 </div>
               </div>
@@ -349,6 +351,8 @@ export default function EnvHansonPage() {
                     framework={framework}
                     taskDetail={(envData?.overall || "") + (envData?.devcontainer || "") + (envData?.frontend || "") + (envData?.backend || "")}
                     isDarkMode={darkMode}
+                    projectId={projectId}
+                    sessionKey="envHanson"
                   />
                 </div>
               </div>
@@ -45,7 +45,7 @@ const GanttChartClient: React.FC = () => {
           // セッションストレージから取得した場合は、JSON.parseして状態に保存
           setDurations(JSON.parse(durationsData));
         } else{// タスク期間取得API呼び出し
-        const durationsData = await fetchTaskGraph(proj.duration, proj.task_info);
+        const durationsData = await fetchTaskGraph(proj.duration, proj.task_info, proj.num_people, projectId);
         sessionStorage.setItem("durations", JSON.stringify(durationsData));
         // タスク期間データを状態に保存
         setDurations(durationsData);}
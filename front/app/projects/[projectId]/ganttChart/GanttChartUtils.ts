@@ -87,13 +87,19 @@ export const fetchProject = async (projectId: string): Promise<ProjectData> => {
 
 /**
  * タスク期間取得API呼び出し
+ * projectId を渡すと、プロジェクトに保存済みのタスク間の依存関係を考慮したスケジュールになる
  */
-export const fetchTaskGraph = async (duration: string, taskInfo: string[]): Promise<DurationData[]> => {
+export const fetchTaskGraph = async (
+  duration: string,
+  taskInfo: string[],
+  numPeople = 1,
+  projectId?: string,
+): Promise<DurationData[]> => {
   try {
     const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/durationTask`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ duration: duration, task_info: taskInfo }),
+      body: JSON.stringify({ duration: duration, task_info: taskInfo, num_people: numPeople, project_id: projectId }),
     });
     if (!res.ok) {
       throw new Error(`タスク期間取得失敗: ${res.statusText}`);
@@ -259,50 +259,34 @@ export default function ProjectBoardPage() {
     fetchProject();
   }, [projectId]);
 
-  /** カードのドロップ時に assignment を更新してPUT */
+  /** カードのドロップ時に assignment を更新してPATCH（該当タスクの1行だけを更新） */
   const handleDropTask = useCallback(
     async (dragIndex: number, newAssignment: string) => {
       if (!project) return;
+      const target = tasks.find((t) => t.__index === dragIndex);
+      if (!target) return;
       const updatedTasks = tasks.map((t) =>
         t.__index === dragIndex ? { ...t, assignment: newAssignment } : t
       );
       setTasks(updatedTasks);
 
-      // 更新用の task_info (再JSON化)
-      const updatedTaskInfo = updatedTasks.map((t) =>
-        JSON.stringify({
-          task_id: t.task_id,       // ★ 追加
-          task_name: t.task_name,
-          priority: t.priority,
-          content: t.content,
-          detail: t.detail,
-          assignment: t.assignment,
-        })
-      );
-
-      const reqBody = {
-        ...project,
-        task_info: updatedTaskInfo,
-        menber_info: members, 
-      };
-
       try {
         const res = await fetch(
-          `${process.env.NEXT_PUBLIC_API_URL}/projects/${project.project_id}`,
+          `${process.env.NEXT_PUBLIC_API_URL}/projects/${project.project_id}/tasks/${target.task_id}`,
           {
-            method: "PUT",
+            method: "PATCH",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify(reqBody),
+            body: JSON.stringify({ assignment: newAssignment }),
           }
         );
         if (!res.ok) {
-          console.error("プロジェクト更新失敗:", res.statusText);
+          console.error("タスク更新失敗:", res.statusText);
         }
       } catch (updErr) {
-        console.error("プロジェクト更新エラー:", updErr);
+        console.error("タスク更新エラー:", updErr);
       }
     },
-    [tasks, project, members]
+    [tasks, project]
   );
 
   /** 参加者名の変更イベント */
@@ -338,6 +338,8 @@ export default function TaskDetailPage() {
                   framework={framework}
                   taskDetail={task.detail || ""}
                   isDarkMode={darkMode}
+                  projectId={projectId}
+                  sessionKey={`task-${taskId}`}
                 />
               </div>
             </div>
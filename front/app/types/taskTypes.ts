@@ -26,6 +26,8 @@ export interface Task {
     content: string;
     assignment: string; // "", "done" or participant name
     detail?: string;
+    // taskDetail API が返す、入力タスク列での位置
+    task_index?: number;
     // DnD で扱う際に一意キーとして使うための補助
     __index?: number;
   }